@@ -1,8 +1,19 @@
 from langchain_core.messages import SystemMessage
 
+from agents.context_manager import history_window, summary_message
+from agents.long_term_memory import recalled_memories_message, recent_messages
+from agents.prompt_prefix import record_prompt_usage, stable_prefix
+from agents.retriever_agent import retrieved_context_message
+from config.graph_config import graph_config
 from config.llm_config import llm
+from config.memory_config import memory_config
 from models.ai_models import AgentState
 
+CHAT_SYSTEM_PROMPT = """You are a helpful conversational assistant.
+        Answer the user's last question based on the conversation history.
+        If you don't know the answer, say you don't know. Do not make up information.
+        Use the history to remember details about the user, such as name or other information they provide."""
+
 
 async def chatbot_node(state: AgentState):
     """
@@ -10,19 +21,33 @@ async def chatbot_node(state: AgentState):
     """
     print("[AGENT] Chat Agent (with memory) activated.")
 
-    # We add a system instruction at the beginning of the conversation
-    # to guide the LLM's behavior in all turns.
-    messages_with_system_prompt = [
-        SystemMessage(
-            content="""You are a helpful conversational assistant.
-        Answer the user's last question based on the conversation history.
-        If you don't know the answer, say you don't know. Do not make up information.
-        Use the history to remember details about the user, such as name or other information they provide."""
-        )
-    ]
-    messages_with_system_prompt.extend(state["messages"])
+    if graph_config.stable_prompt_prefix:
+        # Same append-only prefix as the final generation, so Ollama reuses
+        # the prefill of the previous call.
+        messages_with_system_prompt = stable_prefix(state)
+    else:
+        # We add a system instruction at the beginning of the conversation
+        # to guide the LLM's behavior in all turns.
+        messages_with_system_prompt = [SystemMessage(content=CHAT_SYSTEM_PROMPT)]
+        # Older turns are represented by the running summary; only the recent
+        # window that fits the token budget is sent verbatim.
+        messages_with_system_prompt.extend(summary_message(state))
+        history = history_window(state, graph_config.chat_token_budget)
+        if memory_config.enabled:
+            # Older turns come back through long-term memory recall instead
+            history = recent_messages(history, memory_config.recent_messages)
+        messages_with_system_prompt.extend(history)
+
+    # Recalled memories and retrieved documents go after the history, so they
+    # never break the prefix
+    messages_with_system_prompt.extend(recalled_memories_message(state))
+    messages_with_system_prompt.extend(retrieved_context_message(state))
 
-    response_message = await llm.ainvoke(messages_with_system_prompt)
+    # The tag lets the fast path pick this generation out of the graph stream.
+    response_message = await llm.ainvoke(
+        messages_with_system_prompt, config={"tags": ["chat_agent"]}
+    )
+    record_prompt_usage(messages_with_system_prompt, response_message.response_metadata)
 
     # Returns the response content to the results list
     return {"results": [response_message.content]}
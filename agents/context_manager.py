@@ -0,0 +1,102 @@
+# agents/context_manager.py
+from typing import List
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from agents.transcript_cache import render_message
+from config.graph_config import graph_config
+from config.llm_config import config as llm_config
+from config.llm_config import llm
+from models.ai_models import AgentState
+from utils import metrics
+from utils.tokens import TokenCounter
+
+token_counter = TokenCounter(llm_config.model_name)
+
+context_stats = metrics.Counters("turns", "summaries", "summarized_messages")
+
+metrics.register("context", context_stats.snapshot)
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an assistant.
+Update the current summary with the new messages. Keep every fact about the user (name, preferences, details they shared) and the open topics.
+Answer with the updated summary only, in a few short sentences."""
+
+
+def window_start(messages: List[BaseMessage], budget: int) -> int:
+    """
+    Returns the index of the oldest message of the most recent window that
+    fits in `budget` tokens. The last message is always kept.
+    """
+    used = 0
+    for index in range(len(messages) - 1, -1, -1):
+        used += token_counter.count_message(messages[index])
+        if used > budget and index < len(messages) - 1:
+            return index + 1
+    return 0
+
+
+def history_window(state: AgentState, budget: int) -> List[BaseMessage]:
+    """
+    Returns the messages a node should see: the recent, not yet summarized
+    messages that fit in its token budget.
+    """
+    if not graph_config.context_window:
+        return state["messages"]
+    recent = state["messages"][state.get("summarized_count", 0) :]
+    return recent[window_start(recent, budget) :]
+
+
+def summary_message(state: AgentState) -> List[SystemMessage]:
+    """Returns the running summary as a system message, if there is one"""
+    if not state.get("summary"):
+        return []
+    return [
+        SystemMessage(
+            content=f"Summary of the earlier conversation:\n{state['summary']}"
+        )
+    ]
+
+
+async def context_node(state: AgentState):
+    """
+    Keeps the history each node sees within its token budget.
+
+    When the messages not yet summarized overflow the smallest node budget,
+    the oldest of them are folded into the running summary, leaving a window
+    of `summary_target_ratio` of that budget. Otherwise nothing is done, so
+    the summary is only recomputed when the window overflows.
+    """
+    context_stats.incr("turns")
+    budget = min(graph_config.chat_token_budget, graph_config.synthesizer_token_budget)
+    summarized = state.get("summarized_count", 0)
+    recent = state["messages"][summarized:]
+
+    if token_counter.count_messages(recent) <= budget:
+        return {}
+
+    target = int(budget * graph_config.summary_target_ratio)
+    fold_until = summarized + window_start(recent, target)
+    to_fold = state["messages"][summarized:fold_until]
+    if not to_fold:
+        return {}
+
+    print(f"🧠 [CONTEXT] Folding {len(to_fold)} messages into the running summary.")
+    try:
+        response = await llm.ainvoke(
+            [
+                SystemMessage(content=SUMMARY_PROMPT),
+                HumanMessage(
+                    content=f"Current summary:\n{state.get('summary') or '(empty)'}\n\n"
+                    f"New messages:\n{''.join(map(render_message, to_fold))}"
+                ),
+            ],
+            config={"tags": ["summarizer"]},
+        )
+    except Exception as e:
+        # The nodes still get a budgeted window; the fold is retried next turn.
+        print(f"❌ [CONTEXT] Failed to update the summary: {e}")
+        return {}
+
+    context_stats.incr("summaries")
+    context_stats.incr("summarized_messages", len(to_fold))
+    return {"summary": response.content, "summarized_count": fold_until}
@@ -0,0 +1,66 @@
+# agents/fanout.py
+import asyncio
+from typing import Awaitable, Callable, List
+
+from models.ai_models import AgentState
+from services.deadlines import DeadlineExceeded
+from services.llm_scheduler import Overloaded
+from utils import metrics
+
+NodeFn = Callable[[AgentState], Awaitable[dict]]
+
+fanout_stats = metrics.Counters("branches", "completed", "timeouts", "errors")
+
+metrics.register("fanout", fanout_stats.snapshot)
+
+
+def plan_workers(tasks: List[str], available: List[str], default: str) -> List[str]:
+    """
+    Returns the planned workers that exist, without duplicates and in plan order.
+
+    Args:
+        tasks: Task names produced by the planner
+        available: Names of the workers registered in the graph
+        default: Worker used when the plan names no known worker
+    """
+    workers = [task for task in dict.fromkeys(tasks) if task in available]
+    return workers or [default]
+
+
+def with_timeout(name: str, node: NodeFn, timeout: float) -> NodeFn:
+    """
+    Wraps a worker node so a slow or failing branch does not block the join.
+
+    On timeout or error the branch contributes no results and the synthesizer
+    proceeds with whatever the other branches produced. A missed request
+    deadline or an overloaded backend still fails the turn, which gets its
+    504 or 503 instead of a partial answer.
+
+    Args:
+        name: Worker name, used in logs
+        node: The worker node function
+        timeout: Seconds the branch may run; 0 or less disables the limit
+    """
+
+    async def timed_node(state: AgentState):
+        fanout_stats.incr("branches")
+        try:
+            if timeout > 0:
+                update = await asyncio.wait_for(node(state), timeout)
+            else:
+                update = await node(state)
+        except asyncio.TimeoutError:
+            fanout_stats.incr("timeouts")
+            print(f"⏱️ [FANOUT] '{name}' timed out after {timeout}s, skipping.")
+            return {}
+        except (DeadlineExceeded, Overloaded):
+            raise
+        except Exception as e:
+            fanout_stats.incr("errors")
+            print(f"❌ [FANOUT] '{name}' failed: {e}")
+            return {}
+
+        fanout_stats.incr("completed")
+        return update
+
+    return timed_node
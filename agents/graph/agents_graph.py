@@ -2,41 +2,273 @@
 from langgraph.graph import END, START, StateGraph
 
 from agents.chat_agent import chatbot_node
+from agents.context_manager import context_node
+from agents.fanout import plan_workers, with_timeout
 from agents.joke_agent import joke_node
+from agents.long_term_memory import LongTermMemory, MemoryStore, with_long_term_memory
+from agents.reranker_agent import (
+    RERANKERS,
+    create_llm_scorer,
+    create_local_scorer,
+    create_reranker_node,
+)
+from agents.retriever_agent import (
+    RetrievalPrefetcher,
+    create_retriever_node,
+    with_retrieval,
+)
+from agents.semantic_cache import SemanticCache, with_semantic_cache
+from agents.speculation import create_speculative_planner_node
 from agents.supervisor_agent import planner_node  # Renomeado para planejador
 from agents.synthesizer_agent import synthesizer_node
+from config.graph_config import graph_config
+from config.llm_config import config as llm_config, llm, ollama_pool
+from config.memory_config import memory_config
+from config.rag_config import rag_config
 from models.ai_models import AgentState
+from rag.embedding_cache import create_embedder
+from rag.index import VectorIndex, index_exists
+from services.deadlines import with_deadline
+from services.llm_coalescing import with_coalescing
+from services.llm_hedging import with_hedging
+from services.llm_scheduler import Priority, with_priority
+from utils import metrics
+
+WORKERS = {
+    "chat_agent": chatbot_node,
+    "joke_agent": joke_node,
+}
+
+if graph_config.semantic_cache:
+    # Respostas quase idênticas são servidas do cache semântico local. Ele fica
+    # dentro da memória de longo prazo, para ver as memórias recuperadas
+    semantic_cache = SemanticCache(
+        llm_config.get_embeddings(ollama_pool),
+        threshold=graph_config.semantic_cache_threshold,
+        max_entries=graph_config.semantic_cache_size,
+    )
+    metrics.register("semantic_cache", semantic_cache.snapshot)
+    WORKERS = {
+        name: with_semantic_cache(name, node, semantic_cache)
+        for name, node in WORKERS.items()
+    }
+
+# O retriever e a memória de longo prazo compartilham o embedder (e o seu
+# cache), então a mensagem do turno é embutida uma vez só
+embedder = None
+if rag_config.index_path or memory_config.enabled:
+    embedder = create_embedder(rag_config.index_path)
+
+long_term_memory = None
+if memory_config.enabled:
+    # O chat_agent recebe as memórias relevantes em vez do histórico inteiro
+    long_term_memory = LongTermMemory(
+        embedder,
+        MemoryStore(
+            memory_config.path,
+            max_per_user=memory_config.max_per_user,
+            cached_users=memory_config.cached_users,
+        ),
+        top_k=memory_config.top_k,
+        min_score=memory_config.min_score,
+        queue_size=memory_config.queue_size,
+    )
+    metrics.register("long_term_memory", long_term_memory.snapshot)
+    WORKERS["chat_agent"] = with_long_term_memory(
+        WORKERS["chat_agent"], long_term_memory, memory_config.recall_timeout
+    )
+
+# Chamadas idênticas em andamento compartilham uma geração, só nos nós que
+# optaram por isso (com temperatura, a resposta deixa de ser sorteada por chamada)
+COALESCIBLE_NODES = [*WORKERS, "planner", "context"]
+unknown_nodes = set(graph_config.coalesce_nodes) - set(COALESCIBLE_NODES)
+if unknown_nodes:
+    raise ValueError(
+        f"Unknown COALESCE_NODES {', '.join(sorted(unknown_nodes))}. "
+        f"Available nodes: {', '.join(COALESCIBLE_NODES)}"
+    )
+WORKERS = {
+    name: with_coalescing(node) if name in graph_config.coalesce_nodes else node
+    for name, node in WORKERS.items()
+}
+
+# Modelos de embedding usados pelo grafo, pré-carregados no startup da API
+embedding_models = []
+if embedder is not None or graph_config.semantic_cache:
+    embedding_models.append(llm_config.embedding_model)
+
+rag_index = None
+retriever_node = None
+if rag_config.index_path and not index_exists(rag_config.index_path):
+    # Sem índice ainda, a API sobe sem RAG em vez de falhar no import
+    print(
+        f"⚠️ [RAG] No vector index at '{rag_config.index_path}', retrieval is "
+        "disabled. Build it with `python -m rag.ingest`."
+    )
+elif rag_config.index_path:
+    # Os documentos recuperados alimentam o chat_agent
+    rag_index = VectorIndex(
+        rag_config.index_path,
+        mode=rag_config.search_mode,
+        nprobe=rag_config.ann_nprobe,
+        ann_min_vectors=rag_config.ann_min_vectors,
+        max_segments=rag_config.max_segments,
+        compaction_deleted_ratio=rag_config.compaction_deleted_ratio,
+    )
+    retriever_node = create_retriever_node(
+        rag_index,
+        embedder,
+        # Com reranking, o retriever devolve mais candidatos para reordenar
+        top_k=rag_config.rerank_candidates
+        if rag_config.reranker != "off"
+        else rag_config.top_k,
+        min_score=rag_config.min_score,
+        candidates=rag_config.fusion_candidates,
+        rrf_k=rag_config.rrf_k,
+    )
+
+reranker_node = None
+if retriever_node is not None and rag_config.reranker != "off":
+    if rag_config.reranker not in RERANKERS:
+        raise ValueError(
+            f"Unknown reranker '{rag_config.reranker}'. Available rerankers: {', '.join(RERANKERS)}"
+        )
+    reranker_node = create_reranker_node(
+        create_llm_scorer(llm)
+        if rag_config.reranker == "llm"
+        else create_local_scorer(),
+        top_k=rag_config.top_k,
+        token_budget=rag_config.context_token_budget,
+        time_budget=rag_config.rerank_time_budget,
+        min_score=rag_config.rerank_min_score,
+    )
+
+# O retriever (seguido do reranker, se ativo) roda antes do chat_agent
+retrieval = retriever_node
+prefetcher = None
+if retriever_node is not None:
+    if reranker_node is not None:
+        retrieval = with_retrieval(retriever_node, reranker_node)
+    if rag_config.prefetch:
+        # A recuperação começa com o turno, em paralelo com context e planner
+        prefetcher = RetrievalPrefetcher(retrieval)
+        retrieval = prefetcher.retrieve
 
 graph_builder = StateGraph(AgentState)
 
-graph_builder.add_node("planner", planner_node)
-graph_builder.add_node("chat_agent", chatbot_node)
-graph_builder.add_node("joke_agent", joke_node)
-graph_builder.add_node("synthesizer", synthesizer_node)
+# O plano não é transmitido ao cliente, então a sua chamada pode ser duplicada
+# em outro backend quando demora mais que o p95
+planner = with_hedging(planner_node)
+if "planner" in graph_config.coalesce_nodes:
+    planner = with_coalescing(planner)
+if graph_config.speculative_execution:
+    # O worker mais provável roda em paralelo com o planner
+    speculative_workers = dict(WORKERS)
+    if retrieval is not None:
+        speculative_workers["chat_agent"] = with_retrieval(
+            retrieval, WORKERS["chat_agent"]
+        )
+    planner = create_speculative_planner_node(
+        planner,
+        speculative_workers,
+        graph_config.speculative_worker,
+        timeout=graph_config.worker_timeout,
+    )
+if prefetcher is not None:
+    # Planos sem chat_agent cancelam a recuperação
+    planner = prefetcher.planner(planner)
+    if not graph_config.context_window:
+        planner = prefetcher.starting(planner)
+# Chamadas que iniciam um turno novo esperam atrás das de turnos em andamento
+# Todo nó é interrompido quando o prazo da requisição acaba
+graph_builder.add_node(
+    "planner", with_deadline("planner", with_priority(planner, Priority.PLANNER))
+)
+
+# Cada worker tem um timeout próprio para que o join siga com resultados parciais
+for name, node in WORKERS.items():
+    graph_builder.add_node(
+        name,
+        with_deadline(name, with_timeout(name, node, graph_config.worker_timeout)),
+    )
+# O sintetizador é adiado até todos os ramos terminarem: com RAG o chat_agent
+# roda um superstep depois dos outros workers, e sem o join o sintetizador
+# rodaria uma vez por ramo
+graph_builder.add_node(
+    "synthesizer", with_deadline("synthesizer", synthesizer_node), defer=True
+)
+
+if retrieval is not None:
+    graph_builder.add_node(
+        "retriever",
+        with_deadline(
+            "retriever",
+            with_timeout("retriever", retrieval, graph_config.worker_timeout),
+        ),
+    )
+    graph_builder.add_edge("retriever", "chat_agent")
 
-graph_builder.add_edge(START, "planner")
+if graph_config.context_window:
+    # Mantém o histórico dentro do orçamento de tokens antes de planejar
+    context = with_hedging(context_node)
+    if "context" in graph_config.coalesce_nodes:
+        context = with_coalescing(context)
+    graph_builder.add_node(
+        "context",
+        with_deadline(
+            "context",
+            with_priority(
+                prefetcher.starting(context) if prefetcher is not None else context,
+                Priority.PLANNER,
+            ),
+        ),
+    )
+    graph_builder.add_edge(START, "context")
+    graph_builder.add_edge("context", "planner")
+else:
+    graph_builder.add_edge(START, "planner")
 
 
-# Roteador simples que decide qual worker chamar
+# Roteador que dispara todos os workers planejados em paralelo
 def router(state: AgentState):
     # O planner deve colocar a sua decisão em 'tasks'
-    if "joke_agent" in state["tasks"]:
-        return "joke_agent"
-    return "chat_agent"
+    workers = plan_workers(state["tasks"], list(WORKERS), "chat_agent")
+
+    # Workers que já rodaram especulativamente não são executados de novo
+    if graph_config.speculative_execution:
+        speculated = state.get("speculated", [])
+        workers = [worker for worker in workers if worker not in speculated]
+
+    # Com RAG ativo, o chat_agent passa primeiro pelo retriever
+    if retriever_node is not None:
+        workers = ["retriever" if w == "chat_agent" else w for w in workers]
+
+    return workers or [after_workers(state)]
+
+
+# No modo fast path a resposta dos workers já foi enviada, então o sintetizador é pulado
+def after_workers(state: AgentState):
+    if state.get("fast_path"):
+        return END
+    return "synthesizer"
 
 
 graph_builder.add_conditional_edges(
     "planner",
     router,
     {
-        "chat_agent": "chat_agent",
-        "joke_agent": "joke_agent",
+        **{name: name for name in WORKERS},
+        **({"retriever": "retriever"} if retriever_node is not None else {}),
+        "synthesizer": "synthesizer",
+        END: END,
     },
 )
 
-# Os workers agora apontam para o sintetizador
-graph_builder.add_edge("chat_agent", "synthesizer")
-graph_builder.add_edge("joke_agent", "synthesizer")
+# Os workers agora apontam para o sintetizador, que espera por todos eles
+for name in WORKERS:
+    graph_builder.add_conditional_edges(
+        name, after_workers, {"synthesizer": "synthesizer", END: END}
+    )
 
 # O sintetizador aponta para o fim
 graph_builder.add_edge("synthesizer", END)
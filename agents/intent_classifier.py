@@ -0,0 +1,249 @@
+# agents/intent_classifier.py
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from config.graph_config import graph_config
+from models.ai_models import Plan
+from utils import metrics
+
+# Ordered rules: the first matching pattern decides the plan. A rule only
+# keeps its confidence when it matches every clause of the message, so a
+# request that also asks for something else is left to the planner. Only
+# requests for a joke bypass the planner; a message that merely mentions one
+# ("what is a pun?") gets a confidence below the threshold.
+DEFAULT_RULES: List[Tuple[str, List[str], float]] = [
+    (
+        r"^\s*(please\s+)?((can|could|would|will) you\s+)?(please\s+)?"
+        r"((tell|give|share|crack|write|make up)\s+(me|us)?\s*"
+        r"(a|an|another|some|one|\d+)?\s*(\w+\s+)?(jokes?|puns?)\b|make me laugh\b)",
+        ["joke_agent"],
+        0.95,
+    ),
+    (
+        r"\b(jokes?|joking|funny|puns?|humou?r)\b",
+        ["joke_agent"],
+        0.6,
+    ),
+    (
+        r"^\s*(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you|bye)\b[\s!.,?]*$",
+        ["chat_agent"],
+        0.97,
+    ),
+]
+
+MIN_TRAINING_EXAMPLES = 20
+
+# Splits a message into its requests ("tell me a joke and explain RAG")
+CLAUSE_SEPARATORS = re.compile(r"[.?!;]+|\b(?:and|also|then|plus)\b", re.IGNORECASE)
+
+
+def clauses(message: str) -> List[str]:
+    parts = (part.strip(" ,") for part in CLAUSE_SEPARATORS.split(message))
+    return [part for part in parts if part] or [message]
+
+
+class IntentPrediction(NamedTuple):
+    plan: Plan
+    confidence: float
+    source: str
+
+
+class NGramClassifier:
+    """
+    Multinomial naive Bayes over word unigrams and bigrams.
+
+    Each distinct task set seen in the logged plan decisions is one label.
+    """
+
+    def __init__(self):
+        self.label_counts: Counter = Counter()
+        self.feature_counts: Dict[str, Counter] = {}
+        self.feature_totals: Counter = Counter()
+        self.vocabulary = set()
+
+    @staticmethod
+    def features(message: str) -> List[str]:
+        words = re.findall(r"[a-z0-9']+", message.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def fit(self, examples: Iterable[Tuple[str, List[str]]]) -> "NGramClassifier":
+        for message, tasks in examples:
+            label = "+".join(sorted(set(tasks)))
+            self.label_counts[label] += 1
+            counts = self.feature_counts.setdefault(label, Counter())
+            for feature in self.features(message):
+                counts[feature] += 1
+                self.feature_totals[label] += 1
+                self.vocabulary.add(feature)
+        return self
+
+    @property
+    def size(self) -> int:
+        return sum(self.label_counts.values())
+
+    def predict(self, message: str) -> Optional[Tuple[List[str], float]]:
+        """Returns the most likely task list and its posterior probability"""
+        if not self.label_counts:
+            return None
+
+        features = self.features(message)
+        total = self.size
+        vocabulary_size = len(self.vocabulary) + 1
+        scores = {}
+        for label, count in self.label_counts.items():
+            counts = self.feature_counts[label]
+            denominator = self.feature_totals[label] + vocabulary_size
+            score = math.log(count / total)
+            for feature in features:
+                score += math.log((counts[feature] + 1) / denominator)
+            scores[label] = score
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        confidence = 1.0 / sum(math.exp(score - top) for score in scores.values())
+        return best.split("+"), confidence
+
+
+class IntentClassifier:
+    """
+    Local routing stage in front of the LLM planner.
+
+    Keyword/regex rules decide obvious requests; an optional n-gram model
+    trained from logged plan decisions covers the rest. When neither is
+    confident enough the caller falls back to the LLM planner.
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[Tuple[str, List[str], float]] = DEFAULT_RULES,
+        threshold: float = 0.9,
+        model: Optional[NGramClassifier] = None,
+        log_path: Optional[str] = None,
+        max_log_bytes: int = 10_000_000,
+    ):
+        self.rules = [
+            (re.compile(pattern, re.IGNORECASE), tasks, confidence)
+            for pattern, tasks, confidence in rules
+        ]
+        self.threshold = threshold
+        self.model = model
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+        self._log_lock = threading.Lock()
+        self.stats = metrics.Counters("lookups", "bypassed", "classify_micros")
+        self.last_confidence = 0.0
+
+    @classmethod
+    def from_log(cls, log_path: Optional[str], **kwargs) -> "IntentClassifier":
+        """
+        Builds the classifier, training the n-gram model from a JSONL log of
+        plan decisions (`{"message": ..., "tasks": [...]}`) and its rotated
+        predecessor, if they exist.
+        """
+        model = None
+        examples = []
+        for path in (f"{log_path}.1", log_path) if log_path else ():
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        examples.append((record["message"], record["tasks"]))
+                    except (ValueError, KeyError):
+                        continue
+        if len(examples) >= MIN_TRAINING_EXAMPLES:
+            model = NGramClassifier().fit(examples)
+            print(f"✅ Intent classifier trained on {len(examples)} plan decisions")
+        return cls(model=model, log_path=log_path, **kwargs)
+
+    def classify(self, message: str) -> Optional[IntentPrediction]:
+        """Returns the best local prediction, confident or not"""
+        best = None
+        parts = clauses(message)
+        for pattern, tasks, confidence in self.rules:
+            if pattern.search(message):
+                # Clauses the rule does not cover are requests of their own
+                covered = sum(1 for part in parts if pattern.search(part))
+                confidence *= covered / len(parts)
+                best = IntentPrediction(Plan(tasks=list(tasks)), confidence, "rule")
+                break
+
+        # A rule below the threshold is only a hint; the model may know better
+        if self.model is not None and (
+            best is None or best.confidence < self.threshold
+        ):
+            prediction = self.model.predict(message)
+            if prediction is not None:
+                tasks, confidence = prediction
+                if best is None or confidence > best.confidence:
+                    best = IntentPrediction(Plan(tasks=tasks), confidence, "ngram")
+        return best
+
+    def route(self, message: str) -> Optional[Plan]:
+        """Returns a plan when the local prediction is confident, else None"""
+        start = time.perf_counter()
+        prediction = self.classify(message)
+        self.stats.incr("lookups")
+        self.stats.incr("classify_micros", int((time.perf_counter() - start) * 1e6))
+
+        self.last_confidence = prediction.confidence if prediction else 0.0
+        if prediction is None or prediction.confidence < self.threshold:
+            return None
+
+        self.stats.incr("bypassed")
+        print(
+            f"[INTENT] {prediction.source} routed to {prediction.plan.tasks} "
+            f"(confidence {prediction.confidence:.2f})"
+        )
+        return prediction.plan
+
+    async def log_decision(self, message: str, tasks: List[str]):
+        """Appends an LLM plan decision to the training log, off the event loop"""
+        if not self.log_path:
+            return
+        line = json.dumps({"message": message, "tasks": tasks}) + "\n"
+        try:
+            await asyncio.to_thread(self._append, line)
+        except OSError as e:
+            print(f"⚠️ [INTENT] Could not log plan decision: {e}")
+
+    def _append(self, line: str):
+        with self._log_lock:
+            # Past `max_log_bytes` the log is rotated, keeping one predecessor
+            if (
+                os.path.exists(self.log_path)
+                and os.path.getsize(self.log_path) >= self.max_log_bytes
+            ):
+                os.replace(self.log_path, f"{self.log_path}.1")
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        lookups = snapshot["lookups"]
+        return {
+            "lookups": lookups,
+            "bypassed": snapshot["bypassed"],
+            "bypass_rate": metrics.ratio(snapshot["bypassed"], lookups),
+            "avg_classify_micros": metrics.ratio(snapshot["classify_micros"], lookups),
+            "last_confidence": self.last_confidence,
+            "ngram_examples": self.model.size if self.model else 0,
+        }
+
+
+# Loaded once at startup
+intent_classifier = IntentClassifier.from_log(
+    graph_config.intent_log_path,
+    threshold=graph_config.intent_threshold,
+    max_log_bytes=graph_config.intent_log_max_bytes,
+)
+
+metrics.register("intent_classifier", intent_classifier.snapshot)
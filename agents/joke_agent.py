@@ -13,6 +13,6 @@ async def joke_node(state: AgentState):
 
     prompt = f"Please tell a short and funny joke. If the user mentioned a topic '{user_message}', try to make a joke about it."
 
-    response_message = await llm.ainvoke(prompt)
+    response_message = await llm.ainvoke(prompt, config={"tags": ["joke_agent"]})
 
     return {"results": [response_message.content]}
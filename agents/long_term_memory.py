@@ -0,0 +1,454 @@
+# agents/long_term_memory.py
+import asyncio
+import contextvars
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from agents.retriever_agent import NodeFn, last_user_message
+from models.ai_models import AgentState
+from rag.vector_store import normalize
+from services.llm_scheduler import Priority, llm_priority
+from utils import metrics
+from utils.lru_cache import LRUCache
+
+# Ordered rules: (key, pattern, fact template). A fact replaces the earlier
+# fact of the same user with the same key, so "my name is" can be corrected.
+FACT_RULES: List[Tuple[str, str, str]] = [
+    ("name", r"\b(?:my name is|call me)\s+([^\W\d_][\w'-]*)", "The user's name is {}."),
+    ("age", r"\bI(?:'m| am)\s+(\d{1,3})\s+years?\s+old\b", "The user is {} years old."),
+    ("location", r"\bI live in\s+([^.!?,;]+)", "The user lives in {}."),
+    ("job", r"\bI work\s+((?:as|at|in)\s+[^.!?,;]+)", "The user works {}."),
+    (
+        "likes",
+        r"\bI (?:really )?(?:like|love|enjoy)\s+([^.!?,;]+)",
+        "The user likes {}.",
+    ),
+]
+
+# Characters of a turn that are embedded and recalled
+TURN_CHARS = 1000
+
+# Turns embedded per batch by the background writer
+WRITE_BATCH = 32
+
+memory_stats = metrics.Counters(
+    "recalls",
+    "recalled",
+    "recall_us",
+    "recall_timeouts",
+    "recall_failures",
+    "turns_written",
+    "facts_written",
+    "dropped",
+    "write_failures",
+)
+
+
+class Memory(NamedTuple):
+    """
+    A unit of long-term memory.
+
+    Attributes:
+        kind: "turn" for a past exchange, "fact" for an extracted fact
+        key: Fact key (e.g. "name"); turns have no key
+        text: What is embedded and shown to the chat agent
+    """
+
+    kind: str
+    key: Optional[str]
+    text: str
+
+
+def extract_facts(message: str) -> List[Memory]:
+    """Returns the facts about the user stated in one of their messages"""
+    facts = []
+    for key, pattern, template in FACT_RULES:
+        for match in re.finditer(pattern, message, re.IGNORECASE):
+            value = " ".join(match.group(1).split()).rstrip(" '")
+            if not value:
+                continue
+            if key == "likes":
+                # One fact per liked thing, not one per user
+                facts.append(
+                    Memory("fact", f"likes:{value.lower()}", template.format(value))
+                )
+            else:
+                facts.append(Memory("fact", key, template.format(value)))
+    return facts
+
+
+def memory_owner(conversation_id: str, user_id: Optional[str] = None) -> str:
+    """
+    Key of the memories of a turn. `user_id` must be an authenticated
+    identity, never a value the client chose; without one the memories stay
+    within the conversation. The prefixes keep a conversation ID from naming
+    a user's memories.
+    """
+    if user_id:
+        return f"user:{user_id}"
+    return f"conversation:{conversation_id}"
+
+
+def turn_memory(user_message: str, answer: str) -> Memory:
+    text = f"User: {user_message.strip()}\nAssistant: {answer.strip()}"
+    return Memory("turn", None, text[:TURN_CHARS])
+
+
+class UserMemories:
+    """
+    The memories of one user, with their unit vectors in one contiguous
+    float32 matrix so a recall is a single matrix-vector product.
+    """
+
+    def __init__(self, rows: List[Tuple[int, Memory, np.ndarray]]):
+        self.ids = [row_id for row_id, _, _ in rows]
+        self.memories = [memory for _, memory, _ in rows]
+        self.vectors = np.stack([vector for _, _, vector in rows]) if rows else None
+
+    def __len__(self) -> int:
+        return len(self.memories)
+
+    def add(self, row_id: int, memory: Memory, vector: np.ndarray):
+        if memory.key is not None:
+            self.remove_key(memory.key)
+        self.ids.append(row_id)
+        self.memories.append(memory)
+        if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+            self.vectors = vector[None, :]
+        else:
+            self.vectors = np.vstack([self.vectors, vector])
+
+    def remove_key(self, key: str):
+        keep = [i for i, memory in enumerate(self.memories) if memory.key != key]
+        if len(keep) < len(self.memories):
+            self.keep(keep)
+
+    def keep(self, positions: List[int]):
+        self.ids = [self.ids[i] for i in positions]
+        self.memories = [self.memories[i] for i in positions]
+        self.vectors = self.vectors[positions] if positions else None
+
+    def search(
+        self, query: np.ndarray, top_k: int, min_score: float
+    ) -> List[Tuple[float, Memory]]:
+        """Returns up to `top_k` (similarity, memory) pairs, best first"""
+        if self.vectors is None or query.shape[0] != self.vectors.shape[1]:
+            return []
+        similarities = self.vectors @ query
+        best = np.argsort(-similarities)[:top_k]
+        return [
+            (float(similarities[i]), self.memories[i])
+            for i in best
+            if similarities[i] >= min_score
+        ]
+
+
+class MemoryStore:
+    """
+    Per-user store of embedded memories: an SQLite table behind an LRU of
+    the recently active users' memories, loaded on their first recall.
+
+    Without a `path` the memories only live in the process. Each user keeps
+    at most `max_per_user` memories; the oldest turns are forgotten first.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_per_user: int = 1000,
+        cached_users: int = 1000,
+    ):
+        self.path = path
+        self.max_per_user = max_per_user
+        self.users = LRUCache(max_size=cached_users, ttl=float("inf"))
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS memories ("
+                "id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, kind TEXT NOT NULL, "
+                "key TEXT, text TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS memories_user ON memories (user_id, id)"
+            )
+            self._db.commit()
+
+    def user(self, user_id: str) -> UserMemories:
+        """Returns the memories of a user, loading them on a cache miss"""
+        memories = self.users.get(user_id)
+        if memories is not None:
+            return memories
+        with self._lock:
+            # Another thread may have loaded the user while this one waited
+            memories = self.users.get(user_id)
+            if memories is not None:
+                return memories
+            rows = []
+            if self._db is not None:
+                rows = [
+                    (
+                        row_id,
+                        Memory(kind, key, text),
+                        np.frombuffer(vector, dtype=np.float32),
+                    )
+                    for row_id, kind, key, text, vector in self._db.execute(
+                        "SELECT id, kind, key, text, vector FROM memories "
+                        "WHERE user_id = ? ORDER BY id",
+                        (user_id,),
+                    )
+                ]
+            memories = UserMemories(rows)
+            self.users.put(user_id, memories)
+        return memories
+
+    def search(
+        self, user_id: str, query: np.ndarray, top_k: int, min_score: float
+    ) -> List[Tuple[float, Memory]]:
+        memories = self.user(user_id)
+        with self._lock:
+            return memories.search(query, top_k, min_score)
+
+    def add_many(self, user_id: str, items: List[Tuple[Memory, np.ndarray]]):
+        """Stores embedded memories of a user, in one transaction"""
+        memories = self.user(user_id)
+        with self._lock:
+            for memory, vector in items:
+                vector = np.asarray(vector, dtype=np.float32)
+                row_id = self._insert(user_id, memory, vector)
+                memories.add(row_id, memory, vector)
+
+            forgotten = []
+            if len(memories) > self.max_per_user:
+                excess = len(memories) - self.max_per_user
+                turns = [
+                    i
+                    for i, memory in enumerate(memories.memories)
+                    if memory.kind == "turn"
+                ]
+                forget = set(turns[:excess])
+                forgotten = [memories.ids[i] for i in forget]
+                memories.keep([i for i in range(len(memories)) if i not in forget])
+
+            if self._db is not None:
+                if forgotten:
+                    self._db.executemany(
+                        "DELETE FROM memories WHERE id = ?", [(i,) for i in forgotten]
+                    )
+                self._db.commit()
+
+    def _insert(self, user_id: str, memory: Memory, vector: np.ndarray) -> int:
+        if self._db is None:
+            self._next_id += 1
+            return self._next_id
+        if memory.key is not None:
+            self._db.execute(
+                "DELETE FROM memories WHERE user_id = ? AND key = ?",
+                (user_id, memory.key),
+            )
+        cursor = self._db.execute(
+            "INSERT INTO memories (user_id, kind, key, text, vector, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                user_id,
+                memory.kind,
+                memory.key,
+                memory.text,
+                vector.tobytes(),
+                time.time(),
+            ),
+        )
+        return cursor.lastrowid
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+
+class LongTermMemory:
+    """
+    Long-term conversational memory: past turns and facts extracted from
+    the user's messages, embedded into a per-user vector index.
+
+    Instead of replaying the whole transcript, the chat agent gets the few
+    memories most similar to the current message (`recall`) plus the recent
+    turns. Writes (`remember`) only enqueue the turn; a background task
+    extracts the facts, embeds everything in batches and stores it, so the
+    request path never waits for them. When the queue is full the turn is
+    dropped rather than delaying the response.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        store: MemoryStore,
+        top_k: int = 4,
+        min_score: float = 0.3,
+        queue_size: int = 256,
+    ):
+        """
+        Args:
+            embeddings: Embedder with async `embed(texts)` and
+                `aembed_query(text)` methods, e.g. the cached RAG embedder
+            store: Where the memories are kept
+            top_k: Maximum number of memories recalled per turn
+            min_score: Minimum cosine similarity of a recalled memory
+            queue_size: Maximum turns waiting to be written
+        """
+        self.embeddings = embeddings
+        self.store = store
+        self.top_k = top_k
+        self.min_score = min_score
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    async def recall(self, user_id: str, query: str) -> List[str]:
+        """Returns the texts of the user's memories most relevant to `query`"""
+        start = time.perf_counter()
+        vector = normalize(
+            np.asarray([await self.embeddings.aembed_query(query)], dtype=np.float32)
+        )[0]
+        # The first recall of a user reads their memories from disk
+        found = await asyncio.to_thread(
+            self.store.search, user_id, vector, self.top_k, self.min_score
+        )
+        memory_stats.incr("recalls")
+        memory_stats.incr("recalled", len(found))
+        memory_stats.incr("recall_us", int((time.perf_counter() - start) * 1e6))
+        return [memory.text for _, memory in found]
+
+    def remember(self, user_id: str, user_message: str, answer: str):
+        """Queues a finished turn to be written in the background"""
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            # The writer outlives the turn that starts it, so it must not
+            # inherit the turn's deadline, backend affinity or priority
+            self._writer = asyncio.create_task(
+                self._write_loop(), context=contextvars.Context()
+            )
+        try:
+            self._queue.put_nowait((user_id, user_message, answer))
+        except asyncio.QueueFull:
+            memory_stats.incr("dropped")
+
+    async def flush(self):
+        """Waits until the queued turns are written"""
+        if self._queue is not None and not self._writer.done():
+            await self._queue.join()
+
+    async def aclose(self):
+        """Writes the queued turns, then stops the writer"""
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        self.store.close()
+
+    async def _write_loop(self):
+        with llm_priority(Priority.BACKGROUND):
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < WRITE_BATCH and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                try:
+                    await self._write(batch)
+                except Exception as e:
+                    memory_stats.incr("write_failures", len(batch))
+                    print(f"❌ [MEMORY] Failed to store {len(batch)} turns: {e}")
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+
+    async def _write(self, batch: List[Tuple[str, str, str]]):
+        entries: List[Tuple[str, Memory]] = []
+        for user_id, user_message, answer in batch:
+            entries.extend((user_id, fact) for fact in extract_facts(user_message))
+            entries.append((user_id, turn_memory(user_message, answer)))
+
+        vectors = normalize(
+            np.asarray(
+                await self.embeddings.embed([memory.text for _, memory in entries]),
+                dtype=np.float32,
+            )
+        )
+        by_user: Dict[str, List[Tuple[Memory, np.ndarray]]] = {}
+        for (user_id, memory), vector in zip(entries, vectors):
+            by_user.setdefault(user_id, []).append((memory, vector))
+        for user_id, items in by_user.items():
+            await asyncio.to_thread(self.store.add_many, user_id, items)
+
+        facts = sum(memory.kind == "fact" for _, memory in entries)
+        memory_stats.incr("facts_written", facts)
+        memory_stats.incr("turns_written", len(entries) - facts)
+
+    def snapshot(self) -> dict:
+        snapshot = memory_stats.snapshot()
+        snapshot["avg_recall_ms"] = metrics.ratio(
+            snapshot["recall_us"] / 1000, snapshot["recalls"]
+        )
+        snapshot["cached_users"] = len(self.store.users)
+        snapshot["queued"] = self._queue.qsize() if self._queue is not None else 0
+        return snapshot
+
+
+def with_long_term_memory(node: NodeFn, memory: LongTermMemory, timeout: float = 0.5):
+    """
+    Wraps the chat agent node so it sees the memories recalled for the turn.
+
+    Recall gets `timeout` seconds; when it is slower (or fails) the node
+    answers from the recent turns only.
+    """
+
+    async def node_with_memory(state: AgentState):
+        user_id = state.get("user_id")
+        query = last_user_message(state)
+        if not user_id or not query:
+            return await node(state)
+
+        memories: List[str] = []
+        try:
+            memories = await asyncio.wait_for(memory.recall(user_id, query), timeout)
+        except asyncio.TimeoutError:
+            memory_stats.incr("recall_timeouts")
+            print(f"⏱️ [MEMORY] Recall over the {timeout}s budget, skipping it.")
+        except Exception as e:
+            memory_stats.incr("recall_failures")
+            print(f"❌ [MEMORY] Recall failed: {e}")
+        if memories:
+            print(f"🧠 [MEMORY] Recalled {len(memories)} memories.")
+        return await node({**state, "memories": memories})
+
+    return node_with_memory
+
+
+def recent_messages(messages: List[BaseMessage], count: int) -> List[BaseMessage]:
+    """Returns the last `count` messages; older ones come back through recall"""
+    return messages[-count:] if count > 0 else messages[-1:]
+
+
+def recalled_memories_message(state: AgentState) -> List[SystemMessage]:
+    """Returns the recalled memories as a system message, if there are any"""
+    if not state.get("memories"):
+        return []
+    memories = "\n".join(f"- {memory}" for memory in state["memories"])
+    return [
+        SystemMessage(
+            content=f"What you remember from earlier conversations with the user:\n{memories}"
+        )
+    ]
@@ -0,0 +1,86 @@
+# agents/prompt_prefix.py
+from typing import List, Mapping, Union
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from agents.context_manager import history_window, summary_message, token_counter
+from config.graph_config import graph_config
+from models.ai_models import AgentState
+from utils import metrics
+
+ASSISTANT_SYSTEM_PROMPT = """You are a conversational AI assistant named Roshi. Your tone is helpful and friendly.
+Answer the user's last message based on the conversation history.
+If you don't know the answer, say you don't know. Do not make up information.
+Use the history to remember details about the user, such as name or other information they provide."""
+
+prompt_cache_stats = metrics.Counters(
+    "calls", "evaluated_tokens", "estimated_prompt_tokens", "estimated_cached_tokens"
+)
+
+
+def stable_prefix(state: AgentState) -> List[BaseMessage]:
+    """
+    Returns the append-only prompt prefix of a conversation: the shared
+    system prompt, the running summary and the history window.
+
+    The chat agent and the final generation send the same prefix, and each
+    turn only appends to it, so Ollama can reuse the KV cache of the previous
+    call and only prefill the new tokens. The prefix changes only when older
+    turns are folded into the summary.
+    """
+    return [
+        SystemMessage(content=ASSISTANT_SYSTEM_PROMPT),
+        *summary_message(state),
+        *history_window(state, graph_config.chat_token_budget),
+    ]
+
+
+def suggestion_instruction(worker_output: str) -> str:
+    """Returns the per-turn instruction appended after the stable prefix"""
+    return f"""Response suggestion from your internal agent:
+{worker_output}
+
+Using it, reply directly to the user's last message with a final, polished answer."""
+
+
+def final_messages(state: AgentState, instruction: str) -> List[BaseMessage]:
+    """Returns the final generation prompt: the stable prefix, then the instruction"""
+    return stable_prefix(state) + [SystemMessage(content=instruction)]
+
+
+def record_prompt_usage(
+    prompt: Union[str, List[BaseMessage]], response_metadata: Mapping
+):
+    """
+    Records how much of a prompt Ollama had to evaluate.
+
+    Ollama's `prompt_eval_count` is a real count of the tokens it prefilled,
+    but it does not report the size of the whole prompt, so that size is the
+    TokenCounter estimate. The cached tokens, the difference between both,
+    are only an estimate too: they are recorded under `estimated_*`.
+    """
+    evaluated = response_metadata.get("prompt_eval_count")
+    if evaluated is None:
+        return
+    if isinstance(prompt, str):
+        prompt_tokens = token_counter.count(prompt)
+    else:
+        prompt_tokens = token_counter.count_messages(prompt)
+    prompt_cache_stats.incr("calls")
+    prompt_cache_stats.incr("evaluated_tokens", evaluated)
+    prompt_cache_stats.incr("estimated_prompt_tokens", prompt_tokens)
+    prompt_cache_stats.incr(
+        "estimated_cached_tokens", max(0, prompt_tokens - evaluated)
+    )
+
+
+def prompt_cache_snapshot() -> dict:
+    snapshot = prompt_cache_stats.snapshot()
+    snapshot["stable_prefix"] = graph_config.stable_prompt_prefix
+    snapshot["estimated_cached_ratio"] = metrics.ratio(
+        snapshot["estimated_cached_tokens"], snapshot["estimated_prompt_tokens"]
+    )
+    return snapshot
+
+
+metrics.register("prompt_cache", prompt_cache_snapshot)
@@ -0,0 +1,179 @@
+# agents/reranker_agent.py
+import asyncio
+import time
+from typing import Awaitable, Callable, List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agents.context_manager import token_counter
+from agents.retriever_agent import format_hit, last_user_message
+from models.ai_models import AgentState, RelevanceScores
+from rag.rerank import TermProximityScorer
+from utils import metrics
+
+# Scores the texts of the candidate chunks against the query, in [0, 1]
+ScoreFn = Callable[[str, List[str]], Awaitable[List[float]]]
+
+RERANKERS = ("off", "local", "llm")
+
+RERANK_SYSTEM_PROMPT = """You rate how useful passages are for answering a question.
+Give every passage a score from 0 (unrelated) to 10 (answers the question), in passage order."""
+
+rerank_stats = metrics.Counters(
+    "requests",
+    "reranked",
+    "timeouts",
+    "failures",
+    "rerank_us",
+    "candidates",
+    "chunks_dropped",
+    "prompt_tokens",
+    "tokens_saved",
+)
+
+
+def rerank_snapshot() -> dict:
+    snapshot = rerank_stats.snapshot()
+    snapshot["avg_rerank_ms"] = metrics.ratio(
+        snapshot["rerank_us"] / 1000, snapshot["requests"]
+    )
+    snapshot["avg_chunks_dropped"] = metrics.ratio(
+        snapshot["chunks_dropped"], snapshot["requests"]
+    )
+    snapshot["avg_tokens_saved"] = metrics.ratio(
+        snapshot["tokens_saved"], snapshot["requests"]
+    )
+    return snapshot
+
+
+metrics.register("rerank", rerank_snapshot)
+
+
+def create_local_scorer(scorer: TermProximityScorer = None) -> ScoreFn:
+    """Scores with the local term proximity model, off the event loop"""
+    scorer = scorer or TermProximityScorer()
+
+    async def score(query: str, texts: List[str]) -> List[float]:
+        return await asyncio.to_thread(scorer.score, query, texts)
+
+    return score
+
+
+def create_llm_scorer(model: BaseChatModel, passage_chars: int = 400) -> ScoreFn:
+    """
+    Scores with one structured LLM call over all candidates.
+
+    Passages are cut to `passage_chars` characters to keep the scoring
+    prompt, and so its prefill, much smaller than the chat prompt.
+    """
+    structured_llm = model.with_structured_output(RelevanceScores)
+
+    async def score(query: str, texts: List[str]) -> List[float]:
+        passages = "\n\n".join(
+            f"[{number}] {text[:passage_chars]}"
+            for number, text in enumerate(texts, start=1)
+        )
+        result = await structured_llm.ainvoke(
+            [
+                SystemMessage(content=RERANK_SYSTEM_PROMPT),
+                HumanMessage(content=f"Question: {query}\n\nPassages:\n{passages}"),
+            ]
+        )
+        scores = result.scores[: len(texts)]
+        scores += [0] * (len(texts) - len(scores))
+        return [min(max(score, 0), 10) / 10 for score in scores]
+
+    return score
+
+
+def fit_token_budget(hits: List[dict], top_k: int, token_budget: int) -> List[dict]:
+    """
+    Takes hits in order while they fit in `token_budget` prompt tokens,
+    skipping the ones that do not, up to `top_k` hits.
+    """
+    selected = []
+    used = 0
+    for hit in hits:
+        tokens = token_counter.count(format_hit(len(selected) + 1, hit))
+        if used + tokens <= token_budget:
+            selected.append(hit)
+            used += tokens
+            if len(selected) == top_k:
+                break
+    return selected
+
+
+def prompt_tokens(hits: List[dict]) -> int:
+    return sum(
+        token_counter.count(format_hit(number, hit))
+        for number, hit in enumerate(hits, start=1)
+    )
+
+
+def create_reranker_node(
+    score: ScoreFn,
+    top_k: int = 4,
+    token_budget: int = 1024,
+    time_budget: float = 0.15,
+    min_score: float = 0.0,
+):
+    """
+    Creates the node that reranks the retrieved chunks before the chat agent.
+
+    The candidates are scored within `time_budget` seconds; when scoring is
+    slower (or fails) they keep their retrieval order. The best chunks are
+    then kept while they fit in `token_budget` tokens, since every chunk
+    in the chat prompt adds to its prefill time.
+
+    Args:
+        score: Relevance scorer, see `create_local_scorer` and `create_llm_scorer`
+        top_k: Maximum number of chunks passed to the chat agent
+        token_budget: Maximum prompt tokens of the passed chunks
+        time_budget: Seconds the scorer may take per request
+        min_score: Minimum relevance score of a passed chunk
+    """
+
+    async def reranker_node(state: AgentState):
+        hits = state.get("retrieved") or []
+        if not hits:
+            return {}
+
+        print(f"🔀 [AGENT] Reranker activated with {len(hits)} candidates.")
+        rerank_stats.incr("requests")
+        rerank_stats.incr("candidates", len(hits))
+        ranked = hits
+        start = time.perf_counter()
+        try:
+            scores = await asyncio.wait_for(
+                score(last_user_message(state), [hit["text"] for hit in hits]),
+                time_budget,
+            )
+            ranked = [
+                {**hit, "rerank_score": round(float(value), 4)}
+                for value, hit in sorted(
+                    zip(scores, hits), key=lambda pair: pair[0], reverse=True
+                )
+                if value >= min_score
+            ]
+            rerank_stats.incr("reranked")
+        except asyncio.TimeoutError:
+            rerank_stats.incr("timeouts")
+            print(
+                f"⏱️ [RERANKER] Over the {time_budget}s budget, keeping retrieval order."
+            )
+        except Exception as e:
+            rerank_stats.incr("failures")
+            print(f"❌ [RERANKER] Scoring failed, keeping retrieval order: {e}")
+        rerank_stats.incr("rerank_us", int((time.perf_counter() - start) * 1e6))
+
+        selected = fit_token_budget(ranked, top_k, token_budget)
+        sent = prompt_tokens(selected)
+        rerank_stats.incr("chunks_dropped", len(hits) - len(selected))
+        rerank_stats.incr("prompt_tokens", sent)
+        # Savings against the chunks the chat agent got without reranking; the
+        # kept chunks may be longer than the dropped ones, which saves nothing
+        rerank_stats.incr("tokens_saved", max(0, prompt_tokens(hits[:top_k]) - sent))
+        return {"retrieved": selected}
+
+    return reranker_node
@@ -0,0 +1,281 @@
+# agents/retriever_agent.py
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from models.ai_models import AgentState
+from rag.index import IndexSnapshot, VectorIndex
+from rag.lexical import reciprocal_rank_fusion
+from utils import metrics
+
+NodeFn = Callable[[AgentState], Awaitable[dict]]
+
+retrieval_stats = metrics.Counters(
+    "queries",
+    "hits",
+    "empty",
+    "failures",
+    "degraded",
+    "dense_searches",
+    "dense_us",
+    "lexical_searches",
+    "lexical_us",
+)
+
+
+def retrieval_snapshot() -> dict:
+    snapshot = retrieval_stats.snapshot()
+    snapshot["avg_dense_ms"] = metrics.ratio(
+        snapshot["dense_us"] / 1000, snapshot["dense_searches"]
+    )
+    snapshot["avg_lexical_ms"] = metrics.ratio(
+        snapshot["lexical_us"] / 1000, snapshot["lexical_searches"]
+    )
+    return snapshot
+
+
+metrics.register("retrieval", retrieval_snapshot)
+
+prefetch_stats = metrics.Counters(
+    "started", "ready", "waited", "wait_us", "cancelled", "missing"
+)
+
+
+def prefetch_snapshot() -> dict:
+    snapshot = prefetch_stats.snapshot()
+    # Retrieval time left on the critical path, over the prefetched turns
+    snapshot["avg_wait_ms"] = metrics.ratio(
+        snapshot["wait_us"] / 1000, snapshot["ready"] + snapshot["waited"]
+    )
+    return snapshot
+
+
+metrics.register("retrieval_prefetch", prefetch_snapshot)
+
+
+def last_user_message(state: AgentState) -> str:
+    """Returns the content of the most recent user message ('' if there is none)"""
+    for message in reversed(state["messages"]):
+        if isinstance(message, HumanMessage):
+            return str(message.content)
+    return ""
+
+
+def create_retriever_node(
+    index: VectorIndex,
+    embeddings: Embeddings,
+    top_k: int = 4,
+    min_score: float = 0.3,
+    candidates: int = 20,
+    rrf_k: int = 60,
+):
+    """
+    Creates the node that retrieves the documents relevant to the last message.
+
+    When the index has a lexical (BM25) index, the dense and lexical searches
+    run concurrently and their rankings are merged with reciprocal rank
+    fusion, so exact identifiers are found even when embeddings miss them.
+
+    Args:
+        index: Document index to search
+        embeddings: Embedding model the index was built with
+        top_k: Maximum number of chunks passed to the chat agent
+        min_score: Minimum cosine similarity of a dense hit
+        candidates: Hits taken from each search before fusion
+        rrf_k: Reciprocal rank fusion constant
+    """
+
+    async def dense_search(snapshot: IndexSnapshot, query: str):
+        vector = await embeddings.aembed_query(query)
+        start = time.perf_counter()
+        # Searching a memory-mapped index may touch the disk, keep it off the loop
+        results = await asyncio.to_thread(
+            snapshot.search_ids,
+            np.asarray([vector], dtype=np.float32),
+            candidates,
+            min_score,
+        )
+        retrieval_stats.incr("dense_searches")
+        retrieval_stats.incr("dense_us", int((time.perf_counter() - start) * 1e6))
+        return results[0]
+
+    async def lexical_search(snapshot: IndexSnapshot, query: str):
+        start = time.perf_counter()
+        results = await asyncio.to_thread(snapshot.lexical_search, query, candidates)
+        retrieval_stats.incr("lexical_searches")
+        retrieval_stats.incr("lexical_us", int((time.perf_counter() - start) * 1e6))
+        return results
+
+    async def retriever_node(state: AgentState):
+        print("📚 [AGENT] Retriever activated.")
+        query = last_user_message(state)
+        if not query:
+            return {"retrieved": []}
+
+        retrieval_stats.incr("queries")
+        # One snapshot for the whole query: segments swapped in by a commit or
+        # a compaction meanwhile cannot mix up the chunk IDs. Loading a new
+        # manifest opens segments, so it stays off the loop too.
+        snapshot = await asyncio.to_thread(index.snapshot)
+        searches = [dense_search(snapshot, query)]
+        if snapshot.has_lexical:
+            # The lexical search runs while the query is being embedded
+            searches.append(lexical_search(snapshot, query))
+        results = await asyncio.gather(*searches, return_exceptions=True)
+
+        rankings = []
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"❌ [RETRIEVER] Search failed: {result}")
+            else:
+                rankings.append(result)
+        if not rankings:
+            # The chat agent answers without documents rather than failing the turn.
+            retrieval_stats.incr("failures")
+            return {"retrieved": []}
+        if len(rankings) < len(searches):
+            retrieval_stats.incr("degraded")
+
+        if len(rankings) == 1:
+            ids, scores = rankings[0][0][:top_k], rankings[0][1][:top_k]
+        else:
+            fused = reciprocal_rank_fusion((ids.tolist() for ids, _ in rankings), rrf_k)
+            ids, scores = list(fused)[:top_k], list(fused.values())[:top_k]
+        hits = await asyncio.to_thread(snapshot.hits, ids, scores)
+
+        retrieval_stats.incr("hits", len(hits))
+        if not hits:
+            retrieval_stats.incr("empty")
+        return {"retrieved": hits}
+
+    return retriever_node
+
+
+def with_retrieval(retriever_node, node):
+    """
+    Runs `retriever_node` before `node` as a single call, for callers that
+    run a worker outside the graph edges (e.g. speculative execution).
+    """
+
+    async def node_with_retrieval(state: AgentState):
+        update = await retriever_node(state)
+        result = await node({**state, **update})
+        return {**update, **result}
+
+    return node_with_retrieval
+
+
+def turn_key(state: AgentState) -> str:
+    """Identifies the current turn by its last user message"""
+    for message in reversed(state["messages"]):
+        if isinstance(message, HumanMessage):
+            return message.id or str(message.content)
+    return ""
+
+
+class RetrievalPrefetcher:
+    """
+    Runs retrieval concurrently with the nodes that precede the chat agent.
+
+    Retrieval only depends on the user's last message, so it can start with
+    the turn (`starting`) instead of after the planner. The graph's
+    retriever node (`retrieve`) then picks up the running task, and only
+    waits for whatever is left of it. When the plan does not include the
+    chat agent the task is cancelled (`planner`).
+
+    Tasks are keyed by the turn's last user message; ones that were never
+    picked up (e.g. a failed turn) are cancelled after `max_age` seconds.
+    """
+
+    def __init__(self, retrieval_node: NodeFn, max_age: float = 120.0):
+        self.retrieval_node = retrieval_node
+        self.max_age = max_age
+        self._tasks: Dict[str, Tuple[asyncio.Task, float]] = {}
+
+    def start(self, state: AgentState):
+        """Starts retrieval for the turn, unless it is already running"""
+        now = time.monotonic()
+        for key, (task, started) in list(self._tasks.items()):
+            if now - started > self.max_age:
+                task.cancel()
+                del self._tasks[key]
+
+        key = turn_key(state)
+        if key and key not in self._tasks:
+            prefetch_stats.incr("started")
+            task = asyncio.create_task(self.retrieval_node(state))
+            self._tasks[key] = (task, now)
+
+    def cancel(self, state: AgentState):
+        """Cancels the turn's retrieval, whose results will not be used"""
+        entry = self._tasks.pop(turn_key(state), None)
+        if entry is not None:
+            prefetch_stats.incr("cancelled")
+            entry[0].cancel()
+
+    async def retrieve(self, state: AgentState) -> dict:
+        """Retriever node: returns the prefetched results, or retrieves now"""
+        entry = self._tasks.pop(turn_key(state), None)
+        if entry is None:
+            prefetch_stats.incr("missing")
+            return await self.retrieval_node(state)
+
+        task = entry[0]
+        if task.done():
+            prefetch_stats.incr("ready")
+            return task.result()
+        start = time.perf_counter()
+        try:
+            return await task
+        finally:
+            prefetch_stats.incr("waited")
+            prefetch_stats.incr("wait_us", int((time.perf_counter() - start) * 1e6))
+
+    def starting(self, node: NodeFn) -> NodeFn:
+        """Wraps the first node of the turn so it starts retrieval"""
+
+        async def node_with_prefetch(state: AgentState):
+            self.start(state)
+            return await node(state)
+
+        return node_with_prefetch
+
+    def planner(self, planner_node: NodeFn, consumer: str = "chat_agent") -> NodeFn:
+        """Wraps the planner so plans without `consumer` cancel retrieval"""
+
+        async def planner_with_prefetch(state: AgentState):
+            try:
+                update = await planner_node(state)
+            except BaseException:
+                self.cancel(state)
+                raise
+            if consumer not in update.get("tasks", []):
+                self.cancel(state)
+            return update
+
+        return planner_with_prefetch
+
+
+def format_hit(number: int, hit: dict) -> str:
+    """Formats a retrieved chunk as it appears in the chat prompt"""
+    return f"[{number}] ({hit.get('source', 'unknown')})\n{hit['text']}"
+
+
+def retrieved_context_message(state: AgentState) -> List[SystemMessage]:
+    """Returns the retrieved chunks as a system message, if there are any"""
+    hits = state.get("retrieved") or []
+    if not hits:
+        return []
+    documents = "\n\n".join(
+        format_hit(number, hit) for number, hit in enumerate(hits, start=1)
+    )
+    return [
+        SystemMessage(
+            content="Relevant documents for the user's last message "
+            "(use them when they help, and cite them by number):\n\n" + documents
+        )
+    ]
@@ -0,0 +1,211 @@
+# agents/semantic_cache.py
+import threading
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from models.ai_models import AgentState
+from utils import metrics
+from utils.text import normalize_message
+
+NodeFn = Callable[[AgentState], Awaitable[dict]]
+
+
+class CachePolicy(NamedTuple):
+    """
+    Per-agent caching rules.
+
+    Attributes:
+        enabled: Whether the agent's outputs are cached at all
+        require_empty_history: Only cache turns without earlier messages, for
+            agents whose answer depends on the conversation history
+        per_user: Keep separate entries per `user_id`, for agents whose
+            answer may depend on who is asking
+        require_no_context: Only cache turns without retrieved documents or
+            recalled memories, which the answer would be built from
+    """
+
+    enabled: bool = True
+    require_empty_history: bool = False
+    per_user: bool = False
+    require_no_context: bool = False
+
+
+DEFAULT_POLICIES = {
+    "joke_agent": CachePolicy(enabled=True),
+    "chat_agent": CachePolicy(
+        enabled=True,
+        require_empty_history=True,
+        per_user=True,
+        require_no_context=True,
+    ),
+}
+
+IndexKey = Tuple[str, Optional[str]]
+
+
+class VectorIndex:
+    """
+    Fixed-capacity in-process index of unit vectors with LRU eviction.
+
+    Vectors live in one contiguous float32 matrix, so a lookup is a single
+    matrix-vector product.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.vectors: Optional[np.ndarray] = None
+        self.values: List[Optional[str]] = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self._clock = 0
+
+    def search(self, query: np.ndarray) -> Optional[tuple]:
+        """Returns (similarity, slot) of the nearest stored vector"""
+        if self.size == 0 or query.shape[0] != self.vectors.shape[1]:
+            return None
+        similarities = self.vectors[: self.size] @ query
+        slot = int(np.argmax(similarities))
+        return float(similarities[slot]), slot
+
+    def touch(self, slot: int) -> str:
+        self._clock += 1
+        self.last_used[slot] = self._clock
+        return self.values[slot]
+
+    def add(self, vector: np.ndarray, value: str) -> bool:
+        """Stores a vector, returns True if an older entry was evicted"""
+        if self.vectors is None:
+            self.vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+
+        evicted = self.size >= self.capacity
+        if evicted:
+            slot = int(np.argmin(self.last_used))
+        else:
+            slot = self.size
+            self.size += 1
+
+        self.vectors[slot] = vector
+        self.values[slot] = value
+        self.touch(slot)
+        return evicted
+
+
+class SemanticCache:
+    """
+    Opt-in cache of worker outputs keyed by the meaning of the user message.
+
+    A stored output is reused when the embedding of the normalized message is
+    at least `threshold` cosine-similar to a cached one for the same agent.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        threshold: float = 0.92,
+        max_entries: int = 1000,
+        policies: Dict[str, CachePolicy] = None,
+    ):
+        """
+        Args:
+            embeddings: Object with an async `aembed_query(text)` method,
+                e.g. `OllamaEmbeddings`
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Maximum number of cached outputs per agent
+            policies: Caching rules per agent name
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.policies = DEFAULT_POLICIES if policies is None else policies
+        self._indexes: Dict[IndexKey, VectorIndex] = {}
+        self._lock = threading.Lock()
+        self.stats = metrics.Counters(
+            "hits", "misses", "skipped", "errors", "evictions"
+        )
+
+    def applies(self, agent: str, state: AgentState) -> bool:
+        """Returns True if the agent's policy allows caching this turn"""
+        policy = self.policies.get(agent)
+        if policy is None or not policy.enabled:
+            return False
+        if policy.require_empty_history and len(state["messages"]) > 1:
+            return False
+        if policy.require_no_context and (
+            state.get("retrieved") or state.get("memories")
+        ):
+            return False
+        return True
+
+    def index_key(self, agent: str, state: AgentState) -> IndexKey:
+        """Index of the agent's entries, per user when its policy says so"""
+        policy = self.policies.get(agent, CachePolicy())
+        return agent, state.get("user_id") if policy.per_user else None
+
+    async def embed(self, message: str) -> np.ndarray:
+        vector = np.asarray(
+            await self.embeddings.aembed_query(normalize_message(message)),
+            dtype=np.float32,
+        )
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, key: IndexKey, vector: np.ndarray) -> Optional[str]:
+        with self._lock:
+            index = self._indexes.get(key)
+            match = index.search(vector) if index is not None else None
+            if match is None or match[0] < self.threshold:
+                self.stats.incr("misses")
+                return None
+            self.stats.incr("hits")
+            return index.touch(match[1])
+
+    def store(self, key: IndexKey, vector: np.ndarray, output: str):
+        with self._lock:
+            index = self._indexes.setdefault(key, VectorIndex(self.max_entries))
+            if index.add(vector, output):
+                self.stats.incr("evictions")
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        snapshot["size"] = sum(index.size for index in self._indexes.values())
+        snapshot["hit_rate"] = metrics.ratio(
+            snapshot["hits"], snapshot["hits"] + snapshot["misses"]
+        )
+        return snapshot
+
+
+def with_semantic_cache(name: str, node: NodeFn, cache: SemanticCache) -> NodeFn:
+    """
+    Wraps a worker node so near-duplicate requests reuse a cached output.
+
+    Args:
+        name: Worker name, used to pick the cache policy
+        node: The worker node function
+        cache: The shared semantic cache
+    """
+
+    async def cached_node(state: AgentState):
+        if not cache.applies(name, state):
+            cache.stats.incr("skipped")
+            return await node(state)
+
+        try:
+            vector = await cache.embed(state["messages"][-1].content)
+        except Exception as e:
+            cache.stats.incr("errors")
+            print(f"⚠️ [SEMANTIC CACHE] Embedding failed, skipping cache: {e}")
+            return await node(state)
+
+        key = cache.index_key(name, state)
+        output = cache.lookup(key, vector)
+        if output is not None:
+            print(f"[SEMANTIC CACHE] Hit for '{name}'.")
+            return {"results": [output]}
+
+        update = await node(state)
+        if update.get("results"):
+            cache.store(key, vector, "\n".join(update["results"]))
+        return update
+
+    return cached_node
@@ -0,0 +1,95 @@
+# agents/speculation.py
+import asyncio
+from contextlib import suppress
+from typing import Awaitable, Callable, Dict
+
+from models.ai_models import AgentState
+from services.llm_scheduler import Priority, llm_priority
+from utils import metrics
+
+NodeFn = Callable[[AgentState], Awaitable[dict]]
+
+speculation_stats = metrics.Counters("hits", "misses", "failures")
+
+
+def speculation_snapshot() -> dict:
+    """Returns the speculation counters together with the hit rate"""
+    snapshot = speculation_stats.snapshot()
+    snapshot["hit_rate"] = metrics.ratio(
+        snapshot["hits"], snapshot["hits"] + snapshot["misses"]
+    )
+    return snapshot
+
+
+metrics.register("speculation", speculation_snapshot)
+
+
+def create_speculative_planner_node(
+    planner_node: NodeFn,
+    workers: Dict[str, NodeFn],
+    guess: str = "chat_agent",
+    timeout: float = 0,
+):
+    """
+    Wraps the planner so the most likely worker runs in parallel with it.
+
+    The guessed worker starts as soon as the turn begins. If the plan confirms
+    the guess, its result is kept and the worker is marked in `speculated` so
+    the router does not run it again. Otherwise it is cancelled and discarded.
+    A guessed worker that fails or times out is left to the router, which
+    runs it again through the regular path.
+
+    The worker's LLM calls are scheduled as worker calls, not with the
+    priority of the planner it runs next to.
+
+    Args:
+        planner_node: The regular planner node
+        workers: Mapping of worker names to their node functions
+        guess: Name of the worker to run speculatively
+        timeout: Seconds the speculative worker may run; 0 or less disables
+            the limit
+    """
+    if guess not in workers:
+        raise ValueError(
+            f"Unknown speculative worker '{guess}'. "
+            f"Available workers: {', '.join(workers)}"
+        )
+    worker = workers[guess]
+
+    async def speculate(state: AgentState):
+        if timeout > 0:
+            return await asyncio.wait_for(worker(state), timeout)
+        return await worker(state)
+
+    async def speculative_planner_node(state: AgentState):
+        # The task copies the context now, with the worker priority
+        with llm_priority(Priority.WORKER):
+            speculative_task = asyncio.create_task(speculate(state))
+
+        try:
+            update = await planner_node(state)
+        except BaseException:
+            speculative_task.cancel()
+            raise
+
+        if guess not in update.get("tasks", []):
+            speculation_stats.incr("misses")
+            print(f"[SPECULATION] Miss: plan did not include '{guess}', cancelling.")
+            speculative_task.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await speculative_task
+            return {**update, "speculated": []}
+
+        speculation_stats.incr("hits")
+        try:
+            result = await speculative_task
+        except Exception as e:
+            # The router will run the worker again through the regular path.
+            speculation_stats.incr("failures")
+            print(f"[SPECULATION] Speculative '{guess}' failed: {e!r}")
+            return {**update, "speculated": []}
+
+        print(f"[SPECULATION] Hit: reusing speculative '{guess}' result.")
+        return {**update, **result, "speculated": [guess]}
+
+    return speculative_planner_node
@@ -1,24 +1,24 @@
 # agents/supervisor_agent.py
-from typing import List
-
 from langchain_core.prompts import ChatPromptTemplate
-from pydantic import BaseModel, Field
 
+from agents.intent_classifier import intent_classifier
+from config.graph_config import graph_config
 from config.llm_config import llm
-from models.ai_models import AgentState
-
-
-class Plan(BaseModel):
-    """Plan of tasks to be executed by the agents."""
+from models.ai_models import AgentState, Plan
+from utils import metrics
+from utils.lru_cache import LRUCache
+from utils.text import normalize_message
 
-    tasks: List[str] = Field(
-        description="A list of tasks that need to be executed. It can be 'chat_agent', 'joke_agent', or both."
-    )
+# Bump whenever the planner prompt changes so cached plans are not reused
+PLANNER_PROMPT_VERSION = "1"
 
 
-def create_planner_node():
+def create_planner_node(cache: LRUCache = None):
     """
     Creates the planner node that uses the LLM to define a task plan.
+
+    Args:
+        cache: Optional cache of plans keyed by prompt version and normalized message
     """
     structured_llm = llm.with_structured_output(Plan)
 
@@ -41,12 +41,40 @@ def create_planner_node():
     async def planner_node(state: AgentState):
         print(f"[SUPERVISOR] Planner agent entered with state: {state}")
         last_message = state["messages"][-1].content
+
+        # Obvious requests are routed locally without an LLM round trip
+        if graph_config.intent_classifier:
+            plan = intent_classifier.route(last_message)
+            if plan is not None:
+                return {"tasks": plan.tasks}
+
+        cache_key = f"{PLANNER_PROMPT_VERSION}:{normalize_message(last_message)}"
+        if cache is not None:
+            tasks = cache.get(cache_key)
+            if tasks is not None:
+                print(f"[SUPERVISOR] Cached plan: {tasks}")
+                return {"tasks": tasks}
+
         plan = await planner.ainvoke({"message": last_message})
         print(f"[SUPERVISOR] Generated plan: {plan.tasks}")
+        await intent_classifier.log_decision(last_message, plan.tasks)
+
+        if cache is not None:
+            # Persisted by the periodic save, not on every miss
+            cache.put(cache_key, plan.tasks)
         return {"tasks": plan.tasks}
 
     return planner_node
 
 
+planner_cache = None
+if graph_config.planner_cache:
+    planner_cache = LRUCache(
+        max_size=graph_config.planner_cache_size,
+        ttl=graph_config.planner_cache_ttl,
+        path=graph_config.planner_cache_path,
+    )
+    metrics.register("planner_cache", planner_cache.snapshot)
+
 # Renamed to reflect the new function
-planner_node = create_planner_node()
+planner_node = create_planner_node(planner_cache)
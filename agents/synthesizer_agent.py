@@ -1,22 +1,41 @@
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 
+from agents.context_manager import history_window
+from agents.prompt_prefix import suggestion_instruction
+from agents.transcript_cache import render_message, transcript_cache
+from config.graph_config import graph_config
 from models.ai_models import AgentState
 
 
-async def synthesizer_node(state: AgentState):
+async def synthesizer_node(state: AgentState, config: RunnableConfig):
     """
     Node that creates a high-quality final prompt for the LLM,
     using the conversation history and the worker's suggestion.
     """
     print("🤝 [AGENT] Synthesizer agent activated with context...")
 
-    # Format the conversation history to include in the prompt
-    history_str = ""
-    for msg in state["messages"]:
-        if isinstance(msg, HumanMessage):
-            history_str += f"User: {msg.content}\n"
-        elif isinstance(msg, AIMessage):
-            history_str += f"Assistant: {msg.content}\n"
+    if graph_config.stable_prompt_prefix:
+        # Only the suggestion goes in 'results'; the LLMService appends it after
+        # the conversation's stable prefix so the previous prefill is reused.
+        worker_output = "\n".join(state.get("results", []))
+        return {"results": [suggestion_instruction(worker_output)]}
+
+    # Format the conversation history to include in the prompt. Only the
+    # recent window is used; older turns are covered by the summary.
+    messages = state["messages"]
+    window = history_window(state, graph_config.synthesizer_token_budget)
+
+    # Rendered segments are cached per thread, so only new messages are formatted
+    thread_id = config.get("configurable", {}).get("thread_id")
+    if thread_id:
+        start = len(messages) - len(window)
+        window_segments = transcript_cache.segments(thread_id, messages, start)
+    else:
+        window_segments = [render_message(msg) for msg in window]
+
+    summary = state.get("summary")
+    summary_line = [f"(Summary of earlier turns: {summary})\n"] if summary else []
+    history_str = "".join(summary_line + window_segments)
 
     # Get the raw response from the worker
     worker_output = "\n".join(state.get("results", []))
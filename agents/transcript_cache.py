@@ -0,0 +1,80 @@
+# agents/transcript_cache.py
+import threading
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from utils import metrics
+
+
+def render_message(msg: BaseMessage) -> str:
+    """Renders one message as a transcript line ('' for other message types)"""
+    if isinstance(msg, HumanMessage):
+        return f"User: {msg.content}\n"
+    if isinstance(msg, AIMessage):
+        return f"Assistant: {msg.content}\n"
+    return ""
+
+
+class TranscriptCache:
+    """
+    Per-thread cache of rendered transcript segments.
+
+    Segments are stored one per message, together with the ID of the last
+    rendered message. Each turn only the messages added since then are
+    formatted; if the history no longer matches (e.g. after a restart) the
+    thread is rendered from scratch.
+    """
+
+    def __init__(self, max_threads: int = 1000):
+        self.max_threads = max_threads
+        self._threads: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = metrics.Counters("renders", "rebuilds", "rendered_messages")
+
+    def segments(
+        self, thread_id: str, messages: List[BaseMessage], start: int = 0
+    ) -> List[str]:
+        """
+        Returns the rendered segments of `messages[start:]`. Only that slice
+        is copied, so a turn that uses a recent window does not pay for the
+        whole history; the cached list is extended in place by later turns.
+        """
+        with self._lock:
+            entry = self._threads.get(thread_id)
+            segments, last_id = entry if entry else ([], None)
+
+            count = len(segments)
+            if count > len(messages) or (count and messages[count - 1].id != last_id):
+                segments, count = [], 0
+                self.stats.incr("rebuilds")
+
+            new_messages = messages[count:]
+            segments.extend(render_message(msg) for msg in new_messages)
+            self.stats.incr("renders")
+            self.stats.incr("rendered_messages", len(new_messages))
+
+            last_id = messages[-1].id if messages else None
+            self._threads[thread_id] = (segments, last_id)
+            self._threads.move_to_end(thread_id)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+            return segments[start:]
+
+    def clear(self):
+        with self._lock:
+            self._threads.clear()
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        snapshot["threads"] = len(self._threads)
+        snapshot["avg_rendered_per_turn"] = metrics.ratio(
+            snapshot["rendered_messages"], snapshot["renders"]
+        )
+        return snapshot
+
+
+transcript_cache = TranscriptCache()
+
+metrics.register("transcript_cache", transcript_cache.snapshot)
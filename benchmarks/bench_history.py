@@ -0,0 +1,83 @@
+"""
+Benchmark of per-turn service overhead as a conversation grows.
+
+Compares the full-history invocation (load, append and resend every
+message) against delta-only invocation. The state cache only sits in front
+of the PostgreSQL checkpointer, so it is not part of this in-memory run.
+The graph is replaced by a single no-op node and the LLM by a fake, so the
+numbers only reflect state loading, serialization and message merging.
+Growth left in delta mode comes from the checkpointer itself, which still
+loads and stores the messages channel on every invocation.
+
+Usage:
+    poetry run python -m benchmarks.bench_history [turns]
+"""
+
+import asyncio
+import sys
+import time
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessageChunk
+from langgraph.graph import END, START, StateGraph
+
+from models.ai_models import AgentState
+from services.llm_service import LLMService
+
+CHECKPOINTS = (10, 50, 100, 200, 300)
+
+
+class FakeStreamingLLM:
+    async def astream(self, prompt):
+        yield AIMessageChunk(content="ok")
+
+
+async def noop_node(state: AgentState):
+    return {"results": ["final prompt"]}
+
+
+def build_service(delta_invocation: bool) -> LLMService:
+    builder = StateGraph(AgentState)
+    builder.add_node("noop", noop_node)
+    builder.add_edge(START, "noop")
+    builder.add_edge("noop", END)
+
+    service = LLMService(delta_invocation=delta_invocation)
+    service.graph = builder.compile(checkpointer=service.memory)
+    return service
+
+
+async def run(service: LLMService, turns: int) -> dict:
+    """Returns the average per-turn latency (ms) around each checkpoint"""
+    timings = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        async for _ in service.stream_message(f"message number {turn}", "bench"):
+            pass
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        checkpoint: sum(timings[checkpoint - 5 : checkpoint]) / 5
+        for checkpoint in CHECKPOINTS
+        if checkpoint <= turns
+    }
+
+
+async def main(turns: int):
+    modes = {
+        "full history": build_service(delta_invocation=False),
+        "delta only": build_service(delta_invocation=True),
+    }
+
+    print(f"⏱️ Per-turn latency (ms) over {turns} turns")
+    header = "".join(f"{f'turn {c}':>12}" for c in CHECKPOINTS if c <= turns)
+    print(f"{'mode':<14}{header}")
+    with patch("services.llm_service.llm", FakeStreamingLLM()):
+        for name, service in modes.items():
+            results = await run(service, turns)
+            row = "".join(f"{ms:>12.2f}" for ms in results.values())
+            print(f"{name:<14}{row}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300))
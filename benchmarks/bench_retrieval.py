@@ -0,0 +1,116 @@
+"""
+Microbenchmark of hybrid retrieval latency on a synthetic corpus.
+
+Builds an index of random clustered vectors and Zipf-distributed texts
+(with some error-code identifiers), then times the IVF dense search, the
+BM25 lexical search and the fused result as the retriever node runs them:
+both searches in parallel threads, followed by reciprocal rank fusion and
+the record lookup. Query embedding time is not included.
+
+Usage:
+    poetry run python -m benchmarks.bench_retrieval --chunks 1000000
+"""
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from rag.index import VectorIndex
+from rag.lexical import reciprocal_rank_fusion
+from rag.vector_store import normalize
+
+VOCABULARY = 50000
+WORDS_PER_CHUNK = 40
+QUERIES = 200
+APPEND_BATCH = 100000
+
+
+def synthetic_texts(rng, count: int):
+    words = rng.zipf(1.3, size=(count, WORDS_PER_CHUNK)) % VOCABULARY
+    for row, chunk in enumerate(words):
+        text = " ".join(f"w{word}" for word in chunk)
+        if row % 1000 == 0:
+            text += f" ERR-{row}"
+        yield text
+
+
+def build_index(path: str, chunks: int, dim: int, centers: np.ndarray) -> VectorIndex:
+    rng = np.random.default_rng(0)
+    index = VectorIndex(path, dim=dim, mode="ann", ann_min_vectors=0)
+    texts = synthetic_texts(rng, chunks)
+    # One segment, published with its IVF and lexical indexes on commit
+    with index.writer() as writer:
+        for start in range(0, chunks, APPEND_BATCH):
+            size = min(APPEND_BATCH, chunks - start)
+            vectors = centers[rng.integers(0, len(centers), size)]
+            vectors = vectors + 0.3 * rng.normal(size=(size, dim)).astype(np.float32)
+            writer.add(vectors, [{"text": next(texts)} for _ in range(size)])
+    return index
+
+
+def percentile_ms(samples, q):
+    return np.percentile(np.array(samples) * 1000, q)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--candidates", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        centers = np.random.default_rng(2).normal(size=(256, args.dim))
+        index = build_index(path, args.chunks, args.dim, centers.astype(np.float32))
+        print(f"🏗️ Built {len(index)} chunks in {time.perf_counter() - start:.0f}s")
+
+        # Reopen so the index is memory-mapped, as in the API process
+        index = VectorIndex(path, mode="ann")
+        snapshot = index.snapshot()
+        rng = np.random.default_rng(1)
+        queries = normalize(
+            centers[rng.integers(0, len(centers), QUERIES)]
+            + 0.3 * rng.normal(size=(QUERIES, args.dim))
+        )
+        texts = [
+            f"w{rng.integers(0, 200)} w{rng.integers(0, 5000)} ERR-{1000 * i}"
+            for i in range(QUERIES)
+        ]
+
+        timings = {"dense": [], "lexical": [], "fused": []}
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            for vector, text in zip(queries, texts):
+                start = time.perf_counter()
+                dense = pool.submit(snapshot.search_ids, vector, args.candidates)
+                lexical = pool.submit(snapshot.lexical_search, text, args.candidates)
+                (dense_ids, _), (lexical_ids, _) = dense.result()[0], lexical.result()
+                fused = reciprocal_rank_fusion(
+                    [dense_ids.tolist(), lexical_ids.tolist()]
+                )
+                ids = list(fused)[: args.top_k]
+                snapshot.hits(ids, list(fused.values())[: args.top_k])
+                timings["fused"].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                snapshot.search_ids(vector, args.candidates)
+                timings["dense"].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                snapshot.lexical_search(text, args.candidates)
+                timings["lexical"].append(time.perf_counter() - start)
+
+    print(f"⏱️ Retrieval latency (ms) over {QUERIES} queries, {args.chunks} chunks")
+    print(f"{'search':>10}{'p50':>10}{'p95':>10}")
+    for name, samples in timings.items():
+        print(
+            f"{name:>10}{percentile_ms(samples, 50):>10.2f}"
+            f"{percentile_ms(samples, 95):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
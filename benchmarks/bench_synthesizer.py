@@ -0,0 +1,65 @@
+"""
+Microbenchmark of synthesizer latency against history length.
+
+"cold" renders the whole window on every call, as the synthesizer did
+before transcripts were cached; "incremental" reuses the per-thread
+transcript cache, so each turn only formats the newly added messages.
+The token budgets are raised so the full history is rendered.
+
+Usage:
+    poetry run python -m benchmarks.bench_synthesizer
+"""
+
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agents.synthesizer_agent import synthesizer_node
+from agents.transcript_cache import transcript_cache
+from config.graph_config import graph_config
+
+HISTORY_LENGTHS = (10, 100, 500, 1000, 2000)
+REPEATS = 20
+
+
+def build_history(length: int):
+    messages = []
+    for i in range(length):
+        cls = HumanMessage if i % 2 == 0 else AIMessage
+        messages.append(cls(content=f"message {i} " + "lorem ipsum " * 10, id=str(i)))
+    return messages
+
+
+async def time_turns(messages, incremental: bool) -> float:
+    """Average latency (ms) of a synthesizer call with one new message per turn"""
+    config = {"configurable": {"thread_id": "bench"}}
+    transcript_cache.clear()
+    await synthesizer_node({"messages": messages[:-REPEATS], "results": []}, config)
+
+    total = 0.0
+    for turn in range(REPEATS, 0, -1):
+        if not incremental:
+            transcript_cache.clear()
+        state = {"messages": messages[: len(messages) - turn + 1], "results": ["ok"]}
+        start = time.perf_counter()
+        await synthesizer_node(state, config)
+        total += time.perf_counter() - start
+    return total / REPEATS * 1000
+
+
+async def main():
+    graph_config.synthesizer_token_budget = 10**9
+    graph_config.chat_token_budget = 10**9
+
+    print("⏱️ Synthesizer latency (ms) per turn")
+    print(f"{'messages':>10}{'cold':>12}{'incremental':>14}")
+    for length in HISTORY_LENGTHS:
+        messages = build_history(length + REPEATS)
+        cold = await time_turns(messages, incremental=False)
+        incremental = await time_turns(messages, incremental=True)
+        print(f"{length:>10}{cold:>12.3f}{incremental:>14.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Reads a boolean flag ('1', 'true', 'yes', 'on') from the environment"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class GraphConfig:
+    """Configuration for the execution strategy of the agent graph"""
+
+    def __init__(self):
+        self.speculative_execution = env_flag("SPECULATIVE_EXECUTION", False)
+        self.speculative_worker = os.getenv("SPECULATIVE_WORKER", "chat_agent")
+        self.worker_timeout = float(os.getenv("WORKER_TIMEOUT_SECONDS", "60"))
+        # Time a chat request has to produce its answer; 0 disables it
+        self.request_deadline = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
+        self.fast_path = env_flag("FAST_PATH", False)
+        self.delta_invocation = env_flag("DELTA_INVOCATION", False)
+        self.context_window = env_flag("CONTEXT_WINDOW", True)
+        self.chat_token_budget = int(os.getenv("CHAT_TOKEN_BUDGET", "2048"))
+        self.synthesizer_token_budget = int(
+            os.getenv("SYNTHESIZER_TOKEN_BUDGET", "2048")
+        )
+        self.summary_target_ratio = float(os.getenv("SUMMARY_TARGET_RATIO", "0.5"))
+        self.stable_prompt_prefix = env_flag("STABLE_PROMPT_PREFIX", False)
+        self.intent_classifier = env_flag("INTENT_CLASSIFIER", True)
+        self.intent_threshold = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.9"))
+        self.intent_log_path = os.getenv("INTENT_LOG_PATH")
+        self.intent_log_max_bytes = int(os.getenv("INTENT_LOG_MAX_BYTES", "10000000"))
+        self.planner_cache = env_flag("PLANNER_CACHE", True)
+        self.planner_cache_size = int(os.getenv("PLANNER_CACHE_SIZE", "1024"))
+        self.planner_cache_ttl = float(os.getenv("PLANNER_CACHE_TTL_SECONDS", "3600"))
+        self.planner_cache_path = os.getenv("PLANNER_CACHE_PATH")
+        self.planner_cache_save_interval = float(
+            os.getenv("PLANNER_CACHE_SAVE_SECONDS", "30")
+        )
+        self.semantic_cache = env_flag("SEMANTIC_CACHE", False)
+        self.semantic_cache_threshold = float(
+            os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")
+        )
+        self.semantic_cache_size = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+        # Nodes whose identical in-flight LLM calls share one generation
+        self.coalesce_nodes = [
+            name.strip()
+            for name in os.getenv("COALESCE_NODES", "").split(",")
+            if name.strip()
+        ]
+
+
+# Global configuration instance
+graph_config = GraphConfig()
@@ -1,7 +1,17 @@
 import os
+from typing import Optional
 from langchain_ollama.chat_models import ChatOllama
+from langchain_ollama.embeddings import OllamaEmbeddings
 from dotenv import load_dotenv
 
+from config.graph_config import env_flag, graph_config
+from services.llm_coalescing import LLMCoalescer
+from services.llm_hedging import LLMHedger
+from services.llm_scheduler import LLMScheduler
+from services.ollama_client import OllamaConnectionPool
+from services.ollama_router import OllamaRouter
+from utils import metrics
+
 # Load environment variables
 load_dotenv()
 
@@ -13,14 +23,117 @@ class LlamaConfig:
         self.model_name = os.getenv("LLAMA_MODEL", "llama3.2")
         self.temperature = float(os.getenv("LLAMA_TEMPERATURE", "0.1"))
         self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        # Several Ollama hosts to balance over; clients are built with the
+        # first one and the router sends each request to the chosen backend
+        base_urls = os.getenv("OLLAMA_BASE_URLS")
+        self.base_urls = (
+            [url.strip() for url in base_urls.split(",") if url.strip()]
+            if base_urls
+            else [self.base_url]
+        )
+        self.base_url = self.base_urls[0]
+        self.embedding_model = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+        # How long Ollama keeps the model (and its prompt cache) loaded after a
+        # call: a duration such as "30m", or seconds ("-1" keeps it forever)
+        keep_alive = os.getenv("OLLAMA_KEEP_ALIVE")
+        if keep_alive and keep_alive.lstrip("-").isdigit():
+            keep_alive = int(keep_alive)
+        self.keep_alive = keep_alive
+        # Keep-alive HTTP connections shared by every client of Ollama
+        self.max_connections = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32"))
+        self.max_keepalive_connections = int(
+            os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "16")
+        )
+        self.keepalive_expiry = float(
+            os.getenv("OLLAMA_KEEPALIVE_EXPIRY_SECONDS", "300")
+        )
+        timeout = os.getenv("OLLAMA_TIMEOUT_SECONDS")
+        self.timeout = float(timeout) if timeout else None
+        # Preload the models at API startup and report cold/warm TTFT
+        self.warmup = env_flag("OLLAMA_WARMUP", True)
+        # Admission control of the generation requests
+        self.scheduler = env_flag("LLM_SCHEDULER", True)
+        self.max_concurrency = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+        self.max_queue = int(os.getenv("LLM_MAX_QUEUE", "64"))
+        self.max_queue_wait = float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", "10"))
+        # Load balancing and health checks of the backends
+        self.health_check_interval = float(
+            os.getenv("OLLAMA_HEALTH_CHECK_SECONDS", "10")
+        )
+        self.max_failures = int(os.getenv("OLLAMA_MAX_FAILURES", "3"))
+        self.ejection_time = float(os.getenv("OLLAMA_EJECTION_SECONDS", "30"))
+        self.affinity_slack = int(os.getenv("OLLAMA_AFFINITY_SLACK", "2"))
+        # Hedging of the calls nobody streams (planner, context summary)
+        self.hedging = env_flag("LLM_HEDGING", True)
+        self.hedge_delay = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "2"))
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+
+    def get_scheduler(self) -> Optional[LLMScheduler]:
+        """Returns the LLM call scheduler, or None when admission control is off"""
+        if not self.scheduler:
+            return None
+        return LLMScheduler(
+            max_concurrency=self.max_concurrency,
+            max_queue=self.max_queue,
+            max_queue_wait=self.max_queue_wait,
+        )
+
+    def get_router(self) -> Optional[OllamaRouter]:
+        """Returns the backend router, or None when there is a single backend"""
+        if len(self.base_urls) < 2:
+            return None
+        return OllamaRouter(
+            self.base_urls,
+            affinity_slack=self.affinity_slack,
+            max_failures=self.max_failures,
+            ejection_time=self.ejection_time,
+        )
+
+    def get_hedger(self) -> Optional[LLMHedger]:
+        """Returns the hedging policy, or None when hedging is off"""
+        if not self.hedging:
+            return None
+        return LLMHedger(delay=self.hedge_delay, percentile=self.hedge_percentile)
 
-    def get_llm(self) -> ChatOllama:
-        """Returns configured Llama model instance"""
+    def get_coalescer(self) -> Optional[LLMCoalescer]:
+        """Returns the call coalescer, or None when no node opts in"""
+        if not graph_config.coalesce_nodes:
+            return None
+        return LLMCoalescer()
+
+    def get_connection_pool(
+        self,
+        scheduler: Optional[LLMScheduler] = None,
+        router: Optional[OllamaRouter] = None,
+        hedger: Optional[LLMHedger] = None,
+        coalescer: Optional[LLMCoalescer] = None,
+    ) -> OllamaConnectionPool:
+        """Returns a connection pool sized from the configuration"""
+        return OllamaConnectionPool(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+            timeout=self.timeout,
+            scheduler=scheduler,
+            router=router,
+            hedger=hedger,
+            coalescer=coalescer,
+        )
+
+    def get_llm(self, pool: OllamaConnectionPool = None) -> ChatOllama:
+        """
+        Returns configured Llama model instance
+
+        Args:
+            pool: Shared connection pool; without it the model opens its own
+        """
         try:
             llm = ChatOllama(
                 model=self.model_name,
                 temperature=self.temperature,
                 base_url=self.base_url,
+                keep_alive=self.keep_alive,
+                **(pool.chat_client_kwargs() if pool is not None else {}),
             )
             print(f"✅ Loaded Llama model: {self.model_name}")
             return llm
@@ -32,7 +145,32 @@ class LlamaConfig:
                 f"Original error: {e}"
             )
 
+    def get_embeddings(self, pool: OllamaConnectionPool = None) -> OllamaEmbeddings:
+        """Returns configured Ollama embeddings instance"""
+        return OllamaEmbeddings(
+            model=self.embedding_model,
+            base_url=self.base_url,
+            keep_alive=self.keep_alive,
+            **(pool.chat_client_kwargs() if pool is not None else {}),
+        )
+
 
 # Global configuration instance
 config = LlamaConfig()
-llm = config.get_llm()
+llm_scheduler = config.get_scheduler()
+if llm_scheduler is not None:
+    metrics.register("llm_scheduler", llm_scheduler.snapshot)
+ollama_router = config.get_router()
+if ollama_router is not None:
+    metrics.register("ollama_router", ollama_router.snapshot)
+llm_hedger = config.get_hedger()
+if llm_hedger is not None:
+    metrics.register("llm_hedging", llm_hedger.snapshot)
+llm_coalescer = config.get_coalescer()
+if llm_coalescer is not None:
+    metrics.register("llm_coalescing", llm_coalescer.snapshot)
+ollama_pool = config.get_connection_pool(
+    llm_scheduler, ollama_router, llm_hedger, llm_coalescer
+)
+metrics.register("ollama_pool", ollama_pool.snapshot)
+llm = config.get_llm(ollama_pool)
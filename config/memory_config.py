@@ -0,0 +1,32 @@
+import os
+
+from dotenv import load_dotenv
+
+from config.graph_config import env_flag
+
+# Load environment variables
+load_dotenv()
+
+
+class MemoryConfig:
+    """Configuration for the long-term conversational memory"""
+
+    def __init__(self):
+        self.enabled = env_flag("LONG_TERM_MEMORY", False)
+        # SQLite file of the memories; without it they only live in the process
+        self.path = os.getenv("MEMORY_PATH")
+        self.top_k = int(os.getenv("MEMORY_TOP_K", "4"))
+        self.min_score = float(os.getenv("MEMORY_MIN_SCORE", "0.3"))
+        # Recent messages the chat agent still sees verbatim
+        self.recent_messages = int(os.getenv("MEMORY_RECENT_MESSAGES", "6"))
+        self.recall_timeout = float(os.getenv("MEMORY_RECALL_TIMEOUT_MS", "500")) / 1000
+        self.max_per_user = int(os.getenv("MEMORY_MAX_PER_USER", "1000"))
+        self.cached_users = int(os.getenv("MEMORY_CACHED_USERS", "1000"))
+        self.queue_size = int(os.getenv("MEMORY_QUEUE_SIZE", "256"))
+        # Header with the authenticated user ID, set by the proxy in front of
+        # the API; without it memories are kept per conversation
+        self.user_header = os.getenv("MEMORY_USER_HEADER")
+
+
+# Global configuration instance
+memory_config = MemoryConfig()
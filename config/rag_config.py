@@ -0,0 +1,65 @@
+import os
+
+from dotenv import load_dotenv
+
+from config.graph_config import env_flag
+
+# Load environment variables
+load_dotenv()
+
+# Default scoring time per reranker: the local model scores in milliseconds,
+# one LLM scoring call over the candidates takes seconds
+RERANK_TIME_BUDGETS_MS = {"local": 150, "llm": 5000}
+
+
+class RagConfig:
+    """Configuration for document retrieval"""
+
+    def __init__(self):
+        # Retrieval is enabled when an index directory is configured
+        self.index_path = os.getenv("RAG_INDEX_PATH")
+        self.top_k = int(os.getenv("RAG_TOP_K", "4"))
+        self.min_score = float(os.getenv("RAG_MIN_SCORE", "0.3"))
+        self.search_mode = os.getenv("RAG_SEARCH_MODE", "auto")
+        self.ann_min_vectors = int(os.getenv("RAG_ANN_MIN_VECTORS", "50000"))
+        self.ann_nprobe = int(os.getenv("RAG_ANN_NPROBE", "8"))
+        self.fusion_candidates = int(os.getenv("RAG_FUSION_CANDIDATES", "20"))
+        self.rrf_k = int(os.getenv("RAG_RRF_K", "60"))
+        # Start retrieval with the turn, concurrently with the planner
+        self.prefetch = env_flag("RAG_PREFETCH", True)
+        # Reranking of the retrieved chunks: "off", "local" or "llm"
+        self.reranker = os.getenv("RAG_RERANKER", "off")
+        self.rerank_candidates = int(os.getenv("RAG_RERANK_CANDIDATES", "12"))
+        self.rerank_time_budget = (
+            float(
+                os.getenv("RAG_RERANK_TIME_BUDGET_MS")
+                or RERANK_TIME_BUDGETS_MS.get(self.reranker, 150)
+            )
+            / 1000
+        )
+        self.rerank_min_score = float(os.getenv("RAG_RERANK_MIN_SCORE", "0"))
+        self.context_token_budget = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1024"))
+        # Segment compaction
+        self.max_segments = int(os.getenv("RAG_MAX_SEGMENTS", "8"))
+        self.compaction_deleted_ratio = float(
+            os.getenv("RAG_COMPACTION_DELETED_RATIO", "0.2")
+        )
+        self.compaction_interval = float(
+            os.getenv("RAG_COMPACTION_INTERVAL_SECONDS", "300")
+        )
+        # Embedding cache, shared by ingestion and queries
+        self.embedding_cache = env_flag("EMBEDDING_CACHE", True)
+        self.embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH")
+        self.embedding_cache_memory_entries = int(
+            os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000")
+        )
+        # Ingestion
+        self.chunk_size = int(os.getenv("RAG_CHUNK_SIZE", "1000"))
+        self.chunk_overlap = int(os.getenv("RAG_CHUNK_OVERLAP", "150"))
+        self.embed_batch_size = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+        self.embed_concurrency = int(os.getenv("RAG_EMBED_CONCURRENCY", "4"))
+        self.write_batch_size = int(os.getenv("RAG_WRITE_BATCH_SIZE", "4096"))
+
+
+# Global configuration instance
+rag_config = RagConfig()
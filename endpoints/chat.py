@@ -1,32 +1,100 @@
 import json
 import uuid
+from typing import Optional
 
-from fastapi import APIRouter
-from starlette.responses import StreamingResponse
+from fastapi import APIRouter, Request
+from starlette.responses import JSONResponse, StreamingResponse
 
+from config.llm_config import llm_scheduler
+from config.memory_config import memory_config
 from models.ai_models import UserRequest
+from services.deadlines import DeadlineExceeded
+from services.llm_scheduler import Overloaded, retry_after_seconds
 from services.llm_service import LLMService
+from utils import metrics
 
 router = APIRouter()
 # Use PostgreSQL for persistent memory in production
 llm_service = LLMService(use_postgres=True)
+metrics.register("postgres_pool", llm_service.pool_snapshot)
+if llm_service.state_cache is not None:
+    metrics.register("state_cache", llm_service.state_cache.snapshot)
+
+
+def overloaded_response(error: Overloaded) -> JSONResponse:
+    """503 telling the client when to retry, instead of letting it time out"""
+    retry_after = retry_after_seconds(error)
+    print(f"🚦 [API] Rejected a chat request, retry after {retry_after}s: {error}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The assistant is overloaded, please retry shortly."},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def deadline_response(error: DeadlineExceeded) -> JSONResponse:
+    """504 for a turn that ran out of time before anything was sent"""
+    print(f"⏱️ [API] Chat request missed its deadline: {error}")
+    return JSONResponse(
+        status_code=504,
+        content={"detail": "The assistant took too long to answer, please retry."},
+    )
+
+
+def authenticated_user(http_request: Request) -> Optional[str]:
+    """
+    The user ID set by the authenticating proxy in MEMORY_USER_HEADER. The
+    proxy must drop the header from client requests: the API trusts it.
+    """
+    if not memory_config.user_header:
+        return None
+    return http_request.headers.get(memory_config.user_header) or None
 
 
 @router.post("")
-async def chat(request: UserRequest):
+async def chat(request: UserRequest, http_request: Request):
     """
     Chat endpoint that now supports response streaming.
+
+    When the LLM backends are saturated the request is rejected with a 503
+    and a Retry-After header: up front when the queue is already too long,
+    or when the turn's first LLM call is rejected before anything is sent.
+    A turn that misses its deadline before anything is sent gets a 504.
     """
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    try:
+        if llm_scheduler is not None:
+            llm_scheduler.check_admission()
+        chunks = llm_service.stream_message(
+            request.message,
+            conversation_id,
+            fast_path=request.fast_path,
+            user_id=authenticated_user(http_request),
+            deadline_seconds=request.deadline_seconds,
+        )
+        # The response starts with the first chunk, so a rejection can still
+        # become a 503
+        first_chunk = await anext(chunks, None)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except DeadlineExceeded as e:
+        return deadline_response(e)
 
     async def stream_generator():
-        conversation_id = request.conversation_id or str(uuid.uuid4())
-
         id_payload = {"conversation_id": conversation_id}
         yield f"event: metadata\ndata: {json.dumps(id_payload)}\n\n"
 
-        async for chunk in llm_service.stream_message(request.message, conversation_id):
-            if chunk:
-                response_chunk = {"response": chunk}
-                yield f"data: {json.dumps(response_chunk)}\n\n"
+        if first_chunk:
+            yield f"data: {json.dumps({'response': first_chunk})}\n\n"
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    response_chunk = {"response": chunk}
+                    yield f"data: {json.dumps(response_chunk)}\n\n"
+        except Overloaded as e:
+            error_payload = {"error": str(e), "retry_after": retry_after_seconds(e)}
+            yield f"event: error\ndata: {json.dumps(error_payload)}\n\n"
+        except DeadlineExceeded as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
 
     return StreamingResponse(stream_generator(), media_type="text/event-stream")
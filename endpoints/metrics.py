@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+
+from utils import metrics
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_metrics():
+    """
+    Returns a snapshot of every registered in-process metric.
+    """
+    return metrics.collect_all()
@@ -1,19 +1,88 @@
 import sys
 import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import endpoints.chat as chat
-from agents.graph.agents_graph import graph_builder
+import endpoints.metrics as metrics
+from agents.graph.agents_graph import (
+    embedding_models,
+    graph_builder,
+    long_term_memory,
+    rag_index,
+)
+from agents.supervisor_agent import planner_cache
+from config.graph_config import graph_config
+from config.llm_config import config as llm_config, ollama_pool, ollama_router
+from config.rag_config import rag_config
+from rag.index import compact_periodically
+from services.ollama_client import warm_up
 
 # Fix for Windows asyncio event loop compatibility with Psycopg
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the checkpointer and its connection pool once, before serving
+    await chat.llm_service.startup()
+    # Health checks and warmup target given backends, past routing and admission
+    direct_client = ollama_pool.direct_client()
+    health_checks = None
+    if ollama_router is not None:
+        # Backends that go down are taken out of (and back into) rotation
+        await ollama_router.check_health(direct_client)
+        health_checks = asyncio.create_task(
+            ollama_router.check_periodically(
+                direct_client, llm_config.health_check_interval
+            )
+        )
+    if llm_config.warmup:
+        # Load every model before serving, so the first requests skip the load
+        await warm_up(
+            ollama_pool,
+            llm_config.base_urls,
+            [llm_config.model_name],
+            embedding_models,
+            keep_alive=llm_config.keep_alive,
+            client=direct_client,
+        )
+    compaction = None
+    if rag_index is not None and rag_config.compaction_interval > 0:
+        # Deleted chunks are reclaimed in the background, queries keep running
+        compaction = asyncio.create_task(
+            compact_periodically(rag_index, rag_config.compaction_interval)
+        )
+    plan_saves = None
+    if planner_cache is not None and planner_cache.path:
+        # New plans are written to disk in batches instead of on every miss
+        plan_saves = asyncio.create_task(
+            planner_cache.save_periodically(graph_config.planner_cache_save_interval)
+        )
+    yield
+    if plan_saves is not None:
+        plan_saves.cancel()
+        await asyncio.to_thread(planner_cache.save)
+    if compaction is not None:
+        compaction.cancel()
+    if health_checks is not None:
+        health_checks.cancel()
+    if long_term_memory is not None:
+        # Turns still queued for long-term memory are written before exiting
+        await long_term_memory.aclose()
+    await chat.llm_service.close()
+    await direct_client.aclose()
+    await ollama_pool.aclose()
+
+
 app = FastAPI(
     title="LangGraph Chatbot",
     description="A simple chatbot using LangGraph and FastAPI.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 graph = graph_builder.compile()
 
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
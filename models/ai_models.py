@@ -1,12 +1,21 @@
-import operator
 from typing import Annotated, List, Optional
 
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing_extensions import TypedDict
 
 
+def merge_results(left: List[str], right: Optional[List[str]]) -> List[str]:
+    """
+    Reducer for worker results. Updates are appended, so parallel workers can
+    all contribute; a `None` update clears the list at the start of a turn.
+    """
+    if right is None:
+        return []
+    return (left or []) + right
+
+
 class AgentState(TypedDict):
     """
     The state of our agent graph. It is passed between the nodes.
@@ -15,16 +24,51 @@ class AgentState(TypedDict):
         messages: The list of conversation messages, managed by `add_messages`.
         tasks: List of taks to be executed, generated by the supervisor.
         results: TA list to aggregate the results of all workers.
+        speculated: Workers whose results were already produced speculatively.
+        fast_path: If True, the workers' answers are streamed directly and the
+            synthesizer is skipped.
+        summary: Running summary of the messages that left the history window.
+        summarized_count: Number of leading messages folded into `summary`.
+        retrieved: Document chunks retrieved for the last message.
+        user_id: User whose long-term memories are recalled and written.
+        memories: Long-term memories recalled for the last message.
     """
 
     messages: Annotated[List[BaseMessage], add_messages]
     tasks: List[str]
-    results: Annotated[List[str], operator.add]
+    results: Annotated[List[str], merge_results]
+    speculated: List[str]
+    fast_path: bool
+    summary: str
+    summarized_count: int
+    retrieved: List[dict]
+    user_id: str
+    memories: List[str]
+
+
+class Plan(BaseModel):
+    """Plan of tasks to be executed by the agents."""
+
+    tasks: List[str] = Field(
+        description="A list of tasks that need to be executed. It can be 'chat_agent', 'joke_agent', or both."
+    )
+
+
+class RelevanceScores(BaseModel):
+    """Relevance of retrieved passages to the user's question."""
+
+    scores: List[int] = Field(
+        description="One score per passage, in passage order, from 0 (unrelated) to 10 (answers the question)."
+    )
 
 
 class UserRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
+    # Overrides the FAST_PATH setting for this request when provided
+    fast_path: Optional[bool] = None
+    # Overrides the REQUEST_DEADLINE_SECONDS setting for this request
+    deadline_seconds: Optional[float] = None
 
 
 class ChatResponse(BaseModel):
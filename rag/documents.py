@@ -0,0 +1,105 @@
+# rag/documents.py
+import hashlib
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+TEXT_EXTENSIONS = (".md", ".markdown", ".txt", ".rst")
+PDF_EXTENSIONS = (".pdf",)
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + PDF_EXTENSIONS
+
+
+def iter_files(paths: Iterable[str], extensions=SUPPORTED_EXTENSIONS) -> Iterator[str]:
+    """Yields the supported files under `paths` (files or directories), lazily"""
+    for path in paths:
+        if os.path.isfile(path):
+            if path.lower().endswith(extensions):
+                yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    yield os.path.join(root, name)
+
+
+def read_text(path: str) -> str:
+    """Returns the text of a document; PDFs need the optional `pypdf` package"""
+    if path.lower().endswith(PDF_EXTENSIONS):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError(
+                f"Cannot read '{path}': install the 'pypdf' package to ingest PDF files"
+            )
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's bytes, the document's identity for re-ingestion"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """
+    Splits text into chunks of at most `chunk_size` characters.
+
+    Chunks end at a paragraph, sentence or word boundary when one is found in
+    their second half, and consecutive chunks share about `overlap` characters.
+    """
+    text = text.strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            for separator in ("\n\n", "\n", ". ", " "):
+                boundary = text.rfind(separator, start + chunk_size // 2, end)
+                if boundary != -1:
+                    end = boundary + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+
+        # Start the next chunk `overlap` characters back, on a word boundary
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+def parse_and_chunk(
+    path: str,
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    known_digest: Optional[str] = None,
+) -> Tuple[Optional[str], Optional[List[dict]]]:
+    """
+    Reads one document and returns its content digest and chunk records.
+
+    The chunks are None when the digest equals `known_digest`, i.e. the
+    document did not change since it was ingested. Runs in the ingestion
+    process pool, so it only takes and returns picklable values. Unreadable
+    files yield no chunks.
+    """
+    try:
+        digest = file_digest(path)
+        if digest == known_digest:
+            return digest, None
+        text = read_text(path)
+    except Exception as e:
+        print(f"⚠️ [INGEST] Skipping '{path}': {e}")
+        return None, []
+    return digest, [
+        {"text": chunk, "source": path, "chunk": number}
+        for number, chunk in enumerate(chunk_text(text, chunk_size, overlap))
+    ]
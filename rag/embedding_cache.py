@@ -0,0 +1,185 @@
+# rag/embedding_cache.py
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config.llm_config import config as llm_config, ollama_pool
+from config.rag_config import rag_config
+from rag.embeddings import OllamaEmbedder
+from utils import metrics
+from utils.lru_cache import LRUCache
+from utils.text import normalize_text
+
+CACHE_FILE = "embedding_cache.sqlite3"
+
+# Keys per SELECT ... IN (...), below SQLite's default variable limit
+LOOKUP_CHUNK = 500
+
+
+def content_key(model: str, text: str) -> str:
+    """Cache key of an embedding: the model and a hash of the normalized text"""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store: an SQLite table of float32 blobs
+    behind an in-memory LRU front cache.
+
+    Lookups and inserts take whole batches, so a batch costs one query per
+    `LOOKUP_CHUNK` keys and one transaction, not one round trip per text.
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_entries: int = 10000):
+        self.path = path
+        self.front = LRUCache(max_size=memory_entries, ttl=float("inf"))
+        self.stats = metrics.Counters("lookups", "memory_hits", "disk_hits", "misses")
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Ingestion and the API may share the file; wait for each other's writes
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._db.commit()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Returns the cached vectors of the given keys (missing keys are left out)"""
+        found = {}
+        missing = []
+        for key in keys:
+            vector = self.front.get(key)
+            if vector is None:
+                missing.append(key)
+            else:
+                found[key] = vector
+        self.stats.incr("lookups", len(keys))
+        self.stats.incr("memory_hits", len(keys) - len(missing))
+
+        if missing and self._db is not None:
+            unique = list(dict.fromkeys(missing))
+            with self._lock:
+                for start in range(0, len(unique), LOOKUP_CHUNK):
+                    chunk = unique[start : start + LOOKUP_CHUNK]
+                    rows = self._db.execute(
+                        "SELECT key, vector FROM embeddings WHERE key IN "
+                        f"({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self.front.put(key, vector)
+                        found[key] = vector
+
+        disk_hits = sum(key in found for key in missing)
+        self.stats.incr("disk_hits", disk_hits)
+        self.stats.incr("misses", len(missing) - disk_hits)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        """Stores vectors in the front cache and, in one transaction, on disk"""
+        for key, vector in items.items():
+            self.front.put(key, vector)
+        if self._db is None or not items:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in items.items()
+                ],
+            )
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        hits = snapshot["memory_hits"] + snapshot["disk_hits"]
+        snapshot["hit_rate"] = metrics.ratio(hits, snapshot["lookups"])
+        snapshot["memory_entries"] = len(self.front)
+        return snapshot
+
+
+class CachedEmbedder:
+    """
+    Embedder wrapper that only sends texts missing from the cache.
+
+    Duplicate texts within a batch are embedded once.
+    """
+
+    def __init__(self, embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = embedder.model
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        keys = [content_key(self.model, text) for text in texts]
+        # Disk reads and writes run off the event loop
+        found = await asyncio.to_thread(self.cache.get_many, keys)
+
+        to_embed: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                to_embed.setdefault(key, text)
+        if to_embed:
+            vectors = await self.embedder.embed(list(to_embed.values()))
+            computed = dict(zip(to_embed, vectors))
+            await asyncio.to_thread(self.cache.put_many, computed)
+            found.update(computed)
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.embed([text]))[0].tolist()
+
+    async def aclose(self):
+        await self.embedder.aclose()
+        self.cache.close()
+
+
+def create_embedder(index_path: Optional[str] = None, max_in_flight: int = 4):
+    """
+    Returns the configured Ollama embedder, behind the embedding cache when
+    it is enabled. The cache file defaults to the index directory, so
+    ingestion and query-time embedding share it.
+
+    Args:
+        index_path: Index directory used for the default cache location
+        max_in_flight: Maximum concurrent embedding requests
+    """
+    embedder = OllamaEmbedder(
+        llm_config.base_url,
+        llm_config.embedding_model,
+        max_in_flight=max_in_flight,
+        client=ollama_pool.async_client(timeout=120.0),
+        keep_alive=llm_config.keep_alive,
+    )
+    if not rag_config.embedding_cache:
+        return embedder
+
+    path = rag_config.embedding_cache_path
+    if path is None and index_path:
+        path = os.path.join(index_path, CACHE_FILE)
+    cache = EmbeddingCache(
+        path, memory_entries=rag_config.embedding_cache_memory_entries
+    )
+    metrics.register("embedding_cache", cache.snapshot)
+    return CachedEmbedder(embedder, cache)
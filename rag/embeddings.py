@@ -0,0 +1,52 @@
+# rag/embeddings.py
+import asyncio
+from typing import List, Optional, Union
+
+import httpx
+import numpy as np
+
+
+class OllamaEmbedder:
+    """
+    Batched client for Ollama's /api/embed endpoint.
+
+    A semaphore bounds the number of embedding requests in flight, so a
+    large ingestion cannot overload the server or queue unbounded work.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        max_in_flight: int = 4,
+        timeout: float = 120.0,
+        client: Optional[httpx.AsyncClient] = None,
+        keep_alive: Union[int, str, None] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        # A shared client (e.g. on the Ollama connection pool) is left open
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(timeout=timeout)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Returns the (len(texts), dim) float32 embeddings of a batch"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        body = {"model": self.model, "input": texts}
+        if self.keep_alive is not None:
+            body["keep_alive"] = self.keep_alive
+        async with self._semaphore:
+            response = await self._client.post(f"{self.base_url}/api/embed", json=body)
+        response.raise_for_status()
+        return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embeds a single query (same interface as LangChain embeddings)"""
+        return (await self.embed([text]))[0].tolist()
+
+    async def aclose(self):
+        if self._owns_client:
+            await self._client.aclose()
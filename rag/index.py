@@ -0,0 +1,642 @@
+# rag/index.py
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from rag.segment import Results, Segment
+from rag.vector_store import BLOCK_ROWS, top_k, write_json_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MANIFEST_FILE = "manifest.json"
+SEGMENTS_DIR = "segments"
+WRITER_LOCK_FILE = "writer.lock"
+COMPACTION_LOCK_FILE = "compaction.lock"
+
+SEARCH_MODES = ("auto", "exact", "ann")
+
+
+def index_exists(path: str) -> bool:
+    return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    """
+    Holds an exclusive lock on `path`, between processes and between threads.
+
+    Yields whether the lock was acquired: with `blocking=False` it yields
+    False instead of waiting for another holder.
+    """
+    with open(path, "a") as f:
+        if not _try_lock(f, blocking):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _try_lock(f, blocking: bool) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+    while True:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.1)
+
+
+class IndexSnapshot:
+    """
+    Read-only view of one manifest generation: its segments and tombstones.
+
+    A query uses a single snapshot from start to end, so the row IDs of its
+    dense and lexical searches resolve to the same records even when a
+    commit or a compaction publishes new segments in the meantime.
+    """
+
+    def __init__(
+        self,
+        index: "VectorIndex",
+        manifest: dict,
+        segments: List[Segment],
+        tombstones: np.ndarray,
+    ):
+        self.index = index
+        self.generation = manifest["generation"]
+        self.dim = manifest["dim"]
+        self.segments = segments
+        self.bases = np.array(
+            [entry["base"] for entry in manifest["segments"]], dtype=np.int64
+        )
+        self.tombstones = tombstones
+        # Deleted rows of every segment, in segment row numbers
+        self.dead = []
+        for base, segment in zip(self.bases, segments):
+            start, stop = np.searchsorted(tombstones, [base, base + len(segment)])
+            self.dead.append(tombstones[start:stop] - base)
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments) - len(self.tombstones)
+
+    @property
+    def has_lexical(self) -> bool:
+        return any(segment.lexical is not None for segment in self.segments)
+
+    def uses_ann(self) -> bool:
+        return any(self.index.uses_ann(segment) for segment in self.segments)
+
+    def search_ids(
+        self, queries: np.ndarray, k: int, min_score: float = -1.0
+    ) -> List[Results]:
+        """Returns the top-k (chunk IDs, cosine scores) of every query, best first"""
+        queries = np.atleast_2d(queries)
+        per_segment = [
+            segment.search(
+                queries, k, dead, self.index.uses_ann(segment), self.index.nprobe
+            )
+            for segment, dead in zip(self.segments, self.dead)
+        ]
+        results = []
+        for row in range(len(queries)):
+            ids, scores = self._merge([found[row] for found in per_segment], k)
+            keep = scores >= min_score
+            results.append((ids[keep], scores[keep]))
+        return results
+
+    def lexical_search(self, text: str, k: int) -> Results:
+        """
+        Returns the top-k (chunk IDs, BM25 scores) of a query text.
+
+        Each segment scores with its own term statistics, which is close
+        enough once segments hold more than a few documents.
+        """
+        return self._merge(
+            [
+                segment.lexical_search(text, k, dead)
+                for segment, dead in zip(self.segments, self.dead)
+            ],
+            k,
+        )
+
+    def hits(self, ids: Sequence[int], scores: Sequence[float]) -> List[dict]:
+        """Returns the records of `ids` with their chunk `id` and `score`"""
+        positions = np.searchsorted(self.bases, ids, side="right") - 1
+        return [
+            {
+                **self.segments[position].store.records(
+                    [chunk_id - self.bases[position]]
+                )[0],
+                "id": int(chunk_id),
+                "score": float(score),
+            }
+            for chunk_id, score, position in zip(ids, scores, positions)
+        ]
+
+    def search(
+        self, queries: np.ndarray, k: int, min_score: float = -1.0
+    ) -> List[List[dict]]:
+        """
+        Returns the top-k hits of every query, best first.
+
+        Each hit is the stored record plus its chunk `id` and cosine `score`.
+        """
+        return [
+            self.hits(ids, scores)
+            for ids, scores in self.search_ids(queries, k, min_score)
+        ]
+
+    def _merge(self, results: List[Results], k: int) -> Results:
+        """Merges per-segment (rows, scores) into the global top-k"""
+        if not results:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate(
+            [base + rows for base, (rows, _) in zip(self.bases, results)]
+        )
+        scores = np.concatenate([scores for _, scores in results])
+        best_ids, best_scores = top_k(scores[None, :], ids, k)
+        return best_ids[0], best_scores[0]
+
+
+class IndexWriter:
+    """
+    Adds and deletes chunks of a VectorIndex in a single commit.
+
+    Added vectors go to a new segment that queries do not see until
+    `commit()` builds its lexical (and, when large enough, IVF) index and
+    publishes it together with the tombstones and the document registry by
+    replacing the manifest. The writer holds the index's writer lock until
+    it is committed or rolled back; as a context manager it commits on
+    success and discards the new segment on error.
+
+    `documents` is the registry of ingested documents (see `rag.ingest`);
+    it is saved as-is on commit.
+    """
+
+    def __init__(self, index: "VectorIndex"):
+        self.index = index
+        self._lock = index._writer_lock()
+        self._lock.__enter__()
+        self.manifest = index._read_manifest()
+        self.documents = index._read_documents(self.manifest)
+        self.segment: Optional[Segment] = None
+        self._deleted: List[np.ndarray] = []
+
+    def __enter__(self) -> "IndexWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def add(self, vectors: np.ndarray, records: Sequence[dict]) -> range:
+        """Appends chunks to the new segment and returns their chunk IDs"""
+        if self.segment is None:
+            name = f"seg-{uuid.uuid4().hex[:12]}"
+            self.segment = Segment(self.index._segment_path(name), self.manifest["dim"])
+        rows = self.segment.store.add(vectors, records)
+        base = self.manifest["next_id"]
+        return range(base + rows.start, base + rows.stop)
+
+    def delete(self, ids: Sequence[int]):
+        """Tombstones chunks; they stop matching queries once committed"""
+        self._deleted.append(np.asarray(ids, dtype=np.int64))
+
+    def commit(self):
+        """Publishes the new segment, the tombstones and the document registry"""
+        try:
+            manifest = self.manifest
+            segment = self.segment
+            if segment is not None and len(segment):
+                segment.build_lexical()
+                if len(segment) >= self.index.ann_min_vectors:
+                    segment.build_ann()
+                manifest["segments"].append(
+                    {
+                        "name": segment.name,
+                        "base": manifest["next_id"],
+                        "ann": segment.ivf is not None,
+                    }
+                )
+                manifest["next_id"] += len(segment)
+                self.segment = None
+
+            tombstones = None
+            if self._deleted:
+                tombstones = np.union1d(
+                    self.index._read_tombstones(manifest), np.concatenate(self._deleted)
+                )
+            self.index._commit(manifest, tombstones, self.documents)
+        finally:
+            self.rollback()
+
+    def rollback(self):
+        """Discards the unpublished segment and releases the writer lock"""
+        if self.segment is not None:
+            shutil.rmtree(self.segment.path, ignore_errors=True)
+            self.segment = None
+        if self._lock is not None:
+            self._lock.__exit__(None, None, None)
+            self._lock = None
+
+
+class VectorIndex:
+    """
+    Searchable document index made of immutable segments.
+
+    Each segment is a VectorStore with its own IVF and BM25 indexes.
+    `manifest.json` lists the published segments with the chunk ID of their
+    first row, a tombstones file of deleted chunk IDs and the document
+    registry file, and is replaced atomically on every commit. Queries run
+    on an `IndexSnapshot` of one manifest generation, so they keep being
+    served from the old segments while new ones are built and swapped in.
+
+    Writers (`writer()`, `build_ann()` and the final swap of `compact()`)
+    are serialized by a file lock, so documents can be ingested from
+    another process while the API serves queries; a reader notices a new
+    manifest on its next `snapshot()`.
+
+    In "auto" mode a segment's IVF index is used once the segment reaches
+    `ann_min_vectors`; smaller segments are searched exactly, which is both
+    faster and precise at that size.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: Optional[int] = None,
+        mode: str = "auto",
+        nprobe: int = 8,
+        ann_min_vectors: int = 50000,
+        max_segments: int = 8,
+        compaction_deleted_ratio: float = 0.2,
+    ):
+        if mode not in SEARCH_MODES:
+            raise ValueError(
+                f"Unknown search mode '{mode}'. Available modes: {', '.join(SEARCH_MODES)}"
+            )
+        self.path = path
+        self.mode = mode
+        self.nprobe = nprobe
+        self.ann_min_vectors = ann_min_vectors
+        self.max_segments = max_segments
+        self.compaction_deleted_ratio = compaction_deleted_ratio
+        os.makedirs(os.path.join(path, SEGMENTS_DIR), exist_ok=True)
+
+        self._refresh_lock = threading.Lock()
+        self._segments: Dict[tuple, Segment] = {}
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._manifest_version = None
+
+        manifest = self._read_manifest()
+        if manifest is None:
+            if dim is None:
+                raise ValueError(f"No vector index at '{path}' and no dimension given")
+            with self._writer_lock():
+                if self._read_manifest() is None:
+                    self._write_manifest(
+                        {
+                            "dim": dim,
+                            "generation": 0,
+                            "next_id": 0,
+                            "segments": [],
+                            "tombstones": None,
+                            "documents": None,
+                        }
+                    )
+        elif dim is not None and dim != manifest["dim"]:
+            raise ValueError(
+                f"Index at '{path}' has dimension {manifest['dim']}, got {dim}"
+            )
+        self.snapshot()
+
+    @property
+    def dim(self) -> int:
+        return self.snapshot().dim
+
+    def __len__(self) -> int:
+        return len(self.snapshot())
+
+    def snapshot(self) -> IndexSnapshot:
+        """Returns the current snapshot, reloading it after another commit"""
+        version = self._manifest_version_on_disk()
+        if self._snapshot is not None and version == self._manifest_version:
+            return self._snapshot
+        with self._refresh_lock:
+            if self._snapshot is None or version != self._manifest_version:
+                self._snapshot = self._load_snapshot()
+                self._manifest_version = version
+            return self._snapshot
+
+    def uses_ann(self, segment: Optional[Segment] = None) -> bool:
+        """Whether `segment` (or any segment) is searched with its IVF index"""
+        if segment is None:
+            return self.snapshot().uses_ann()
+        if segment.ivf is None or self.mode == "exact":
+            return False
+        return self.mode == "ann" or len(segment) >= self.ann_min_vectors
+
+    def search_ids(
+        self, queries: np.ndarray, k: int, min_score: float = -1.0
+    ) -> List[Results]:
+        return self.snapshot().search_ids(queries, k, min_score)
+
+    def lexical_search(self, text: str, k: int) -> Results:
+        return self.snapshot().lexical_search(text, k)
+
+    def search(
+        self, queries: np.ndarray, k: int, min_score: float = -1.0
+    ) -> List[List[dict]]:
+        return self.snapshot().search(queries, k, min_score)
+
+    def writer(self) -> IndexWriter:
+        """Opens a writer, waiting for the writer lock"""
+        return IndexWriter(self)
+
+    def add(self, vectors: np.ndarray, records: List[dict]) -> range:
+        """Adds chunks as a new segment and publishes it; see `IndexWriter`"""
+        with self.writer() as writer:
+            return writer.add(vectors, records)
+
+    def delete(self, ids: Sequence[int]):
+        """Tombstones chunks by ID"""
+        with self.writer() as writer:
+            writer.delete(ids)
+
+    def documents(self) -> dict:
+        """Returns the registry of ingested documents of the current manifest"""
+        return self._read_documents(self._read_manifest())
+
+    def build_ann(self, nlist: Optional[int] = None, **kwargs):
+        """Trains an IVF index for every segment that has none"""
+        with self._writer_lock():
+            manifest = self._read_manifest()
+            for entry in manifest["segments"]:
+                segment = Segment(self._segment_path(entry["name"]))
+                if not entry.get("ann") and len(segment):
+                    segment.build_ann(nlist, **kwargs)
+                    entry["ann"] = True
+            self._commit(manifest)
+
+    def compaction_candidates(
+        self, snapshot: Optional[IndexSnapshot] = None
+    ) -> List[str]:
+        """
+        Names of the segments the next compaction merges: those with at
+        least `compaction_deleted_ratio` of deleted rows, plus the smallest
+        ones while there are more than `max_segments`.
+        """
+        snapshot = snapshot or self.snapshot()
+        selected = [
+            segment.name
+            for segment, dead in zip(snapshot.segments, snapshot.dead)
+            if len(dead) and len(dead) >= len(segment) * self.compaction_deleted_ratio
+        ]
+        rest = sorted(
+            (segment for segment in snapshot.segments if segment.name not in selected),
+            key=len,
+        )
+        while rest and len(rest) + min(len(selected), 1) > self.max_segments:
+            selected.append(rest.pop(0).name)
+        return selected
+
+    def compact(self) -> bool:
+        """
+        Merges the compaction candidates into one segment without their
+        deleted rows, then deletes the old segments.
+
+        The new segment is built while queries and writers keep using the
+        old ones; only the manifest swap waits for the writer lock. Chunks
+        deleted during the build are carried over as tombstones. Returns
+        whether a compaction ran (False if another one is in progress).
+        """
+        compaction_lock = os.path.join(self.path, COMPACTION_LOCK_FILE)
+        with file_lock(compaction_lock, blocking=False) as acquired:
+            if not acquired:
+                return False
+            snapshot = self.snapshot()
+            names = self.compaction_candidates(snapshot)
+            if not names:
+                return False
+
+            merged, old_ids = self._merge_segments(snapshot, names)
+            with self._writer_lock():
+                manifest = self._read_manifest()
+                compacted = [e for e in manifest["segments"] if e["name"] in names]
+                base = manifest["next_id"]
+                ranges = [
+                    (e["base"], e["base"] + len(self._open_segment(e)))
+                    for e in compacted
+                ]
+
+                def remap(ids: np.ndarray) -> np.ndarray:
+                    # IDs in the merged segments move to their new row; the
+                    # ones dropped by the merge (deleted) disappear
+                    ids = np.asarray(ids, dtype=np.int64)
+                    merged_mask = np.zeros(len(ids), dtype=bool)
+                    for start, stop in ranges:
+                        merged_mask |= (ids >= start) & (ids < stop)
+                    positions = np.searchsorted(old_ids, ids)
+                    found = positions < len(old_ids)
+                    found[found] = old_ids[positions[found]] == ids[found]
+                    return np.concatenate(
+                        [ids[~merged_mask], base + positions[merged_mask & found]]
+                    )
+
+                tombstones = np.sort(remap(self._read_tombstones(manifest)))
+                documents = self._read_documents(manifest)
+                for document in documents.values():
+                    document["chunks"] = np.sort(remap(document["chunks"])).tolist()
+
+                manifest["segments"] = [
+                    e for e in manifest["segments"] if e["name"] not in names
+                ]
+                if len(merged):
+                    manifest["segments"].append(
+                        {
+                            "name": merged.name,
+                            "base": base,
+                            "ann": merged.ivf is not None,
+                        }
+                    )
+                    manifest["next_id"] += len(merged)
+                self._commit(manifest, tombstones, documents)
+                self._collect_garbage(manifest)
+
+        reclaimed = sum(stop - start for start, stop in ranges) - len(merged)
+        print(
+            f"🧹 [RAG] Compacted {len(names)} segments into {len(merged)} chunks, "
+            f"reclaimed {reclaimed} deleted chunks."
+        )
+        return True
+
+    def _merge_segments(self, snapshot: IndexSnapshot, names: List[str]):
+        """Copies the live rows of the named segments into a new segment"""
+        merged = Segment(
+            self._segment_path(f"seg-{uuid.uuid4().hex[:12]}"), snapshot.dim
+        )
+        old_ids = []
+        for base, segment, dead in zip(
+            snapshot.bases, snapshot.segments, snapshot.dead
+        ):
+            if segment.name not in names:
+                continue
+            live = np.ones(len(segment), dtype=bool)
+            live[dead] = False
+            records = (
+                record for row, record in segment.store.iter_records() if live[row]
+            )
+            for start in range(0, len(segment), BLOCK_ROWS):
+                rows = start + np.flatnonzero(live[start : start + BLOCK_ROWS])
+                if len(rows):
+                    merged.store.add(
+                        segment.store.vectors[rows], [next(records) for _ in rows]
+                    )
+            old_ids.append(base + np.flatnonzero(live))
+
+        if len(merged):
+            merged.build_lexical()
+            if len(merged) >= self.ann_min_vectors:
+                merged.build_ann()
+        else:
+            shutil.rmtree(merged.path, ignore_errors=True)
+        return merged, np.concatenate(old_ids)
+
+    def _commit(
+        self,
+        manifest: dict,
+        tombstones: Optional[np.ndarray] = None,
+        documents: Optional[dict] = None,
+    ):
+        """Writes the files of a new generation and swaps the manifest in"""
+        superseded = [manifest.get("tombstones"), manifest.get("documents")]
+        generation = manifest["generation"] + 1
+        manifest["generation"] = generation
+        if tombstones is not None:
+            name = f"tombstones-{generation:06d}.npy"
+            tmp_path = os.path.join(self.path, name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(tombstones, dtype=np.int64))
+            os.replace(tmp_path, os.path.join(self.path, name))
+            manifest["tombstones"] = name
+        if documents is not None:
+            name = f"documents-{generation:06d}.json"
+            write_json_atomic(os.path.join(self.path, name), documents)
+            manifest["documents"] = name
+        self._write_manifest(manifest)
+
+        # Readers load these files right after reading the manifest and
+        # retry if a newer commit removed them in between
+        for name in superseded:
+            if name and name not in (manifest["tombstones"], manifest["documents"]):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+        self.snapshot()
+
+    def _collect_garbage(self, manifest: dict):
+        """Deletes segments that are not in the manifest (compacted or abandoned)"""
+        published = {entry["name"] for entry in manifest["segments"]}
+        segments_dir = os.path.join(self.path, SEGMENTS_DIR)
+        for name in os.listdir(segments_dir):
+            if name not in published:
+                # Open segments are memory-mapped and stay readable by the
+                # snapshots still using them
+                shutil.rmtree(os.path.join(segments_dir, name), ignore_errors=True)
+
+    def _load_snapshot(self) -> IndexSnapshot:
+        for attempt in range(3):
+            manifest = self._read_manifest()
+            try:
+                segments = [self._open_segment(entry) for entry in manifest["segments"]]
+                tombstones = self._read_tombstones(manifest)
+            except FileNotFoundError:
+                # A compaction removed files of the manifest just read
+                if attempt == 2:
+                    raise
+                continue
+            published = {(e["name"], e.get("ann", False)) for e in manifest["segments"]}
+            for key in list(self._segments):
+                if key not in published:
+                    del self._segments[key]
+            return IndexSnapshot(self, manifest, segments, tombstones)
+
+    def _open_segment(self, entry: dict) -> Segment:
+        # An IVF index built later is published as a new entry for the segment
+        key = (entry["name"], entry.get("ann", False))
+        segment = self._segments.get(key)
+        if segment is None:
+            segment = self._segments[key] = Segment(self._segment_path(entry["name"]))
+        return segment
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.path, SEGMENTS_DIR, name)
+
+    def _writer_lock(self):
+        return file_lock(os.path.join(self.path, WRITER_LOCK_FILE))
+
+    def _manifest_version_on_disk(self):
+        stat = os.stat(os.path.join(self.path, MANIFEST_FILE))
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.path, MANIFEST_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest: dict):
+        write_json_atomic(os.path.join(self.path, MANIFEST_FILE), manifest)
+
+    def _read_tombstones(self, manifest: dict) -> np.ndarray:
+        if not manifest.get("tombstones"):
+            return np.empty(0, dtype=np.int64)
+        return np.load(os.path.join(self.path, manifest["tombstones"]))
+
+    def _read_documents(self, manifest: dict) -> dict:
+        if not manifest.get("documents"):
+            return {}
+        with open(
+            os.path.join(self.path, manifest["documents"]), encoding="utf-8"
+        ) as f:
+            return json.load(f)
+
+
+async def compact_periodically(index: VectorIndex, interval: float):
+    """Runs `index.compact()` in a worker thread every `interval` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(index.compact)
+        except Exception as e:
+            print(f"❌ [RAG] Compaction failed: {e}")
@@ -0,0 +1,338 @@
+"""
+Streaming document ingestion into the RAG vector index
+
+Usage:
+    python -m rag.ingest docs/ other/notes.md --index data/index
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config.rag_config import rag_config
+from rag.documents import iter_files, parse_and_chunk
+from rag.embedding_cache import create_embedder
+from rag.embeddings import OllamaEmbedder
+from rag.index import IndexWriter, VectorIndex, index_exists
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Marks the end of a stage's output queue
+_DONE = object()
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    chunks: int = 0
+    embeddings: int = 0
+    seconds: float = 0.0
+    # None where the platform does not report it
+    peak_rss_mb: Optional[float] = None
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def embeddings_per_second(self) -> float:
+        return self.embeddings / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "chunks_per_second": round(self.chunks_per_second, 1),
+            "embeddings_per_second": round(self.embeddings_per_second, 1),
+        }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, None when unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def open_index(index_path: str, dim: Optional[int] = None) -> VectorIndex:
+    return VectorIndex(
+        index_path,
+        dim=dim,
+        ann_min_vectors=rag_config.ann_min_vectors,
+        max_segments=rag_config.max_segments,
+        compaction_deleted_ratio=rag_config.compaction_deleted_ratio,
+    )
+
+
+def is_under(path: str, roots: List[str]) -> bool:
+    return any(path == root or path.startswith(root + os.sep) for root in roots)
+
+
+async def ingest(
+    paths: Iterable[str],
+    index_path: str,
+    embedder: Optional[OllamaEmbedder] = None,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    write_batch_size: Optional[int] = None,
+) -> IngestStats:
+    """
+    Ingests documents into the vector index at `index_path`, incrementally.
+
+    Files are discovered lazily and parsed/chunked in a process pool, chunks
+    are embedded in batches with bounded concurrency, and vectors are
+    appended to a new index segment in large batches. Every stage is
+    connected by a bounded queue, so memory use does not grow with the corpus.
+
+    The index keeps a registry of ingested documents (content digest, size,
+    mtime and chunk IDs). Documents whose size and mtime, or else digest,
+    did not change are skipped; the old chunks of changed documents, and
+    of documents under `paths` that no longer exist, are tombstoned. All
+    changes are published in one commit, and queries keep using the
+    previous segments until then.
+
+    Args:
+        paths: Files or directories to ingest
+        index_path: Index directory (created on first use)
+        embedder: Embedding client; defaults to the configured Ollama server
+            behind the embedding cache
+        workers: Parsing processes (default: CPU count)
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Characters shared by consecutive chunks
+        batch_size: Chunks per embedding request
+        write_batch_size: Vectors per index append
+    """
+    paths = list(paths)
+    chunk_size = chunk_size or rag_config.chunk_size
+    chunk_overlap = rag_config.chunk_overlap if chunk_overlap is None else chunk_overlap
+    batch_size = batch_size or rag_config.embed_batch_size
+    write_batch_size = write_batch_size or rag_config.write_batch_size
+    workers = workers or os.cpu_count() or 1
+    if chunk_overlap >= chunk_size // 2:
+        raise ValueError("chunk_overlap must be smaller than half of chunk_size")
+
+    own_embedder = embedder is None
+    if own_embedder:
+        # Unchanged chunks of changed documents are served from the cache
+        embedder = create_embedder(
+            index_path, max_in_flight=rag_config.embed_concurrency
+        )
+
+    stats = IngestStats()
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    batches: asyncio.Queue = asyncio.Queue(maxsize=rag_config.embed_concurrency * 2)
+    embedded: asyncio.Queue = asyncio.Queue(maxsize=rag_config.embed_concurrency * 2)
+
+    # An existing index is locked for the whole run, so concurrent runs do
+    # not base their changes on the same registry
+    index: Optional[VectorIndex] = None
+    writer: Optional[IndexWriter] = None
+    if index_exists(index_path):
+        index = open_index(index_path)
+        writer = await asyncio.to_thread(index.writer)
+    documents = writer.documents if writer is not None else {}
+    # Registry entries of the new and changed documents, by absolute path
+    changed: Dict[str, dict] = {}
+    seen = set()
+
+    async def produce_batches(tg: asyncio.TaskGroup, pool: ProcessPoolExecutor):
+        # At most a few files per worker are being parsed at any time
+        in_flight = asyncio.Semaphore(workers * 4)
+        parse = partial(parse_and_chunk, chunk_size=chunk_size, overlap=chunk_overlap)
+        pending: List[dict] = []
+        tasks = set()
+
+        async def parse_file(path: str, key: str, stat: os.stat_result):
+            try:
+                known_digest = documents.get(key, {}).get("digest")
+                digest, chunks = await loop.run_in_executor(
+                    pool, partial(parse, known_digest=known_digest), path
+                )
+            finally:
+                in_flight.release()
+            return key, stat, digest, chunks
+
+        async def drain(done):
+            for task in done:
+                key, stat, digest, chunks = task.result()
+                entry = {"digest": digest, "size": stat.st_size}
+                entry["mtime_ns"] = stat.st_mtime_ns
+                if chunks is None:
+                    # Touched but identical
+                    stats.unchanged += 1
+                    documents[key].update(entry)
+                    continue
+                stats.files += 1
+                stats.chunks += len(chunks)
+                changed[key] = {**entry, "chunks": []}
+                pending.extend(chunks)
+            while len(pending) >= batch_size:
+                await batches.put(pending[:batch_size])
+                del pending[:batch_size]
+
+        for path in iter_files(paths):
+            key = os.path.abspath(path)
+            seen.add(key)
+            stat = os.stat(path)
+            known = documents.get(key)
+            if (
+                known
+                and known["digest"]
+                and (known["size"], known["mtime_ns"])
+                == (stat.st_size, stat.st_mtime_ns)
+            ):
+                stats.unchanged += 1
+                continue
+
+            await in_flight.acquire()
+            tasks.add(tg.create_task(parse_file(path, key, stat)))
+            done = {task for task in tasks if task.done()}
+            tasks -= done
+            await drain(done)
+
+        if tasks:
+            await asyncio.wait(tasks)
+        await drain(tasks)
+        if pending:
+            await batches.put(pending)
+        await batches.put(_DONE)
+
+    async def embed_batches(tg: asyncio.TaskGroup):
+        # Batches waiting for or in an embedding request
+        slots = asyncio.Semaphore(rag_config.embed_concurrency * 2)
+        requests = set()
+
+        async def embed(batch: List[dict]):
+            try:
+                vectors = await embedder.embed([chunk["text"] for chunk in batch])
+            finally:
+                slots.release()
+            stats.embeddings += len(vectors)
+            await embedded.put((vectors, batch))
+
+        while (batch := await batches.get()) is not _DONE:
+            await slots.acquire()
+            requests.add(tg.create_task(embed(batch)))
+            requests = {request for request in requests if not request.done()}
+        if requests:
+            await asyncio.wait(requests)
+        await embedded.put(_DONE)
+
+    async def write_vectors():
+        vectors: List[np.ndarray] = []
+        records: List[dict] = []
+
+        async def flush():
+            nonlocal index, writer
+            if not records:
+                return
+            matrix = np.concatenate(vectors)
+            if writer is None:
+                index = open_index(index_path, dim=matrix.shape[1])
+                writer = await asyncio.to_thread(index.writer)
+            ids = await asyncio.to_thread(writer.add, matrix, list(records))
+            for chunk_id, record in zip(ids, records):
+                changed[os.path.abspath(record["source"])]["chunks"].append(chunk_id)
+            vectors.clear()
+            records.clear()
+
+        while (item := await embedded.get()) is not _DONE:
+            vectors.append(item[0])
+            records.extend(item[1])
+            if len(records) >= write_batch_size:
+                await flush()
+        await flush()
+
+    def commit():
+        roots = [os.path.abspath(path) for path in paths]
+        for key in [key for key in documents if key not in seen]:
+            if is_under(key, roots):
+                writer.delete(documents.pop(key)["chunks"])
+                stats.deleted += 1
+        for key, entry in changed.items():
+            if key in documents:
+                writer.delete(documents[key]["chunks"])
+            documents[key] = entry
+        writer.documents = documents
+        writer.commit()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # A failing stage cancels the others instead of leaving them blocked
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(produce_batches(tg, pool))
+                tg.create_task(embed_batches(tg))
+                tg.create_task(write_vectors())
+        if writer is not None:
+            await asyncio.to_thread(commit)
+    except BaseException:
+        if writer is not None:
+            writer.rollback()
+        raise
+    finally:
+        if own_embedder:
+            await embedder.aclose()
+
+    stats.seconds = time.perf_counter() - started
+    peak = peak_rss_mb()
+    stats.peak_rss_mb = round(peak, 1) if peak is not None else None
+    if index is not None and index.compaction_candidates():
+        await asyncio.to_thread(index.compact)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Ingest documents into the RAG index")
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    parser.add_argument(
+        "--index",
+        default=rag_config.index_path,
+        required=rag_config.index_path is None,
+        help="Index directory (default: RAG_INDEX_PATH)",
+    )
+    parser.add_argument("--workers", type=int, help="Parsing processes")
+    parser.add_argument("--chunk-size", type=int, help="Maximum chunk length")
+    parser.add_argument("--chunk-overlap", type=int, help="Overlap between chunks")
+    parser.add_argument("--batch-size", type=int, help="Chunks per embedding request")
+    args = parser.parse_args(argv)
+
+    print(f"📥 [INGEST] Ingesting {', '.join(args.paths)} into {args.index}...")
+    stats = asyncio.run(
+        ingest(
+            args.paths,
+            args.index,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            batch_size=args.batch_size,
+        )
+    )
+    peak_rss = f"{stats.peak_rss_mb:.0f} MB" if stats.peak_rss_mb is not None else "n/a"
+    print(
+        f"✅ [INGEST] {stats.files} new or changed files ({stats.unchanged} unchanged, "
+        f"{stats.deleted} deleted), {stats.chunks} chunks in {stats.seconds:.1f}s "
+        f"({stats.chunks_per_second:.0f} chunks/s, "
+        f"{stats.embeddings_per_second:.0f} embeddings/s), "
+        f"peak RSS {peak_rss}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# rag/ivf.py
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+from rag.vector_store import BLOCK_ROWS, top_k
+
+CENTROIDS_FILE = "centroids.npy"
+LIST_IDS_FILE = "list_ids.npy"
+LIST_OFFSETS_FILE = "list_offsets.npy"
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Returns the index of the closest centroid of every vector"""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = np.asarray(vectors[start : start + BLOCK_ROWS])
+        labels[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    nlist: int,
+    iterations: int = 10,
+    sample_size: int = 256,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Spherical k-means on a sample of the (unit-length) vectors.
+
+    Args:
+        vectors: (n, dim) matrix, may be memory-mapped
+        nlist: Number of clusters
+        iterations: Lloyd iterations
+        sample_size: Training points per cluster
+        seed: Random seed, so rebuilding the same data gives the same index
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample_ids = np.sort(rng.choice(n, size=min(n, nlist * sample_size), replace=False))
+    sample = np.asarray(vectors[sample_ids], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+
+        # Empty clusters are re-seeded with random sample points
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = sums / norms
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate index over a VectorStore matrix.
+
+    Vectors are grouped by their closest k-means centroid; the lists are
+    stored as one ID array sorted by list plus per-list offsets. A query
+    only scores the vectors of its `nprobe` closest lists. Vectors appended
+    after training are not in any list and are always scored exactly.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_ids: np.ndarray,
+        list_offsets: np.ndarray,
+        trained_count: int,
+    ):
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.trained_count = trained_count
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(
+        cls, vectors: np.ndarray, nlist: Optional[int] = None, **kwargs
+    ) -> "IVFIndex":
+        """Trains the centroids on `vectors` and fills the inverted lists"""
+        n = len(vectors)
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        centroids = train_centroids(vectors, nlist, **kwargs)
+        labels = assign(vectors, centroids)
+        list_ids = np.argsort(labels, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(labels, minlength=nlist))
+        return cls(centroids, list_ids, list_offsets, n)
+
+    def search(
+        self, matrix: np.ndarray, queries: np.ndarray, k: int, nprobe: int = 8
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k row IDs and scores for a batch of unit-length queries.
+
+        Args:
+            matrix: The full vector matrix the index was trained on (or a
+                longer version of it)
+            queries: (q, dim) normalized queries
+            k: Number of results per query
+            nprobe: Number of closest lists scanned per query
+        """
+        queries = np.atleast_2d(queries)
+        nprobe = min(nprobe, self.nlist)
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)
+        tail = np.arange(self.trained_count, len(matrix), dtype=np.int64)
+
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            candidates = np.concatenate(
+                [
+                    self.list_ids[self.list_offsets[p] : self.list_offsets[p + 1]]
+                    for p in probes[row, :nprobe]
+                ]
+                + [tail]
+            )
+            # Sorted IDs turn the gather into a forward scan of the memmap
+            candidates.sort()
+            scores = np.asarray(matrix[candidates]) @ query
+            ids, best = top_k(scores[None, :], candidates, k)
+            all_ids[row, : ids.shape[1]] = ids[0]
+            all_scores[row, : ids.shape[1]] = best[0]
+        return all_ids, all_scores
+
+    def save(self, path: str):
+        """Writes the index as .npy files under `path`"""
+        os.makedirs(path, exist_ok=True)
+        for name, array in (
+            (CENTROIDS_FILE, self.centroids),
+            (LIST_IDS_FILE, self.list_ids),
+            (LIST_OFFSETS_FILE, self.list_offsets),
+        ):
+            tmp_path = os.path.join(path, name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path: str, trained_count: int) -> "IVFIndex":
+        """Memory-maps a saved index"""
+        return cls(
+            np.load(os.path.join(path, CENTROIDS_FILE)),
+            np.load(os.path.join(path, LIST_IDS_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, LIST_OFFSETS_FILE)),
+            trained_count,
+        )
@@ -0,0 +1,203 @@
+# rag/lexical.py
+import json
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+
+from rag.vector_store import top_k
+
+VOCAB_FILE = "vocab.json"
+DOC_IDS_FILE = "doc_ids.npy"
+WEIGHTS_FILE = "weights.npy"
+TERM_OFFSETS_FILE = "term_offsets.npy"
+
+# Share of the documents above which a term is only scored on its own, in
+# indexes of at least PRUNE_MIN_DOCUMENTS documents
+MAX_DF_RATIO = 0.5
+PRUNE_MIN_DOCUMENTS = 1000
+
+# Postings above size / ratio are summed in a dense array instead of sorted
+DENSE_ACCUMULATION_RATIO = 16
+
+# Words, plus identifiers joined by - _ . : / (error codes, versions, paths)
+TOKEN_RE = re.compile(r"\w+(?:[-_.:/]\w+)*")
+SEPARATOR_RE = re.compile(r"[-_.:/]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its of on or "
+    "that the this to was were what when where which who will with you".split()
+)
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """
+    Yields the index terms of a text. Compound identifiers such as
+    "ERR-1042" are kept whole and also split into their parts, so both the
+    exact identifier and its pieces match.
+    """
+    for token in TOKEN_RE.findall(text.lower()):
+        if SEPARATOR_RE.search(token):
+            yield token
+            for part in SEPARATOR_RE.split(token):
+                if part and part not in STOPWORDS:
+                    yield part
+        elif token not in STOPWORDS:
+            yield token
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index with NumPy postings.
+
+    Postings are stored CSR-style: one array of document IDs sorted by term
+    plus per-term offsets. Each posting holds its precomputed BM25 weight,
+    so a query only gathers the postings of its terms and sums them per
+    document. Arrays are saved as .npy files and memory-mapped on load.
+    """
+
+    def __init__(
+        self,
+        vocab: dict,
+        doc_ids: np.ndarray,
+        weights: np.ndarray,
+        term_offsets: np.ndarray,
+        size: int,
+    ):
+        self.vocab = vocab
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.term_offsets = term_offsets
+        # One past the largest document ID, the length of a dense score array
+        self.size = size
+
+    @classmethod
+    def build(
+        cls,
+        texts: Iterable[Tuple[int, str]],
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> "LexicalIndex":
+        """
+        Builds the index from (document ID, text) pairs.
+
+        Args:
+            texts: Documents to index, consumed once
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+        """
+        vocab = {}
+        term_ids, doc_ids, tfs = array("i"), array("q"), array("f")
+        documents, lengths = array("q"), array("f")
+        for doc_id, text in texts:
+            counts = Counter(tokenize(text))
+            documents.append(doc_id)
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        doc_ids = np.frombuffer(doc_ids, dtype=np.int64)
+        tfs = np.frombuffer(tfs, dtype=np.float32)
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+
+        df = np.bincount(term_ids, minlength=len(vocab))
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum(df)
+
+        documents = np.frombuffer(documents, dtype=np.int64)
+        lengths = np.frombuffer(lengths, dtype=np.float32)
+        count = max(len(documents), 1)
+        avg_length = max(float(lengths.sum()) / count, 1.0)
+        idf = np.log1p((count - df + 0.5) / (df + 0.5)).astype(np.float32)
+        sorter = np.argsort(documents)
+        doc_lengths = lengths[
+            sorter[np.searchsorted(documents, doc_ids, sorter=sorter)]
+        ]
+        norm = k1 * (1 - b + b * doc_lengths / avg_length)
+        weights = idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)
+
+        size = int(documents.max()) + 1 if len(documents) else 0
+        return cls(vocab, doc_ids, weights.astype(np.float32), term_offsets, size)
+
+    def search(self, text: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the top-k document IDs and BM25 scores for a query text"""
+        term_ids = [self.vocab[t] for t in set(tokenize(text)) if t in self.vocab]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        slices = [
+            slice(self.term_offsets[t], self.term_offsets[t + 1]) for t in term_ids
+        ]
+        # Terms in most documents barely change the ranking but have the
+        # longest postings; they are only used when nothing else matches
+        if self.size >= PRUNE_MIN_DOCUMENTS:
+            max_df = self.size * MAX_DF_RATIO
+            slices = [s for s in slices if s.stop - s.start <= max_df] or slices
+        ids = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        if len(slices) > 1 and len(ids) * DENSE_ACCUMULATION_RATIO > self.size:
+            # Long postings (common terms): summing into a dense array is
+            # linear, where sorting them would not be
+            scores = np.bincount(ids, weights=weights, minlength=self.size)
+            ids = np.flatnonzero(scores)
+            weights = scores[ids].astype(np.float32)
+        elif len(slices) > 1:
+            ids, inverse = np.unique(ids, return_inverse=True)
+            weights = np.bincount(inverse, weights=weights).astype(np.float32)
+
+        best_ids, best_scores = top_k(weights[None, :], ids, k)
+        return best_ids[0], best_scores[0]
+
+    def save(self, path: str):
+        """Writes the index under `path`"""
+        os.makedirs(path, exist_ok=True)
+        for name, array_ in (
+            (DOC_IDS_FILE, self.doc_ids),
+            (WEIGHTS_FILE, self.weights),
+            (TERM_OFFSETS_FILE, self.term_offsets),
+        ):
+            tmp_path = os.path.join(path, name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array_)
+            os.replace(tmp_path, os.path.join(path, name))
+
+        terms = [None] * len(self.vocab)
+        for term, term_id in self.vocab.items():
+            terms[term_id] = term
+        tmp_path = os.path.join(path, VOCAB_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"size": self.size, "terms": terms}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(path, VOCAB_FILE))
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        """Loads the vocabulary and memory-maps the postings"""
+        with open(os.path.join(path, VOCAB_FILE), encoding="utf-8") as f:
+            saved = json.load(f)
+        return cls(
+            {term: term_id for term_id, term in enumerate(saved["terms"])},
+            np.load(os.path.join(path, DOC_IDS_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, WEIGHTS_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, TERM_OFFSETS_FILE)),
+            saved["size"],
+        )
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Iterable[int]], k: int = 60) -> dict:
+    """
+    Fuses ranked ID lists: each ID scores sum(1 / (k + rank)) over the lists.
+
+    Returns the fused scores, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
@@ -0,0 +1,68 @@
+# rag/rerank.py
+import math
+from collections import Counter
+from typing import List
+
+from rag.lexical import tokenize
+
+
+def smallest_window(positions: List[tuple], terms: int) -> int:
+    """
+    Length of the shortest run of tokens that contains all `terms` distinct
+    terms, given the sorted (position, term) occurrences of those terms.
+    """
+    best = math.inf
+    counts: Counter = Counter()
+    start = 0
+    for position, term in positions:
+        counts[term] += 1
+        while len(counts) == terms:
+            first_position, first_term = positions[start]
+            best = min(best, position - first_position + 1)
+            counts[first_term] -= 1
+            if not counts[first_term]:
+                del counts[first_term]
+            start += 1
+    return best
+
+
+class TermProximityScorer:
+    """
+    Cheap local relevance model for reranking retrieved chunks.
+
+    Like a cross-encoder it scores each (query, chunk) pair jointly rather
+    than comparing two independent embeddings: a chunk scores by the share
+    of the query terms it contains, weighted by their rarity among the
+    candidates, and by how close together those terms appear. Scores are in
+    [0, 1]; scoring a dozen chunks takes well under a millisecond.
+    """
+
+    def __init__(self, proximity_weight: float = 0.3):
+        self.proximity_weight = proximity_weight
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return [0.0] * len(texts)
+
+        documents = [list(tokenize(text)) for text in texts]
+        df = Counter(
+            term for doc in documents for term in query_terms.intersection(doc)
+        )
+        idf = {term: math.log1p(len(texts) / (1 + df[term])) for term in query_terms}
+        total = sum(idf.values())
+
+        scores = []
+        for doc in documents:
+            positions = [(i, term) for i, term in enumerate(doc) if term in query_terms]
+            matched = {term for _, term in positions}
+            coverage = sum(idf[term] for term in matched) / total
+            if len(matched) > 1:
+                proximity = len(matched) / smallest_window(positions, len(matched))
+            else:
+                proximity = float(bool(matched))
+            scores.append(
+                coverage
+                * (1 - self.proximity_weight + self.proximity_weight * proximity)
+            )
+        return scores
@@ -0,0 +1,113 @@
+# rag/segment.py
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from rag.ivf import IVFIndex
+from rag.lexical import LexicalIndex
+from rag.vector_store import META_FILE, VectorStore, normalize
+
+IVF_DIR = "ivf"
+LEXICAL_DIR = "lexical"
+
+Results = Tuple[np.ndarray, np.ndarray]
+
+
+def drop_dead(ids: np.ndarray, scores: np.ndarray, dead: np.ndarray, k: int) -> Results:
+    """Removes tombstoned rows from a ranked result and keeps the best `k`"""
+    keep = ids >= 0
+    if len(dead):
+        keep &= ~np.isin(ids, dead, assume_unique=True)
+    return ids[keep][:k], scores[keep][:k]
+
+
+class Segment:
+    """
+    An immutable part of a VectorIndex: a VectorStore plus its optional IVF
+    and BM25 indexes.
+
+    A segment is filled once by an index writer (or a compaction) and never
+    changes after it is published, so readers can search it without locks.
+    Rows are addressed by their position in the segment; the index turns them
+    into global chunk IDs by adding the segment's base ID. Deleted rows stay
+    in the files and are filtered out with the `dead` rows passed to searches.
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None):
+        if dim is None and not os.path.exists(os.path.join(path, META_FILE)):
+            raise FileNotFoundError(f"No index segment at '{path}'")
+        self.path = path
+        self.name = os.path.basename(path)
+        self.store = VectorStore(path, dim)
+        self.ivf = self._load_ivf()
+        self.lexical = self._load_lexical()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def build_ann(self, nlist: Optional[int] = None, **kwargs) -> IVFIndex:
+        """Trains the IVF index on the segment's vectors and persists it"""
+        ivf = IVFIndex.train(self.store.vectors, nlist, **kwargs)
+        ivf.save(os.path.join(self.path, IVF_DIR))
+        self.store.update_meta(ivf={"trained_count": ivf.trained_count})
+        self.ivf = ivf
+        print(
+            f"✅ [RAG] Built IVF index with {ivf.nlist} lists over {len(self)} vectors."
+        )
+        return ivf
+
+    def build_lexical(self) -> LexicalIndex:
+        """Builds the BM25 index over the texts of the segment's chunks"""
+        lexical = LexicalIndex.build(
+            (row, record["text"]) for row, record in self.store.iter_records()
+        )
+        lexical.save(os.path.join(self.path, LEXICAL_DIR))
+        self.store.update_meta(lexical={"indexed_count": len(self)})
+        self.lexical = lexical
+        return lexical
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        dead: np.ndarray,
+        use_ann: bool = False,
+        nprobe: int = 8,
+    ) -> List[Results]:
+        """
+        Returns the top-k live (rows, cosine scores) of every query, best first.
+
+        Enough extra rows are fetched to make up for the tombstoned ones,
+        which compaction keeps to a fraction of the segment.
+        """
+        queries = normalize(queries)
+        if len(self) == 0:
+            empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            return [empty for _ in queries]
+        fetch = k + len(dead)
+        if use_ann and self.ivf is not None:
+            ids, scores = self.ivf.search(self.store.vectors, queries, fetch, nprobe)
+        else:
+            ids, scores = self.store.search(queries, fetch)
+        return [drop_dead(i, s, dead, k) for i, s in zip(ids, scores)]
+
+    def lexical_search(self, text: str, k: int, dead: np.ndarray) -> Results:
+        """Returns the top-k live (rows, BM25 scores) of a query text"""
+        if self.lexical is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, scores = self.lexical.search(text, k + len(dead))
+        return drop_dead(ids, scores, dead, k)
+
+    def _load_ivf(self) -> Optional[IVFIndex]:
+        ivf_meta = self.store.meta.get("ivf")
+        if not ivf_meta:
+            return None
+        return IVFIndex.load(
+            os.path.join(self.path, IVF_DIR), ivf_meta["trained_count"]
+        )
+
+    def _load_lexical(self) -> Optional[LexicalIndex]:
+        if not self.store.meta.get("lexical"):
+            return None
+        return LexicalIndex.load(os.path.join(self.path, LEXICAL_DIR))
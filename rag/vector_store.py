@@ -0,0 +1,241 @@
+# rag/vector_store.py
+import json
+import os
+import threading
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+VECTORS_FILE = "vectors.f32"
+RECORDS_FILE = "records.jsonl"
+OFFSETS_FILE = "offsets.i64"
+META_FILE = "meta.json"
+
+# Rows scored per matrix multiplication, bounds the temporary score matrix
+BLOCK_ROWS = 65536
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Returns the rows of `vectors` scaled to unit length, as float32"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Selects the `k` best scores of every row, sorted best first.
+
+    Args:
+        scores: (queries, candidates) score matrix
+        ids: Candidate IDs, (candidates,) or (queries, candidates)
+        k: Number of results per query
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if ids.ndim == 1:
+        ids = np.broadcast_to(ids, scores.shape)
+
+    # argpartition is O(n); only the k survivors are sorted
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    best = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(ids, best, axis=1), np.take_along_axis(
+        scores, best, axis=1
+    )
+
+
+def write_json_atomic(path: str, value):
+    """Writes JSON to `path` through a temporary file and an atomic rename"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def exact_search(
+    matrix: np.ndarray, queries: np.ndarray, k: int, block_rows: int = BLOCK_ROWS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Brute-force inner-product top-k of a batch of queries.
+
+    The matrix is scored in blocks so a memory-mapped index is paged in
+    sequentially and the score matrix stays bounded.
+    """
+    queries = np.atleast_2d(queries)
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+
+    for start in range(0, len(matrix), block_rows):
+        block = matrix[start : start + block_rows]
+        scores = queries @ block.T
+        ids = np.arange(start, start + len(block), dtype=np.int64)
+        block_ids, block_scores = top_k(scores, ids, k)
+        best_ids, best_scores = top_k(
+            np.concatenate([best_scores, block_scores], axis=1),
+            np.concatenate([best_ids, block_ids], axis=1),
+            k,
+        )
+    return best_ids, best_scores
+
+
+class VectorStore:
+    """
+    Append-only store of unit-length float32 vectors and their chunk records.
+
+    Vectors are kept in one contiguous raw file and records in a JSONL file
+    with an offsets file next to it. Both are memory-mapped read-only, so
+    opening an index neither rebuilds nor copies it into RAM. `meta.json`
+    holds the committed row count and is replaced atomically after each
+    append; bytes past it (an interrupted append) are truncated on open.
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+
+        meta = self._read_meta()
+        if meta is None:
+            if dim is None:
+                raise ValueError(f"No vector index at '{path}' and no dimension given")
+            meta = {"dim": dim, "count": 0, "records_bytes": 0}
+            self._write_meta(meta)
+        elif dim is not None and dim != meta["dim"]:
+            raise ValueError(
+                f"Index at '{path}' has dimension {meta['dim']}, got {dim}"
+            )
+        self.meta = meta
+        self.dim = meta["dim"]
+
+        self._truncate(VECTORS_FILE, meta["count"] * self.dim * 4)
+        self._truncate(OFFSETS_FILE, meta["count"] * 8)
+        self._truncate(RECORDS_FILE, meta["records_bytes"])
+        self._map()
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def add(self, vectors: np.ndarray, records: Sequence[dict]) -> range:
+        """
+        Appends vectors with their records and returns their row IDs.
+
+        Args:
+            vectors: (n, dim) array, normalized before it is stored
+            records: One JSON-serializable dict per vector (text, source, ...)
+        """
+        vectors = normalize(vectors)
+        if vectors.shape != (len(records), self.dim):
+            raise ValueError(
+                f"Expected {len(records)} vectors of dimension {self.dim}, "
+                f"got shape {vectors.shape}"
+            )
+
+        with self._lock:
+            meta = dict(self.meta)
+            lines = [
+                (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                for record in records
+            ]
+            ends = meta["records_bytes"] + np.cumsum([len(line) for line in lines])
+
+            self._append(VECTORS_FILE, vectors.tobytes())
+            self._append(RECORDS_FILE, b"".join(lines))
+            self._append(OFFSETS_FILE, ends.astype(np.int64).tobytes())
+
+            start = meta["count"]
+            meta["count"] += len(records)
+            meta["records_bytes"] = (
+                int(ends[-1]) if len(lines) else meta["records_bytes"]
+            )
+            self._write_meta(meta)
+            self.meta = meta
+            self._map()
+        return range(start, meta["count"])
+
+    def records(self, ids: Sequence[int]) -> List[dict]:
+        """Reads the records of the given rows"""
+        ends, data = self.ends, self.data
+        out = []
+        for row in ids:
+            start = int(ends[row - 1]) if row > 0 else 0
+            out.append(json.loads(bytes(data[start : int(ends[row])])))
+        return out
+
+    def iter_records(self, start: int = 0) -> Iterator[Tuple[int, dict]]:
+        """Yields (row ID, record) pairs from `start`, reading the file sequentially"""
+        ends = self.ends
+        offset = int(ends[start - 1]) if start > 0 else 0
+        with open(self._file(RECORDS_FILE), "rb") as f:
+            f.seek(offset)
+            for row in range(start, len(ends)):
+                yield row, json.loads(f.readline())
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k row IDs and cosine scores for a batch of queries"""
+        return exact_search(self.vectors, normalize(queries), k)
+
+    def update_meta(self, **values):
+        """Stores extra values (e.g. the ANN index description) in meta.json"""
+        with self._lock:
+            meta = {**self.meta, **values}
+            self._write_meta(meta)
+            self.meta = meta
+
+    def _map(self):
+        count = self.meta["count"]
+        if count == 0:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+            self.ends = np.empty(0, dtype=np.int64)
+            self.data = np.empty(0, dtype=np.uint8)
+            return
+        # New mappings are swapped in whole; searches holding the old ones
+        # keep a consistent (shorter) view. Mapped files also stay readable
+        # after a compaction deletes them.
+        self.vectors = np.memmap(
+            self._file(VECTORS_FILE),
+            dtype=np.float32,
+            mode="r",
+            shape=(count, self.dim),
+        )
+        self.ends = np.memmap(
+            self._file(OFFSETS_FILE), dtype=np.int64, mode="r", shape=(count,)
+        )
+        self.data = np.memmap(
+            self._file(RECORDS_FILE),
+            dtype=np.uint8,
+            mode="r",
+            shape=(self.meta["records_bytes"],),
+        )
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _append(self, name: str, data: bytes):
+        with open(self._file(name), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncate(self, name: str, size: int):
+        path = self._file(name)
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        elif os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self._file(META_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, meta: dict):
+        write_json_atomic(self._file(META_FILE), meta)
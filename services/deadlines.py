@@ -0,0 +1,98 @@
+# services/deadlines.py
+import asyncio
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from models.ai_models import AgentState
+from utils import metrics
+
+NodeFn = Callable[..., Awaitable[dict]]
+
+deadline_stats = metrics.Counters("turns", "misses")
+
+# Absolute time.monotonic() by which the current request must be answered
+current_deadline: ContextVar[Optional[float]] = ContextVar(
+    "request_deadline", default=None
+)
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time in `stage`"""
+
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"Deadline exceeded in '{stage}' (budget {budget:.1f}s)")
+        self.stage = stage
+        self.budget = budget
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """
+    Gives the work done inside the block `seconds` to finish, counted from
+    now. None or 0 leaves it without a deadline; a deadline already set by
+    an outer block is only ever shortened.
+    """
+    deadline = current_deadline.get()
+    if seconds:
+        own = time.monotonic() + seconds
+        deadline = own if deadline is None else min(deadline, own)
+    token = current_deadline.set(deadline)
+    deadline_stats.incr("turns")
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current deadline, or None when there is none"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def missed(stage: str, budget: float) -> DeadlineExceeded:
+    """Counts a deadline miss in `stage` and returns the error to raise"""
+    deadline_stats.incr("misses")
+    deadline_stats.incr(f"misses:{stage}")
+    print(f"⏱️ [DEADLINE] '{stage}' ran out of time ({budget:.2f}s left).")
+    return DeadlineExceeded(stage, budget)
+
+
+def with_deadline(name: str, node: NodeFn) -> NodeFn:
+    """
+    Wraps a graph node so it is cancelled when the request deadline passes,
+    raising `DeadlineExceeded` instead of letting one slow stage stall the
+    whole turn.
+    """
+    takes_config = "config" in inspect.signature(node).parameters
+
+    async def deadline_node(state: AgentState, config: RunnableConfig):
+        call = node(state, config) if takes_config else node(state)
+        budget = time_left()
+        if budget is None:
+            return await call
+        if budget <= 0:
+            call.close()
+            raise missed(name, budget)
+        try:
+            return await asyncio.wait_for(call, budget)
+        except asyncio.TimeoutError:
+            raise missed(name, budget) from None
+
+    return deadline_node
+
+
+def snapshot() -> dict:
+    snapshot = deadline_stats.snapshot()
+    snapshot["miss_rate"] = metrics.ratio(snapshot["misses"], snapshot["turns"])
+    return snapshot
+
+
+metrics.register("deadlines", snapshot)
@@ -0,0 +1,128 @@
+from typing import AsyncGenerator, AsyncIterator, Dict, Iterable, List, Tuple
+
+from utils import metrics
+
+fast_path_stats = metrics.Counters("turns", "streamed_tokens", "fallback_results")
+
+metrics.register("fast_path", fast_path_stats.snapshot)
+
+WORKER_SEPARATOR = "\n\n"
+
+
+class WorkerStreamMux:
+    """
+    Turns interleaved worker token streams into one readable stream.
+
+    The first worker to produce a token becomes "live" and is forwarded as it
+    generates. Tokens of other workers running in parallel are buffered and
+    emitted, separated by a blank line, once the live worker finishes. Tokens
+    of a speculative worker are held until the planner confirms the guess.
+    """
+
+    def __init__(self, workers: Iterable[str]):
+        self.workers = set(workers)
+        self.live = None
+        self.pending: Dict[str, List[str]] = {}
+        self.speculative: Dict[str, List[str]] = {}
+        self.finished = set()
+        self.streamed = set()
+        self.emitted_any = False
+
+    def on_token(self, worker: str, text: str, speculative: bool = False) -> List[str]:
+        """Handles a token generated by `worker` and returns what to emit"""
+        if speculative:
+            self.speculative.setdefault(worker, []).append(text)
+            return []
+
+        self.streamed.add(worker)
+        if self.live is None and not self.pending:
+            self.live = worker
+            return self._emit(worker, [text])
+        if worker == self.live:
+            return [text]
+        self.pending.setdefault(worker, []).append(text)
+        return []
+
+    def on_update(self, node: str, update: dict) -> List[str]:
+        """Handles a finished node and returns what to emit"""
+        update = update or {}
+        if node == "planner":
+            confirmed = update.get("speculated", [])
+            for worker, tokens in self.speculative.items():
+                if worker in confirmed:
+                    self.streamed.add(worker)
+                    self.pending.setdefault(worker, []).extend(tokens)
+            for worker in confirmed:
+                self._finish(worker, update)
+            self.speculative.clear()
+        elif node in self.workers:
+            self._finish(node, update)
+            if node == self.live:
+                self.live = None
+        return self._advance()
+
+    def flush(self) -> List[str]:
+        """Returns everything still buffered once the graph is done"""
+        out = []
+        for worker in list(self.pending):
+            out.extend(self._emit(worker, self.pending.pop(worker)))
+        return out
+
+    def _finish(self, worker: str, update: dict):
+        self.finished.add(worker)
+        if worker not in self.streamed and update.get("results"):
+            # The worker did not stream (e.g. cached output), use its result.
+            fast_path_stats.incr("fallback_results")
+            self.pending.setdefault(worker, []).append("\n".join(update["results"]))
+
+    def _advance(self) -> List[str]:
+        out = []
+        while self.live is None and self.pending:
+            worker = next(iter(self.pending))
+            out.extend(self._emit(worker, self.pending.pop(worker)))
+            if worker not in self.finished:
+                self.live = worker
+        return out
+
+    def _emit(self, worker: str, tokens: List[str]) -> List[str]:
+        if not tokens:
+            return []
+        out = [WORKER_SEPARATOR] if self.emitted_any else []
+        self.emitted_any = True
+        return out + tokens
+
+
+async def stream_worker_output(
+    events: AsyncIterator[Tuple[str, object]], workers: Iterable[str]
+) -> AsyncGenerator[str, None]:
+    """
+    Streams the workers' own generations from a graph run.
+
+    Args:
+        events: Output of `graph.astream(..., stream_mode=["messages", "updates"])`
+        workers: Names of the worker nodes whose tokens are the answer
+    """
+    workers = list(workers)
+    mux = WorkerStreamMux(workers)
+    fast_path_stats.incr("turns")
+
+    async for mode, payload in events:
+        if mode == "messages":
+            chunk, metadata = payload
+            worker = next((t for t in metadata.get("tags", []) if t in workers), None)
+            if worker is None or not isinstance(chunk.content, str):
+                continue
+            speculative = metadata.get("langgraph_node") != worker
+            out = mux.on_token(worker, chunk.content, speculative)
+        else:
+            out = []
+            for node, update in payload.items():
+                out.extend(mux.on_update(node, update))
+
+        for text in out:
+            fast_path_stats.incr("streamed_tokens")
+            yield text
+
+    for text in mux.flush():
+        fast_path_stats.incr("streamed_tokens")
+        yield text
@@ -0,0 +1,208 @@
+# services/llm_coalescing.py
+import asyncio
+import hashlib
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from models.ai_models import AgentState
+from services.llm_scheduler import GENERATION_PATHS
+from utils import metrics
+
+NodeFn = Callable[[AgentState], Awaitable[dict]]
+
+current_coalescing: ContextVar[bool] = ContextVar("llm_coalescing", default=False)
+
+
+@contextmanager
+def llm_coalescing(enabled: bool = True):
+    """Coalesces the LLM calls made inside the block with identical ones"""
+    token = current_coalescing.set(enabled)
+    try:
+        yield
+    finally:
+        current_coalescing.reset(token)
+
+
+def with_coalescing(node: NodeFn) -> NodeFn:
+    """
+    Wraps a graph node so its LLM calls share the generation of identical
+    calls already in flight. Only for nodes where one answer serves every
+    caller: a sampled generation is no longer drawn once per call.
+    """
+
+    async def coalesced_node(state: AgentState):
+        with llm_coalescing():
+            return await node(state)
+
+    return coalesced_node
+
+
+def flight_key(request: httpx.Request) -> str:
+    """Hash of the path and the request body: model, options and prompt"""
+    try:
+        body = json.dumps(json.loads(request.content), sort_keys=True).encode()
+    except ValueError:
+        body = request.content
+    return hashlib.sha256(request.url.path.encode() + b"\n" + body).hexdigest()
+
+
+class Flight:
+    """One upstream generation and the callers subscribed to it"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.head: Optional[httpx.Response] = None
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._progress = asyncio.Event()
+
+    def notify(self):
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    async def progress(self):
+        await self._progress.wait()
+
+
+class FlightStream(httpx.AsyncByteStream):
+    """Response body replaying a flight's chunks, then following it live"""
+
+    def __init__(self, flight: Flight, unsubscribe: Callable[[Flight], None]):
+        self.flight = flight
+        self._unsubscribe = unsubscribe
+
+    async def __aiter__(self):
+        flight = self.flight
+        index = 0
+        while True:
+            while index < len(flight.chunks):
+                yield flight.chunks[index]
+                index += 1
+            if flight.error is not None:
+                raise flight.error
+            if flight.done:
+                return
+            await flight.progress()
+
+    async def aclose(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe(self.flight)
+            self._unsubscribe = None
+
+
+class LLMCoalescer:
+    """
+    Singleflight of LLM calls: identical calls (same path, model, options
+    and prompt) made while one is in flight subscribe to its generation
+    instead of starting their own. Every subscriber receives the whole
+    token stream from the start, so streamed and unstreamed calls can
+    share a flight. The upstream call is cancelled once every subscriber
+    has gone.
+    """
+
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+        self.stats = metrics.Counters("calls", "upstream", "coalesced", "abandoned")
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        snapshot["coalescing_ratio"] = metrics.ratio(
+            snapshot["coalesced"], snapshot["calls"]
+        )
+        snapshot["in_flight"] = len(self.flights)
+        return snapshot
+
+
+class CoalescingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that coalesces the generation requests made under
+    `llm_coalescing` through an LLMCoalescer; other requests pass through.
+
+    The upstream request runs in its own task, with the context of the
+    first caller, so a caller leaving early does not cut the others off.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        coalescer: LLMCoalescer,
+        paths: Iterable[str] = GENERATION_PATHS,
+    ):
+        self.transport = transport
+        self.coalescer = coalescer
+        self.paths = tuple(paths)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not current_coalescing.get() or not request.url.path.endswith(self.paths):
+            return await self.transport.handle_async_request(request)
+
+        key = flight_key(request)
+        self.coalescer.stats.incr("calls")
+        flight = self.coalescer.flights.get(key)
+        if flight is None:
+            self.coalescer.stats.incr("upstream")
+            flight = self.coalescer.flights[key] = Flight(key)
+            flight.task = asyncio.create_task(self._pump(flight, request))
+        else:
+            self.coalescer.stats.incr("coalesced")
+        flight.subscribers += 1
+
+        try:
+            while flight.head is None and flight.error is None:
+                await flight.progress()
+        except BaseException:
+            self._unsubscribe(flight)
+            raise
+        if flight.head is None:
+            self._unsubscribe(flight)
+            raise flight.error
+        return httpx.Response(
+            flight.head.status_code,
+            headers=flight.head.headers,
+            stream=FlightStream(flight, self._unsubscribe),
+        )
+
+    async def _pump(self, flight: Flight, request: httpx.Request):
+        """Reads the upstream response into the flight"""
+        try:
+            response = await self.transport.handle_async_request(request)
+            flight.head = response
+            flight.notify()
+            try:
+                async for chunk in response.stream:
+                    flight.chunks.append(chunk)
+                    flight.notify()
+            finally:
+                await response.stream.aclose()
+            flight.done = True
+        except asyncio.CancelledError:
+            flight.error = httpx.ReadError("The coalesced LLM call was cancelled")
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            # Calls made from now on start a new generation
+            self._land(flight)
+            flight.notify()
+
+    def _unsubscribe(self, flight: Flight):
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done and flight.error is None:
+            # Nobody is left to read it
+            self.coalescer.stats.incr("abandoned")
+            self._land(flight)
+            flight.task.cancel()
+
+    def _land(self, flight: Flight):
+        if self.coalescer.flights.get(flight.key) is flight:
+            del self.coalescer.flights[flight.key]
+
+    async def aclose(self):
+        await self.transport.aclose()
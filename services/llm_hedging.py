@@ -0,0 +1,220 @@
+# services/llm_hedging.py
+import asyncio
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Tuple
+
+import httpx
+
+from models.ai_models import AgentState
+from services.deadlines import time_left
+from services.llm_scheduler import (
+    GENERATION_PATHS,
+    Priority,
+    backend_name,
+    llm_priority,
+)
+from services.ollama_router import AVOID_BACKEND
+from utils import metrics
+
+NodeFn = Callable[[AgentState], Awaitable[dict]]
+
+current_hedging: ContextVar[bool] = ContextVar("llm_hedging", default=False)
+
+
+@contextmanager
+def llm_hedging(enabled: bool = True):
+    """Hedges the LLM calls made inside the block"""
+    token = current_hedging.set(enabled)
+    try:
+        yield
+    finally:
+        current_hedging.reset(token)
+
+
+def with_hedging(node: NodeFn) -> NodeFn:
+    """
+    Wraps a graph node so its LLM calls are hedged. Only for nodes whose
+    calls nobody streams: a hedged response is delivered once complete.
+    """
+
+    async def hedged_node(state: AgentState):
+        with llm_hedging():
+            return await node(state)
+
+    return hedged_node
+
+
+class LatencyWindow:
+    """Latencies of the most recent calls of one kind"""
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> float:
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class LLMHedger:
+    """
+    Hedging policy of non-streamed LLM calls.
+
+    A call that has not completed after the `percentile` latency of its
+    kind (path and model) gets a duplicate, sent to another backend when
+    there is one, and the first complete response wins. Until `min_samples`
+    latencies are known the fixed `delay` is used. With a request deadline,
+    the duplicate goes out no later than halfway through the time left.
+    """
+
+    def __init__(
+        self, delay: float = 2.0, percentile: float = 95.0, min_samples: int = 20
+    ):
+        self.delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies: Dict[Tuple[str, str], LatencyWindow] = {}
+        self.stats = metrics.Counters(
+            "calls", "hedged", "hedge_wins", "primary_wins", "failures"
+        )
+
+    def window(self, kind: Tuple[str, str]) -> LatencyWindow:
+        window = self.latencies.get(kind)
+        if window is None:
+            window = self.latencies[kind] = LatencyWindow()
+        return window
+
+    def hedge_delay(self, kind: Tuple[str, str]) -> float:
+        """Seconds to wait for a call of `kind` before hedging it"""
+        window = self.window(kind)
+        if len(window.samples) >= self.min_samples:
+            delay = window.percentile(self.percentile)
+        else:
+            delay = self.delay
+        left = time_left()
+        if left is not None:
+            delay = min(delay, max(0.0, left / 2))
+        return delay
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        snapshot["hedge_rate"] = metrics.ratio(snapshot["hedged"], snapshot["calls"])
+        snapshot["hedge_win_rate"] = metrics.ratio(
+            snapshot["hedge_wins"], snapshot["hedged"]
+        )
+        snapshot["delays_ms"] = {
+            f"{model}{path}": round(self.hedge_delay((path, model)) * 1000, 1)
+            for path, model in self.latencies
+        }
+        return snapshot
+
+
+def call_kind(request: httpx.Request) -> Tuple[str, str]:
+    try:
+        model = json.loads(request.content).get("model", "")
+    except (ValueError, AttributeError):
+        model = ""
+    return request.url.path, model
+
+
+class HedgingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that hedges the generation requests made under
+    `llm_hedging`. Hedged responses are read whole before being returned,
+    so the losing request can be cancelled; other requests pass through.
+
+    The duplicate runs with `Priority.BACKGROUND`, so it only gets a slot
+    no real call is waiting for, and asks the router to avoid the backend
+    of the original request.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        hedger: LLMHedger,
+        paths: Iterable[str] = GENERATION_PATHS,
+    ):
+        self.transport = transport
+        self.hedger = hedger
+        self.paths = tuple(paths)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not current_hedging.get() or not request.url.path.endswith(self.paths):
+            return await self.transport.handle_async_request(request)
+
+        kind = call_kind(request)
+        self.hedger.stats.incr("calls")
+        primary = asyncio.create_task(self._fetch(request, kind))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(
+                {primary}, timeout=self.hedger.hedge_delay(kind)
+            )
+            if done:
+                return primary.result()
+
+            self.hedger.stats.incr("hedged")
+            hedge = asyncio.create_task(
+                self._fetch(self._duplicate(request), kind, hedge=True)
+            )
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None and task.result().status_code < 500:
+                        self.hedger.stats.incr(
+                            "hedge_wins" if task is hedge else "primary_wins"
+                        )
+                        return task.result()
+            # Both failed: the caller gets the original request's outcome
+            self.hedger.stats.incr("failures")
+            return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # The loser may still be reading: wait for it to close its response
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _fetch(
+        self, request: httpx.Request, kind: Tuple[str, str], hedge: bool = False
+    ) -> httpx.Response:
+        if hedge:
+            # Runs in its own task, so the priority only applies to the duplicate
+            with llm_priority(Priority.BACKGROUND):
+                return await self._fetch(request, kind)
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        try:
+            body = b"".join([chunk async for chunk in response.stream])
+        finally:
+            await response.stream.aclose()
+        self.hedger.window(kind).record(time.perf_counter() - start)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=httpx.ByteStream(body),
+        )
+
+    @staticmethod
+    def _duplicate(request: httpx.Request) -> httpx.Request:
+        # The router rewrote the original's URL to the backend it chose
+        return httpx.Request(
+            request.method,
+            request.url,
+            headers=request.headers,
+            content=request.content,
+            extensions={**request.extensions, AVOID_BACKEND: backend_name(request.url)},
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,301 @@
+# services/llm_scheduler.py
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from models.ai_models import AgentState
+from utils import metrics
+
+NodeFn = Callable[[AgentState], Awaitable[dict]]
+
+# Ollama endpoints that generate; embeddings have their own in-flight limit
+GENERATION_PATHS = ("/api/chat", "/api/generate")
+
+
+class Priority(IntEnum):
+    """
+    Scheduling priority of an LLM call, lower runs first.
+
+    Calls of turns already under way go ahead of the ones that start new
+    turns, so in-flight conversations finish first under load.
+    """
+
+    STREAM = 0  # Final generation streamed to the client
+    WORKER = 1  # Worker and synthesizer calls
+    PLANNER = 2  # First calls of a new turn (summary, planner)
+    BACKGROUND = 3  # Work nobody is waiting for
+
+
+current_priority: ContextVar[Priority] = ContextVar(
+    "llm_priority", default=Priority.WORKER
+)
+
+
+@contextmanager
+def llm_priority(priority: Priority):
+    """Runs the LLM calls made inside the block with `priority`"""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def with_priority(node: NodeFn, priority: Priority) -> NodeFn:
+    """Wraps a graph node so its LLM calls are scheduled with `priority`"""
+
+    async def prioritized_node(state: AgentState):
+        with llm_priority(priority):
+            return await node(state)
+
+    return prioritized_node
+
+
+class Overloaded(Exception):
+    """An LLM call was rejected because its backend is saturated"""
+
+    def __init__(self, backend: str, retry_after: float):
+        super().__init__(
+            f"LLM backend {backend} is overloaded, retry after {retry_after:.1f}s"
+        )
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+class BackendQueue:
+    """Concurrency slots of one backend and the calls waiting for them"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        # Heap of [priority, sequence, future]
+        self.waiters: List[list] = []
+        # Moving average of how long a call holds a slot
+        self.service_time = 1.0
+
+    def waiting(self) -> int:
+        return sum(1 for *_, future in self.waiters if not future.done())
+
+    def estimated_wait(self, priority: Priority) -> float:
+        """Seconds a new call of `priority` would wait for a slot"""
+        if self.in_flight < self.limit and not self.waiting():
+            return 0.0
+        ahead = sum(
+            1
+            for waiter_priority, _, future in self.waiters
+            if waiter_priority <= priority and not future.done()
+        )
+        return (ahead // self.limit + 1) * self.service_time
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the LLM backends.
+
+    Each backend runs at most `max_concurrency` generations at once; other
+    calls wait in a bounded priority queue. Calls that start a new turn
+    (`Priority.PLANNER` and lower) are rejected with `Overloaded` when their
+    expected wait exceeds `max_queue_wait`, or when they waited that long,
+    since failing fast with a Retry-After beats timing out. Calls of turns
+    already under way wait instead, as rejecting them would waste the work
+    done so far. When the queue is full, the lowest priority waiter is
+    rejected to make room for a higher priority call.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_queue: int = 64,
+        max_queue_wait: float = 10.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self._backends: Dict[str, BackendQueue] = {}
+        self._sequence = itertools.count()
+        self.stats = metrics.Counters(
+            "admitted", "queued", "rejected", "evicted", "wait_us"
+        )
+        self.max_depth = 0
+
+    def backend(self, name: str) -> BackendQueue:
+        queue = self._backends.get(name)
+        if queue is None:
+            queue = self._backends[name] = BackendQueue(self.max_concurrency)
+        return queue
+
+    def check_admission(self, backends: Iterable[str] = None):
+        """
+        Raises `Overloaded` when a new turn would be rejected by every
+        backend, so the API can answer 503 before starting the turn.
+        """
+        queues = [self.backend(name) for name in backends or self._backends]
+        if not queues:
+            return
+        waits = [queue.estimated_wait(Priority.PLANNER) for queue in queues]
+        if min(waits) > self.max_queue_wait:
+            self.stats.incr("rejected")
+            raise Overloaded(", ".join(backends or self._backends), min(waits))
+
+    async def acquire(self, name: str, priority: Priority):
+        """Waits for a slot on backend `name`; raises `Overloaded` when rejected"""
+        queue = self.backend(name)
+        if queue.in_flight < queue.limit and not queue.waiting():
+            queue.in_flight += 1
+            self.stats.incr("admitted")
+            return
+
+        rejectable = priority >= Priority.PLANNER
+        if rejectable:
+            wait = queue.estimated_wait(priority)
+            if wait > self.max_queue_wait:
+                self.stats.incr("rejected")
+                raise Overloaded(name, wait)
+        if queue.waiting() >= self.max_queue:
+            self._evict(name, queue, priority)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiters, [priority, next(self._sequence), future])
+        self.stats.incr("queued")
+        self.max_depth = max(self.max_depth, queue.waiting())
+
+        start = time.perf_counter()
+        try:
+            if rejectable:
+                await asyncio.wait_for(asyncio.shield(future), self.max_queue_wait)
+            else:
+                await future
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled() and not future.exception():
+                # The slot was granted just as the wait ran out: keep it
+                return self._admitted(start)
+            future.cancel()
+            self.stats.incr("rejected")
+            raise Overloaded(name, queue.estimated_wait(priority))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and not future.exception():
+                # Granted a slot the caller no longer wants: pass it on
+                self.release(name)
+            future.cancel()
+            raise
+        self._admitted(start)
+
+    def _admitted(self, start: float):
+        self.stats.incr("admitted")
+        self.stats.incr("wait_us", int((time.perf_counter() - start) * 1e6))
+
+    def _evict(self, name: str, queue: BackendQueue, priority: Priority):
+        """Rejects the newest lowest priority waiter, or the new call"""
+        live = [waiter for waiter in queue.waiters if not waiter[2].done()]
+        lowest = max(live, key=lambda waiter: (waiter[0], waiter[1]))
+        if lowest[0] <= priority:
+            self.stats.incr("rejected")
+            raise Overloaded(name, queue.estimated_wait(priority))
+        lowest[2].set_exception(Overloaded(name, queue.estimated_wait(lowest[0])))
+        self.stats.incr("evicted")
+
+    def release(self, name: str, held: Optional[float] = None):
+        """Frees a slot of backend `name` and hands it to the best waiter"""
+        queue = self.backend(name)
+        if held is not None:
+            queue.service_time = 0.8 * queue.service_time + 0.2 * held
+        while queue.waiters:
+            _, _, future = heapq.heappop(queue.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        queue.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        snapshot["avg_wait_ms"] = metrics.ratio(
+            snapshot["wait_us"] / 1000, snapshot["queued"]
+        )
+        snapshot["max_depth"] = self.max_depth
+        snapshot["backends"] = {
+            name: {
+                "in_flight": queue.in_flight,
+                "queued": queue.waiting(),
+                "avg_service_s": round(queue.service_time, 3),
+            }
+            for name, queue in self._backends.items()
+        }
+        return snapshot
+
+
+def retry_after_seconds(error: Overloaded) -> int:
+    """Whole seconds for the Retry-After header"""
+    return max(1, math.ceil(error.retry_after))
+
+
+def backend_name(url: httpx.URL) -> str:
+    return f"{url.scheme}://{url.netloc.decode('ascii')}"
+
+
+class ReleasingStream(httpx.AsyncByteStream):
+    """Response body that calls `release` once it is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self.stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class ScheduledTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that admits generation requests through an LLMScheduler.
+
+    A request holds its backend slot until its response is closed, so a
+    streamed generation counts for its whole duration. The priority comes
+    from `current_priority` of the calling task.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        scheduler: LLMScheduler,
+        paths: Iterable[str] = GENERATION_PATHS,
+    ):
+        self.transport = transport
+        self.scheduler = scheduler
+        self.paths = tuple(paths)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith(self.paths):
+            return await self.transport.handle_async_request(request)
+
+        name = backend_name(request.url)
+        await self.scheduler.acquire(name, current_priority.get())
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.scheduler.release(name, time.perf_counter() - start)
+            raise
+        response.stream = ReleasingStream(
+            response.stream,
+            lambda: self.scheduler.release(name, time.perf_counter() - start),
+        )
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,299 @@
+# services/ollama_client.py
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Union
+
+import httpx
+
+from services.llm_coalescing import CoalescingTransport, LLMCoalescer
+from services.llm_hedging import HedgingTransport, LLMHedger
+from services.llm_scheduler import LLMScheduler, ScheduledTransport
+from services.ollama_router import OllamaRouter, RoutingTransport
+from utils import metrics
+
+# Warmup prompt: one token is enough to load the model and time the prefill
+WARMUP_PROMPT = "Hi"
+
+
+class CountedStream(httpx.AsyncByteStream):
+    """Response body that releases its request from the count once closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self.stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that counts the requests sent through it and those in
+    flight, from the request until its response is closed.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.stats = metrics.Counters("requests")
+        self.in_flight = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.incr("requests")
+        self.in_flight += 1
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self._release()
+            raise
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=CountedStream(response.stream, self._release),
+            extensions=response.extensions,
+        )
+
+    def _release(self):
+        self.in_flight -= 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class OllamaConnectionPool:
+    """
+    Keep-alive HTTP connection pool shared by every Ollama client.
+
+    The chat models (through the `ollama` client of `ChatOllama`) and the
+    embedders all send their requests through the same sized transports, so
+    connections to Ollama are opened once and reused across calls instead of
+    per client, and the number of open connections is bounded.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 32,
+        max_keepalive_connections: int = 16,
+        keepalive_expiry: float = 300.0,
+        timeout: Optional[float] = None,
+        scheduler: Optional[LLMScheduler] = None,
+        router: Optional[OllamaRouter] = None,
+        hedger: Optional[LLMHedger] = None,
+        coalescer: Optional[LLMCoalescer] = None,
+    ):
+        """
+        Args:
+            max_connections: Maximum open connections; more requests wait
+            max_keepalive_connections: Idle connections kept open for reuse
+            keepalive_expiry: Seconds an idle connection is kept open
+            timeout: Request timeout in seconds (None waits indefinitely, as
+                a long generation may take minutes)
+            scheduler: Admission control for the generation requests
+            router: Load balancing over several Ollama backends
+            hedger: Hedging of the calls made under `llm_hedging`
+            coalescer: Sharing of identical calls made under `llm_coalescing`
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.http_transport = CountingTransport(
+            httpx.AsyncHTTPTransport(limits=self.limits)
+        )
+        self.transport: httpx.AsyncBaseTransport = self.http_transport
+        self.scheduler = scheduler
+        self.router = router
+        self.hedger = hedger
+        self.coalescer = coalescer
+        if scheduler is not None:
+            self.transport = ScheduledTransport(self.transport, scheduler)
+        if router is not None:
+            # Routing comes first, so the scheduler admits on the chosen backend
+            self.transport = RoutingTransport(self.transport, router)
+        if hedger is not None:
+            # Outermost, so a duplicate is routed and admitted on its own
+            self.transport = HedgingTransport(self.transport, hedger)
+        if coalescer is not None:
+            # Identical calls share one flight, hedged and admitted once
+            self.transport = CoalescingTransport(self.transport, coalescer)
+        self.sync_transport = httpx.HTTPTransport(limits=self.limits)
+
+    def chat_client_kwargs(self) -> dict:
+        """Keyword arguments that make a `ChatOllama`/`OllamaEmbeddings` use the pool"""
+        return {
+            "client_kwargs": {"timeout": self.timeout},
+            "async_client_kwargs": {"transport": self.transport},
+            "sync_client_kwargs": {"transport": self.sync_transport},
+        }
+
+    def async_client(self, **kwargs) -> httpx.AsyncClient:
+        """
+        Returns an httpx client on the shared pool. Closing it would close the
+        pool for every client, so its owner should leave that to `aclose`.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return httpx.AsyncClient(transport=self.transport, **kwargs)
+
+    def direct_client(self, **kwargs) -> httpx.AsyncClient:
+        """
+        Returns an httpx client on the pooled connections that skips routing
+        and admission control, for requests aimed at a given backend. Closing
+        it closes the pooled connections, so it is only closed on shutdown.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return httpx.AsyncClient(transport=self.http_transport, **kwargs)
+
+    def snapshot(self) -> dict:
+        in_flight = self.http_transport.in_flight
+        return {
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "requests": self.http_transport.stats["requests"],
+            "in_flight": in_flight,
+            # Requests beyond max_connections wait for a connection to free up
+            "waiting": max(0, in_flight - self.limits.max_connections),
+        }
+
+    async def aclose(self):
+        await self.transport.aclose()
+        self.sync_transport.close()
+
+
+warmup_report: Dict[str, dict] = {}
+
+
+def warmup_snapshot() -> dict:
+    return dict(warmup_report)
+
+
+metrics.register("warmup", warmup_snapshot)
+
+
+async def time_to_first_token(
+    client: httpx.AsyncClient,
+    base_url: str,
+    model: str,
+    keep_alive: Union[int, str, None],
+) -> tuple:
+    """
+    Streams a one-token generation and returns (seconds to the first chunk,
+    Ollama's model load seconds).
+    """
+    body = {
+        "model": model,
+        "prompt": WARMUP_PROMPT,
+        "stream": True,
+        "options": {"num_predict": 1},
+    }
+    if keep_alive is not None:
+        body["keep_alive"] = keep_alive
+    start = time.perf_counter()
+    first_chunk = None
+    last_line = ""
+    async with client.stream("POST", f"{base_url}/api/generate", json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+            last_line = line or last_line
+    # The final chunk carries the timings, in nanoseconds
+    load_duration = json.loads(last_line).get("load_duration", 0) if last_line else 0
+    return first_chunk or time.perf_counter() - start, load_duration / 1e9
+
+
+async def time_embedding(
+    client: httpx.AsyncClient,
+    base_url: str,
+    model: str,
+    keep_alive: Union[int, str, None],
+) -> tuple:
+    """Embeds one short text and returns (seconds, Ollama's model load seconds)"""
+    body = {"model": model, "input": WARMUP_PROMPT}
+    if keep_alive is not None:
+        body["keep_alive"] = keep_alive
+    start = time.perf_counter()
+    response = await client.post(f"{base_url}/api/embed", json=body)
+    response.raise_for_status()
+    return time.perf_counter() - start, response.json().get("load_duration", 0) / 1e9
+
+
+async def warm_up_model(
+    client: httpx.AsyncClient,
+    base_url: str,
+    model: str,
+    keep_alive: Union[int, str, None],
+    embedding: bool = False,
+    name: Optional[str] = None,
+) -> dict:
+    """
+    Loads a model with a tiny request, then repeats it once it is resident,
+    and records both latencies: the cold one includes the model load, the
+    warm one is what requests see while `keep_alive` keeps the model loaded.
+    """
+    measure = time_embedding if embedding else time_to_first_token
+    name = name or model
+    try:
+        cold, load = await measure(client, base_url, model, keep_alive)
+        warm, _ = await measure(client, base_url, model, keep_alive)
+    except Exception as e:
+        print(f"⚠️ [WARMUP] Could not warm up '{name}': {e}")
+        report = {"ok": False, "error": str(e)}
+    else:
+        label = "latency" if embedding else "TTFT"
+        print(
+            f"🔥 [WARMUP] {name}: cold {label} {cold * 1000:.0f} ms "
+            f"(load {load * 1000:.0f} ms), warm {label} {warm * 1000:.0f} ms"
+        )
+        report = {
+            "ok": True,
+            "cold_ms": round(cold * 1000, 1),
+            "warm_ms": round(warm * 1000, 1),
+            "load_ms": round(load * 1000, 1),
+        }
+    warmup_report[name] = report
+    return report
+
+
+async def warm_up(
+    pool: OllamaConnectionPool,
+    base_urls: Union[str, List[str]],
+    chat_models: List[str],
+    embedding_models: List[str] = (),
+    keep_alive: Union[int, str, None] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> Dict[str, dict]:
+    """
+    Preloads every model the graph uses on every backend, concurrently, so
+    the first requests after a deploy (or an unload) do not pay the model
+    load. Reports are keyed by model, or by "model@backend" when there are
+    several backends.
+
+    Failures are reported but never raised: the API still starts, and the
+    model is loaded by its first request instead.
+
+    The requests go through `client`, by default a direct client on `pool`.
+    """
+    if isinstance(base_urls, str):
+        base_urls = [base_urls]
+    client = client or pool.direct_client()
+    runs = {}
+    for base_url in base_urls:
+        base_url = base_url.rstrip("/")
+        for model in [*chat_models, *embedding_models]:
+            key = model if len(base_urls) == 1 else f"{model}@{base_url}"
+            runs[key] = warm_up_model(
+                client, base_url, model, keep_alive, model in embedding_models, key
+            )
+    reports = await asyncio.gather(*runs.values())
+    return dict(zip(runs, reports))
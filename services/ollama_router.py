@@ -0,0 +1,273 @@
+# services/ollama_router.py
+import asyncio
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, List, Optional, Sequence
+
+import httpx
+
+from services.llm_scheduler import Overloaded, ReleasingStream, backend_name
+from utils import metrics
+
+# Errors raised before the request reached the backend, safe to retry elsewhere
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+# Request extension naming a backend to avoid, e.g. the one a hedged request
+# is already waiting on
+AVOID_BACKEND = "avoid_backend"
+
+current_affinity: ContextVar[Optional[str]] = ContextVar("llm_affinity", default=None)
+
+
+@contextmanager
+def llm_affinity(key: Optional[str]):
+    """Routes the LLM calls made inside the block by the affinity `key`"""
+    token = current_affinity.set(key)
+    try:
+        yield
+    finally:
+        current_affinity.reset(token)
+
+
+def api_path(path: str) -> str:
+    """The Ollama API part of a request path, without any gateway prefix"""
+    index = path.find("/api/")
+    return path[index:] if index >= 0 else path
+
+
+def rendezvous_score(key: str, backend: str) -> int:
+    """Highest random weight hashing: every process ranks backends alike"""
+    digest = hashlib.blake2b(f"{key}|{backend}".encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big")
+
+
+class Backend:
+    """One Ollama host and its routing state"""
+
+    def __init__(self, url: str):
+        self.url = httpx.URL(url.rstrip("/"))
+        self.name = backend_name(self.url)
+        # Path prefix of a backend behind a gateway, e.g. "/ollama"
+        self.path = self.url.path.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.stats = metrics.Counters("requests", "failures", "ejections")
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def endpoint(self, path: str) -> httpx.URL:
+        """URL of the Ollama API `path` on this backend"""
+        return self.url.copy_with(path=self.path + api_path(path))
+
+
+class OllamaRouter:
+    """
+    Spreads Ollama requests over several backends.
+
+    Requests go to the available backend with the fewest outstanding
+    requests. Requests with an affinity key (the conversation) prefer the
+    backend the key hashes to, so its prompt cache stays useful, unless that
+    backend has more than `affinity_slack` requests above the least loaded.
+
+    A backend is ejected for `ejection_time` seconds after `max_failures`
+    consecutive connection errors or 5xx responses (passive checks), and is
+    marked down or back up by the periodic health checks (active checks).
+    When every backend is down, requests are still tried rather than failed
+    outright.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        affinity_slack: int = 2,
+        max_failures: int = 3,
+        ejection_time: float = 30.0,
+    ):
+        if not urls:
+            raise ValueError("At least one Ollama backend URL is required")
+        self.backends = [Backend(url) for url in urls]
+        self.affinity_slack = affinity_slack
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.stats = metrics.Counters(
+            "affinity_hits",
+            "affinity_misses",
+            "retries",
+            "overload_retries",
+            "no_backend_available",
+        )
+
+    def choose(
+        self, key: Optional[str] = None, exclude: Iterable[Backend] = ()
+    ) -> Backend:
+        """Returns the backend for a request, skipping the `exclude`d ones"""
+        now = time.monotonic()
+        remaining = [backend for backend in self.backends if backend not in exclude]
+        candidates = [backend for backend in remaining if backend.available(now)]
+        if not candidates:
+            self.stats.incr("no_backend_available")
+            candidates = remaining or self.backends
+
+        least = min(candidates, key=lambda backend: backend.outstanding)
+        if key is None:
+            return least
+        preferred = max(
+            candidates, key=lambda backend: rendezvous_score(key, backend.name)
+        )
+        if preferred.outstanding <= least.outstanding + self.affinity_slack:
+            self.stats.incr("affinity_hits")
+            return preferred
+        self.stats.incr("affinity_misses")
+        return least
+
+    def any_available(self, exclude: Iterable[Backend] = ()) -> bool:
+        """Whether a backend other than the `exclude`d ones can take a request"""
+        now = time.monotonic()
+        return any(
+            backend.available(now)
+            for backend in self.backends
+            if backend not in exclude
+        )
+
+    def succeeded(self, backend: Backend):
+        backend.failures = 0
+
+    def failed(self, backend: Backend, reason: str):
+        backend.failures += 1
+        backend.stats.incr("failures")
+        if backend.failures >= self.max_failures and backend.available(
+            time.monotonic()
+        ):
+            backend.ejected_until = time.monotonic() + self.ejection_time
+            backend.stats.incr("ejections")
+            print(
+                f"🚫 [ROUTER] Ejected {backend.name} for {self.ejection_time:.0f}s "
+                f"after {backend.failures} failures ({reason})."
+            )
+
+    async def check_health(self, client: httpx.AsyncClient, timeout: float = 2.0):
+        """Probes every backend once and marks it up or down"""
+
+        async def check(backend: Backend):
+            try:
+                response = await client.get(
+                    str(backend.endpoint("/api/version")), timeout=timeout
+                )
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if healthy and not backend.healthy:
+                print(f"✅ [ROUTER] {backend.name} is healthy again.")
+            elif not healthy and backend.healthy:
+                print(f"⚠️ [ROUTER] {backend.name} failed its health check.")
+            backend.healthy = healthy
+            if healthy:
+                # A passing check ends an ejection early
+                backend.failures = 0
+                backend.ejected_until = 0.0
+
+        await asyncio.gather(*(check(backend) for backend in self.backends))
+
+    async def check_periodically(self, client: httpx.AsyncClient, interval: float):
+        """Runs the health checks every `interval` seconds until cancelled"""
+        while True:
+            await self.check_health(client)
+            await asyncio.sleep(interval)
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        now = time.monotonic()
+        snapshot["backends"] = {
+            backend.name: {
+                **backend.stats.snapshot(),
+                "outstanding": backend.outstanding,
+                "healthy": backend.healthy,
+                "ejected": now < backend.ejected_until,
+            }
+            for backend in self.backends
+        }
+        return snapshot
+
+
+class RoutingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that sends each request to the backend an OllamaRouter
+    picks, whatever host the client was configured with.
+
+    Connection errors are retried on the other backends, since the request
+    never reached the failed one, and so are `Overloaded` rejections while
+    another healthy backend is left. The backend named by the `AVOID_BACKEND`
+    request extension is only used when no other is left. A backend counts a
+    request as outstanding until its response is closed.
+
+    The request keeps its Ollama API path (`/api/...`) and gets the chosen
+    backend's path prefix, so backends behind a gateway path work.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, router: OllamaRouter):
+        self.transport = transport
+        self.router = router
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = current_affinity.get()
+        avoid = request.extensions.get(AVOID_BACKEND)
+        tried: List[Backend] = [
+            backend for backend in self.router.backends if backend.name == avoid
+        ]
+        while True:
+            backend = self.router.choose(key, tried)
+            backend.stats.incr("requests")
+            self._route(request, backend)
+            backend.outstanding += 1
+            try:
+                response = await self.transport.handle_async_request(request)
+            except CONNECT_ERRORS as e:
+                backend.outstanding -= 1
+                self.router.failed(backend, type(e).__name__)
+                tried.append(backend)
+                if len(tried) < len(self.router.backends):
+                    self.router.stats.incr("retries")
+                    continue
+                raise
+            except Overloaded:
+                # Rejected before it was sent: not a failure of the backend
+                backend.outstanding -= 1
+                tried.append(backend)
+                if self.router.any_available(tried):
+                    self.router.stats.incr("overload_retries")
+                    continue
+                raise
+            except BaseException:
+                backend.outstanding -= 1
+                raise
+
+            if response.status_code >= 500:
+                self.router.failed(backend, f"HTTP {response.status_code}")
+            else:
+                self.router.succeeded(backend)
+            response.stream = ReleasingStream(
+                response.stream, lambda: self._release(backend)
+            )
+            return response
+
+    @staticmethod
+    def _route(request: httpx.Request, backend: Backend):
+        request.url = request.url.copy_with(
+            scheme=backend.url.scheme,
+            host=backend.url.host,
+            port=backend.url.port,
+            path=backend.path + api_path(request.url.path),
+        )
+        request.headers["Host"] = request.url.netloc.decode("ascii")
+
+    @staticmethod
+    def _release(backend: Backend):
+        backend.outstanding -= 1
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.messages import BaseMessage
+
+from utils import metrics
+
+# Rough per-message overhead on top of the content (ids, type, metadata)
+MESSAGE_OVERHEAD_BYTES = 256
+
+
+def estimate_size(messages: List[BaseMessage]) -> int:
+    """Estimates the memory footprint of a message list in bytes"""
+    return sum(
+        len(str(message.content).encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+        for message in messages
+    )
+
+
+class ConversationStateCache:
+    """
+    Write-through LRU cache of recent conversation histories.
+
+    Entries are keyed by thread_id and tagged with the checkpoint ID they
+    were read from or written as. A lookup only hits when that ID still
+    matches the latest checkpoint, so another worker writing the same
+    thread invalidates the entry.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = metrics.Counters("hits", "misses", "stale", "evictions")
+
+    def get(
+        self, thread_id: str, checkpoint_id: Optional[str]
+    ) -> Optional[List[BaseMessage]]:
+        """Returns a copy of the cached history if it is still current"""
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is None or checkpoint_id is None:
+                self.stats.incr("misses")
+                return None
+
+            cached_id, messages, _ = entry
+            if cached_id != checkpoint_id:
+                self._remove(thread_id)
+                self.stats.incr("stale")
+                self.stats.incr("misses")
+                return None
+
+            self._entries.move_to_end(thread_id)
+            self.stats.incr("hits")
+            return list(messages)
+
+    def put(
+        self, thread_id: str, checkpoint_id: Optional[str], messages: List[BaseMessage]
+    ):
+        """Stores the history written as `checkpoint_id`"""
+        size = estimate_size(messages)
+        with self._lock:
+            self._remove(thread_id)
+            if checkpoint_id is None or size > self.max_bytes:
+                return
+
+            self._entries[thread_id] = (checkpoint_id, list(messages), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats.incr("evictions")
+
+    def invalidate(self, thread_id: str):
+        with self._lock:
+            self._remove(thread_id)
+
+    def _remove(self, thread_id: str):
+        entry = self._entries.pop(thread_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        snapshot["entries"] = len(self._entries)
+        snapshot["bytes"] = self._bytes
+        snapshot["hit_rate"] = metrics.ratio(
+            snapshot["hits"], snapshot["hits"] + snapshot["misses"]
+        )
+        return snapshot
@@ -0,0 +1,493 @@
+"""
+Tests for the agent graph execution strategies
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agents.context_manager import context_node, history_window, token_counter
+from agents.fanout import fanout_stats, plan_workers, with_timeout
+from agents.graph.agents_graph import graph_builder, router
+from agents.intent_classifier import IntentClassifier
+from agents.prompt_prefix import (
+    final_messages,
+    prompt_cache_stats,
+    record_prompt_usage,
+    stable_prefix,
+)
+from agents.speculation import (
+    create_speculative_planner_node,
+    speculation_snapshot,
+    speculation_stats,
+)
+from agents.synthesizer_agent import synthesizer_node
+from agents.transcript_cache import TranscriptCache
+from config.graph_config import graph_config
+from models.ai_models import merge_results
+from services.deadlines import DeadlineExceeded
+from services.llm_scheduler import (
+    Overloaded,
+    Priority,
+    current_priority,
+    with_priority,
+)
+
+
+def make_planner(tasks, delay=0.01):
+    async def planner(state):
+        await asyncio.sleep(delay)
+        return {"tasks": tasks}
+
+    return planner
+
+
+class TestSpeculativePlanner:
+    """Tests for the speculative planner wrapper"""
+
+    def setup_method(self):
+        speculation_stats.reset()
+
+    @pytest.mark.asyncio
+    async def test_hit_keeps_speculative_result(self):
+        """Test that a confirmed guess keeps the worker result"""
+
+        async def chat(state):
+            return {"results": ["chat answer"]}
+
+        node = create_speculative_planner_node(
+            make_planner(["chat_agent"]), {"chat_agent": chat}
+        )
+        update = await node({"messages": []})
+
+        assert update["tasks"] == ["chat_agent"]
+        assert update["results"] == ["chat answer"]
+        assert update["speculated"] == ["chat_agent"]
+        assert speculation_stats["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_miss_cancels_speculative_worker(self):
+        """Test that a rejected guess is cancelled and discarded"""
+        cancelled = asyncio.Event()
+
+        async def slow_chat(state):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return {"results": ["never"]}
+
+        node = create_speculative_planner_node(
+            make_planner(["joke_agent"]), {"chat_agent": slow_chat}
+        )
+        update = await node({"messages": []})
+
+        assert "results" not in update
+        assert update["speculated"] == []
+        assert cancelled.is_set()
+        assert speculation_snapshot()["hit_rate"] == 0.0
+
+    @pytest.mark.asyncio
+    async def test_worker_runs_in_parallel_with_planner(self):
+        """Test that the worker does not wait for the planner"""
+
+        async def chat(state):
+            await asyncio.sleep(0.05)
+            return {"results": ["ok"]}
+
+        node = create_speculative_planner_node(
+            make_planner(["chat_agent"], delay=0.05), {"chat_agent": chat}
+        )
+        start = asyncio.get_running_loop().time()
+        await node({"messages": []})
+        elapsed = asyncio.get_running_loop().time() - start
+
+        assert elapsed < 0.09
+
+    @pytest.mark.asyncio
+    async def test_failed_speculation_is_left_to_router(self):
+        """Test that a failing speculative worker is not marked as done"""
+
+        async def broken_chat(state):
+            raise RuntimeError("boom")
+
+        node = create_speculative_planner_node(
+            make_planner(["chat_agent"]), {"chat_agent": broken_chat}
+        )
+        update = await node({"messages": []})
+
+        assert update["speculated"] == []
+        assert speculation_stats["failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_speculative_worker_is_bounded_by_the_timeout(self):
+        """Test that a slow speculative worker times out like a graph worker"""
+
+        async def slow_chat(state):
+            await asyncio.sleep(10)
+            return {"results": ["never"]}
+
+        node = create_speculative_planner_node(
+            make_planner(["chat_agent"]), {"chat_agent": slow_chat}, timeout=0.05
+        )
+        update = await asyncio.wait_for(node({"messages": []}), 1)
+
+        assert "results" not in update
+        assert update["speculated"] == []
+        assert speculation_stats["failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_speculative_worker_runs_at_worker_priority(self):
+        """Test that the guessed worker does not inherit the planner's priority"""
+        seen = []
+
+        async def chat(state):
+            seen.append(current_priority.get())
+            return {"results": ["ok"]}
+
+        node = with_priority(
+            create_speculative_planner_node(
+                make_planner(["chat_agent"]), {"chat_agent": chat}
+            ),
+            Priority.PLANNER,
+        )
+        await node({"messages": []})
+
+        assert seen == [Priority.WORKER]
+
+    def test_unknown_worker(self):
+        """Test that an unknown guess is rejected"""
+        with pytest.raises(ValueError, match="Unknown speculative worker"):
+            create_speculative_planner_node(make_planner([]), {}, "nope")
+
+
+class TestFanOut:
+    """Tests for the parallel fan-out to planned workers"""
+
+    def setup_method(self):
+        fanout_stats.reset()
+
+    def test_router_fans_out_to_every_planned_worker(self):
+        """Test that both workers are routed when both are planned"""
+        state = {"tasks": ["chat_agent", "joke_agent"], "speculated": []}
+        assert router(state) == ["chat_agent", "joke_agent"]
+
+    def test_router_defaults_to_chat(self):
+        """Test that an empty or unknown plan falls back to the chat agent"""
+        assert router({"tasks": ["unknown"]}) == ["chat_agent"]
+        assert router({"tasks": []}) == ["chat_agent"]
+
+    def test_synthesizer_waits_for_every_branch(self):
+        """Test that the synthesizer joins branches that end in different supersteps"""
+        assert graph_builder.nodes["synthesizer"].defer
+
+    def test_plan_workers_removes_duplicates(self):
+        """Test that repeated tasks only run once"""
+        workers = plan_workers(["joke_agent", "joke_agent"], ["joke_agent"], "x")
+        assert workers == ["joke_agent"]
+
+    def test_merge_results(self):
+        """Test that results append and that None resets them"""
+        assert merge_results(["a"], ["b"]) == ["a", "b"]
+        assert merge_results(["a"], None) == []
+
+    @pytest.mark.asyncio
+    async def test_timeout_returns_partial_result(self):
+        """Test that a slow branch contributes nothing instead of blocking"""
+
+        async def slow(state):
+            await asyncio.sleep(10)
+            return {"results": ["late"]}
+
+        update = await with_timeout("slow", slow, 0.01)({})
+
+        assert update == {}
+        assert fanout_stats["timeouts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failing_branch_is_skipped(self):
+        """Test that an erroring branch contributes nothing"""
+
+        async def broken(state):
+            raise RuntimeError("boom")
+
+        assert await with_timeout("broken", broken, 1)({}) == {}
+        assert fanout_stats["errors"] == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "error", [DeadlineExceeded("chat_agent", 0.0), Overloaded("b", 1.0)]
+    )
+    async def test_deadline_and_overload_fail_the_turn(self, error):
+        """Test that a missed deadline or an overload is not turned into a partial answer"""
+
+        async def rejected(state):
+            raise error
+
+        with pytest.raises(type(error)):
+            await with_timeout("chat_agent", rejected, 1)({})
+
+    @pytest.mark.asyncio
+    async def test_branches_run_concurrently(self):
+        """Test that two branches cost max(latencies), not their sum"""
+
+        async def worker(state):
+            await asyncio.sleep(0.05)
+            return {"results": ["ok"]}
+
+        branches = [with_timeout(f"w{i}", worker, 1) for i in range(2)]
+        start = asyncio.get_running_loop().time()
+        updates = await asyncio.gather(*(branch({}) for branch in branches))
+        elapsed = asyncio.get_running_loop().time() - start
+
+        assert [u["results"] for u in updates] == [["ok"], ["ok"]]
+        assert elapsed < 0.09
+
+
+class TestIntentClassifier:
+    """Tests for the local routing stage in front of the planner"""
+
+    def test_joke_rule_bypasses_planner(self):
+        """Test that an obvious joke request is routed locally"""
+        classifier = IntentClassifier()
+        plan = classifier.route("Tell me a joke about cats")
+
+        assert plan.tasks == ["joke_agent"]
+        assert classifier.snapshot()["bypass_rate"] == 1.0
+
+    @pytest.mark.parametrize(
+        "message",
+        ["Can you tell me a pun?", "make me laugh", "Please give me 3 dad jokes"],
+    )
+    def test_joke_requests_bypass_planner(self, message):
+        """Test that requests for a joke are routed to the joke agent"""
+        assert IntentClassifier().route(message).tasks == ["joke_agent"]
+
+    @pytest.mark.parametrize(
+        "message",
+        [
+            "what is a pun?",
+            "explain why this error is funny",
+            "tell me why this joke is funny",
+            "how do comedians tell a joke",
+        ],
+    )
+    def test_mentioning_a_joke_is_left_to_the_planner(self, message):
+        """Test that messages that only mention jokes are not routed locally"""
+        classifier = IntentClassifier()
+
+        assert classifier.route(message) is None
+        assert classifier.classify(message).confidence < classifier.threshold
+
+    def test_greeting_rule(self):
+        """Test that a bare greeting is routed to the chat agent"""
+        assert IntentClassifier().route("Hello!").tasks == ["chat_agent"]
+
+    def test_unknown_message_falls_back(self):
+        """Test that an unclear message is left to the LLM planner"""
+        classifier = IntentClassifier()
+
+        assert classifier.route("What did I say my name was?") is None
+        assert classifier.snapshot()["bypassed"] == 0
+
+    def test_mixed_request_is_left_to_the_planner(self):
+        """Test that a joke asked together with another request is not routed locally"""
+        classifier = IntentClassifier()
+
+        assert classifier.route("Tell me a joke and explain RAG") is None
+        assert classifier.classify("Tell me a joke and explain RAG").confidence < 0.9
+
+    @pytest.mark.asyncio
+    async def test_ngram_model_trained_from_log(self, tmp_path):
+        """Test that logged plan decisions train the n-gram model"""
+        log_path = str(tmp_path / "plans.jsonl")
+        writer = IntentClassifier(rules=[], log_path=log_path)
+        for i in range(15):
+            await writer.log_decision(
+                f"what is the capital of country {i}", ["chat_agent"]
+            )
+            await writer.log_decision(
+                f"say something silly about topic {i}", ["joke_agent"]
+            )
+
+        classifier = IntentClassifier.from_log(log_path, rules=[], threshold=0.8)
+
+        assert classifier.snapshot()["ngram_examples"] == 30
+        assert classifier.route("what is the capital of france").tasks == ["chat_agent"]
+        assert classifier.route("say something silly").tasks == ["joke_agent"]
+
+    @pytest.mark.asyncio
+    async def test_log_is_rotated(self, tmp_path):
+        """Test that a full decision log is rotated and both files still train"""
+        log_path = str(tmp_path / "plans.jsonl")
+        writer = IntentClassifier(rules=[], log_path=log_path, max_log_bytes=1500)
+        for i in range(30):
+            await writer.log_decision(
+                f"what is the capital of country {i}", ["chat_agent"]
+            )
+
+        assert (tmp_path / "plans.jsonl.1").exists()
+        assert (tmp_path / "plans.jsonl").stat().st_size < 1500
+        classifier = IntentClassifier.from_log(log_path, rules=[])
+        assert classifier.snapshot()["ngram_examples"] == 30
+
+    def test_small_log_is_ignored(self, tmp_path):
+        """Test that too few logged decisions do not train a model"""
+        log_path = tmp_path / "plans.jsonl"
+        log_path.write_text('{"message": "hi there", "tasks": ["chat_agent"]}\n')
+
+        classifier = IntentClassifier.from_log(str(log_path), rules=[])
+
+        assert classifier.model is None
+
+
+class TestContextWindow:
+    """Tests for token-budgeted history windowing and the running summary"""
+
+    @staticmethod
+    def conversation(turns):
+        return [
+            HumanMessage(content=f"message {i} " + "word " * 20) for i in range(turns)
+        ]
+
+    @pytest.fixture
+    def small_budget(self, monkeypatch):
+        monkeypatch.setattr(graph_config, "context_window", True)
+        monkeypatch.setattr(graph_config, "chat_token_budget", 100)
+        monkeypatch.setattr(graph_config, "synthesizer_token_budget", 100)
+        monkeypatch.setattr(graph_config, "summary_target_ratio", 0.5)
+
+    def test_window_fits_budget(self, small_budget):
+        """Test that the window keeps only the recent messages within budget"""
+        state = {"messages": self.conversation(10)}
+        window = history_window(state, 100)
+
+        assert window[-1] is state["messages"][-1]
+        assert token_counter.count_messages(window) <= 100
+        assert len(window) < 10
+
+    @pytest.mark.asyncio
+    async def test_no_summary_while_window_fits(self, small_budget):
+        """Test that short conversations never call the summarizer"""
+        with patch("agents.context_manager.llm") as llm:
+            update = await context_node({"messages": self.conversation(2)})
+
+        assert update == {}
+        llm.ainvoke.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_overflow_folds_old_messages(self, small_budget):
+        """Test that an overflow folds the oldest messages into the summary"""
+        state = {"messages": self.conversation(10)}
+        with patch("agents.context_manager.llm") as llm:
+            llm.ainvoke = AsyncMock(return_value=AIMessage(content="User chatted."))
+            update = await context_node(state)
+
+        assert update["summary"] == "User chatted."
+        state.update(update)
+        window = history_window(state, 100)
+        assert token_counter.count_messages(window) <= 50
+        assert state["messages"][update["summarized_count"]] is window[0]
+
+
+class TestTranscriptCache:
+    """Tests for incremental transcript rendering in the synthesizer"""
+
+    def test_only_new_messages_are_rendered(self):
+        """Test that a follow-up turn formats only the added messages"""
+        cache = TranscriptCache()
+        messages = [
+            HumanMessage(content="hi", id="1"),
+            AIMessage(content="hey", id="2"),
+        ]
+        cache.segments("t1", messages)
+
+        messages.append(HumanMessage(content="joke?", id="3"))
+        segments = cache.segments("t1", messages)
+
+        assert segments == ["User: hi\n", "Assistant: hey\n", "User: joke?\n"]
+        assert cache.snapshot()["rendered_messages"] == 3
+
+    def test_diverged_history_is_rebuilt(self):
+        """Test that a history that no longer matches is rendered from scratch"""
+        cache = TranscriptCache()
+        cache.segments("t1", [HumanMessage(content="old", id="1")])
+        segments = cache.segments("t1", [HumanMessage(content="new", id="9")])
+
+        assert segments == ["User: new\n"]
+        assert cache.snapshot()["rebuilds"] == 1
+
+    def test_returned_segments_are_a_copy(self):
+        """Test that changing the returned segments leaves the cache intact"""
+        cache = TranscriptCache()
+        messages = [HumanMessage(content="hi", id="1")]
+        cache.segments("t1", messages).append("User: injected\n")
+
+        assert cache.segments("t1", messages) == ["User: hi\n"]
+
+    def test_only_the_requested_window_is_returned(self):
+        """Test that segments before `start` are not returned"""
+        cache = TranscriptCache()
+        messages = [HumanMessage(content=str(i), id=str(i)) for i in range(5)]
+
+        assert cache.segments("t1", messages, start=3) == ["User: 3\n", "User: 4\n"]
+        assert cache.segments("t1", messages, start=5) == []
+
+    @pytest.mark.asyncio
+    async def test_synthesizer_prompt_contains_window(self):
+        """Test that the final prompt joins the rendered history and results"""
+        state = {
+            "messages": [HumanMessage(content="hi", id="1")],
+            "results": ["Hello there"],
+        }
+        update = await synthesizer_node(state, {"configurable": {"thread_id": "s"}})
+
+        assert "User: hi\n" in update["results"][0]
+        assert "Hello there" in update["results"][0]
+
+
+class TestStablePromptPrefix:
+    """Tests for the append-only prompt layout used for KV-cache reuse"""
+
+    @pytest.fixture
+    def stable_layout(self, monkeypatch):
+        monkeypatch.setattr(graph_config, "stable_prompt_prefix", True)
+        monkeypatch.setattr(graph_config, "chat_token_budget", 2048)
+
+    @pytest.mark.asyncio
+    async def test_prefix_is_append_only_across_turns(self, stable_layout):
+        """Test that the final prompt and the next turn extend the chat prompt"""
+        state = {
+            "messages": [HumanMessage(content="hi", id="1")],
+            "results": ["Hello there"],
+        }
+        chat_prompt = stable_prefix(state)
+        update = await synthesizer_node(state, {"configurable": {"thread_id": "p"}})
+        final_prompt = final_messages(state, update["results"][0])
+
+        assert final_prompt[: len(chat_prompt)] == chat_prompt
+        assert "Hello there" in final_prompt[-1].content
+
+        state["messages"] = state["messages"] + [
+            AIMessage(content="hey", id="2"),
+            HumanMessage(content="joke?", id="3"),
+        ]
+        assert stable_prefix(state)[: len(chat_prompt)] == chat_prompt
+
+    def test_cached_tokens_from_prompt_eval_count(self):
+        """Test that tokens Ollama did not evaluate are estimated as cached"""
+        prompt_cache_stats.reset()
+        prompt = "word " * 100
+        record_prompt_usage(prompt, {"prompt_eval_count": 10})
+        record_prompt_usage(prompt, {})
+
+        snapshot = prompt_cache_stats.snapshot()
+        assert snapshot["calls"] == 1
+        assert snapshot["evaluated_tokens"] == 10
+        assert (
+            snapshot["estimated_cached_tokens"]
+            == snapshot["estimated_prompt_tokens"] - 10
+        )
@@ -0,0 +1,60 @@
+"""
+Tests for the content-addressed embedding cache
+"""
+
+import numpy as np
+import pytest
+
+from rag.embedding_cache import CachedEmbedder, EmbeddingCache, content_key
+
+
+class CountingEmbedder:
+    model = "fake"
+
+    def __init__(self):
+        self.calls = []
+
+    async def embed(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    async def aclose(self):
+        pass
+
+
+class TestEmbeddingCache:
+    """Tests for cached, batched embedding lookups"""
+
+    def test_key_ignores_whitespace_but_not_model(self):
+        """Test that keys hash the normalized text together with the model"""
+        assert content_key("m", "Hello   world\n") == content_key("m", "Hello world")
+        assert content_key("m", "hello") != content_key("other", "hello")
+
+    @pytest.mark.asyncio
+    async def test_only_unique_misses_are_embedded(self):
+        """Test that cached and duplicate texts are not sent again"""
+        inner = CountingEmbedder()
+        embedder = CachedEmbedder(inner, EmbeddingCache())
+
+        await embedder.embed(["a", "bb"])
+        vectors = await embedder.embed(["bb", "ccc", "ccc", "a"])
+
+        assert inner.calls == [["a", "bb"], ["ccc"]]
+        assert vectors[:, 0].tolist() == [2, 3, 3, 1]
+        assert embedder.cache.snapshot()["memory_hits"] == 2
+
+    @pytest.mark.asyncio
+    async def test_vectors_persist_on_disk(self, tmp_path):
+        """Test that a new process reads the vectors back from SQLite"""
+        path = str(tmp_path / "cache.sqlite3")
+        first = CachedEmbedder(CountingEmbedder(), EmbeddingCache(path))
+        await first.embed(["persisted text"])
+        await first.aclose()
+
+        inner = CountingEmbedder()
+        second = CachedEmbedder(inner, EmbeddingCache(path))
+        vector = await second.embed(["persisted  text"])
+
+        assert inner.calls == []
+        assert vector.tolist() == [[14.0, 1.0]]
+        assert second.cache.snapshot()["disk_hits"] == 1
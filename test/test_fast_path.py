@@ -0,0 +1,80 @@
+"""
+Tests for the single-generation fast path
+"""
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from services.fast_path import WorkerStreamMux, stream_worker_output
+
+WORKERS = ["chat_agent", "joke_agent"]
+
+
+def token(text, worker, node=None):
+    metadata = {"tags": [worker], "langgraph_node": node or worker}
+    return ("messages", (AIMessageChunk(content=text), metadata))
+
+
+def update(node, **values):
+    return ("updates", {node: values})
+
+
+async def collect(events):
+    async def aiter():
+        for event in events:
+            yield event
+
+    return "".join([text async for text in stream_worker_output(aiter(), WORKERS)])
+
+
+class TestWorkerStreamMux:
+    """Tests for merging the worker token streams"""
+
+    @pytest.mark.asyncio
+    async def test_single_worker_is_streamed_as_generated(self):
+        """Test that the tokens of a single worker are forwarded in order"""
+        events = [
+            update("planner", tasks=["chat_agent"]),
+            token("Hel", "chat_agent"),
+            token("lo", "chat_agent"),
+            update("chat_agent", results=["Hello"]),
+        ]
+        assert await collect(events) == "Hello"
+
+    @pytest.mark.asyncio
+    async def test_parallel_workers_are_not_interleaved(self):
+        """Test that a second worker is buffered until the live one finishes"""
+        events = [
+            token("A1", "chat_agent"),
+            token("B1", "joke_agent"),
+            token("A2", "chat_agent"),
+            token("B2", "joke_agent"),
+            update("joke_agent", results=["B1B2"]),
+            update("chat_agent", results=["A1A2"]),
+        ]
+        assert await collect(events) == "A1A2\n\nB1B2"
+
+    @pytest.mark.asyncio
+    async def test_speculative_tokens_wait_for_the_plan(self):
+        """Test that speculative tokens are only emitted on a hit"""
+        mux = WorkerStreamMux(WORKERS)
+
+        assert mux.on_token("chat_agent", "Hi", speculative=True) == []
+        assert mux.on_update("planner", {"speculated": ["chat_agent"]}) == ["Hi"]
+
+    @pytest.mark.asyncio
+    async def test_speculative_tokens_are_dropped_on_miss(self):
+        """Test that a cancelled speculative worker never reaches the client"""
+        events = [
+            token("wrong", "chat_agent", node="planner"),
+            update("planner", tasks=["joke_agent"], speculated=[]),
+            token("Joke", "joke_agent"),
+            update("joke_agent", results=["Joke"]),
+        ]
+        assert await collect(events) == "Joke"
+
+    @pytest.mark.asyncio
+    async def test_non_streamed_result_is_used(self):
+        """Test that a worker that did not stream falls back to its result"""
+        events = [update("joke_agent", results=["cached joke"])]
+        assert await collect(events) == "cached joke"
@@ -0,0 +1,198 @@
+"""
+Tests for the document ingestion pipeline, against a local fake embedding server
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+import rag.ingest
+from rag.documents import chunk_text
+from rag.embedding_cache import CachedEmbedder, EmbeddingCache
+from rag.embeddings import OllamaEmbedder
+from rag.index import VectorIndex
+from rag.ingest import ingest
+
+DIM = 8
+
+
+def fake_embedding(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [byte / 255 - 0.5 for byte in digest[:DIM]]
+
+
+class FakeEmbeddingServer:
+    """Serves Ollama's /api/embed with deterministic vectors and tracks concurrency"""
+
+    def __init__(self, delay=0.01):
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                time.sleep(delay)
+                payload = json.dumps(
+                    {"embeddings": [fake_embedding(text) for text in body["input"]]}
+                ).encode()
+                with lock:
+                    server.in_flight -= 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def embedding_server():
+    server = FakeEmbeddingServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "nested").mkdir(parents=True)
+    for i in range(20):
+        folder = docs / "nested" if i % 2 else docs
+        (folder / f"doc{i}.md").write_text(
+            f"# Document {i}\n\n" + f"Paragraph about topic {i}. " * 40
+        )
+    (docs / "image.png").write_bytes(b"\x89PNG")
+    return docs
+
+
+class TestChunking:
+    """Tests for document chunking"""
+
+    def test_chunks_are_bounded_and_overlap(self):
+        """Test that chunks respect the size limit and share some text"""
+        text = " ".join(f"word{i}" for i in range(500))
+        chunks = chunk_text(text, chunk_size=200, overlap=40)
+
+        assert all(len(chunk) <= 200 for chunk in chunks)
+        assert chunks[0].split()[-1] in chunks[1]
+        assert chunks[-1].endswith("word499")
+
+
+class TestIngest:
+    """Tests for the streaming ingestion pipeline"""
+
+    def test_peak_rss_is_unavailable_without_resource(self, monkeypatch):
+        """Test that platforms without the resource module report no peak RSS"""
+        monkeypatch.setattr(rag.ingest, "resource", None)
+        assert rag.ingest.peak_rss_mb() is None
+
+    @pytest.mark.asyncio
+    async def test_corpus_is_indexed(self, corpus, tmp_path, embedding_server):
+        """Test that every chunk is embedded in batches and searchable"""
+        embedder = OllamaEmbedder(embedding_server.url, "fake", max_in_flight=2)
+        index_path = str(tmp_path / "index")
+        stats = await ingest(
+            [str(corpus)],
+            index_path,
+            embedder=embedder,
+            workers=2,
+            chunk_size=300,
+            chunk_overlap=50,
+            batch_size=8,
+            write_batch_size=32,
+        )
+        await embedder.aclose()
+
+        index = VectorIndex(index_path)
+        assert stats.files == 20
+        assert stats.chunks == stats.embeddings == len(index)
+        assert embedding_server.requests == -(-stats.chunks // 8)
+        assert embedding_server.max_in_flight <= 2
+        assert stats.chunks_per_second > 0 and stats.peak_rss_mb > 0
+
+        record = index.snapshot().hits([5], [0.0])[0]
+        hit = index.search(np.array([fake_embedding(record["text"])]), 1)[0][0]
+        assert hit["text"] == record["text"] and hit["source"].endswith(".md")
+
+    @pytest.mark.asyncio
+    async def test_reingest_uses_embedding_cache(
+        self, corpus, tmp_path, embedding_server
+    ):
+        """Test that unchanged chunks are not embedded again"""
+        cache_path = str(tmp_path / "cache.sqlite3")
+        for run in range(2):
+            embedder = CachedEmbedder(
+                OllamaEmbedder(embedding_server.url, "fake"), EmbeddingCache(cache_path)
+            )
+            stats = await ingest(
+                [str(corpus)],
+                str(tmp_path / f"index{run}"),
+                embedder=embedder,
+                workers=2,
+                chunk_size=300,
+                chunk_overlap=50,
+                batch_size=8,
+            )
+            requests = embedding_server.requests
+            await embedder.aclose()
+
+        assert requests == -(-stats.chunks // 8)
+        assert len(VectorIndex(str(tmp_path / "index1"))) == stats.chunks
+
+    @pytest.mark.asyncio
+    async def test_only_changed_documents_are_reindexed(
+        self, corpus, tmp_path, embedding_server
+    ):
+        """Test that re-ingestion embeds changed documents and tombstones stale chunks"""
+        index_path = str(tmp_path / "index")
+        options = dict(workers=2, chunk_size=300, chunk_overlap=50, batch_size=8)
+        embedder = OllamaEmbedder(embedding_server.url, "fake")
+        first = await ingest([str(corpus)], index_path, embedder=embedder, **options)
+
+        (corpus / "doc0.md").write_text("# Document 0\n\nRewritten from scratch.")
+        (corpus / "nested" / "doc1.md").unlink()
+        touched = corpus / "doc2.md"
+        touched.write_text(touched.read_text())
+        requests = embedding_server.requests
+        stats = await ingest([str(corpus)], index_path, embedder=embedder, **options)
+        await embedder.aclose()
+
+        assert (stats.files, stats.unchanged, stats.deleted) == (1, 18, 1)
+        assert embedding_server.requests == requests + 1
+        index = VectorIndex(index_path)
+        documents = index.documents()
+        assert len(documents) == 19
+        doc0 = documents[os.path.abspath(corpus / "doc0.md")]
+        assert len(index) == first.chunks - first.chunks // 20 * 2 + len(doc0["chunks"])
+
+        stale = ("topic 0.", "topic 1.")
+        assert not any(
+            hit["text"].endswith(stale)
+            for hit in index.search(np.ones((1, DIM)), 500)[0]
+        )
+        text = "# Document 0\n\nRewritten from scratch."
+        hit = index.search(np.array([fake_embedding(text)]), 1)[0][0]
+        assert hit["text"] == text and hit["id"] in doc0["chunks"]
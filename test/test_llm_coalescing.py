@@ -0,0 +1,98 @@
+"""
+Tests for the coalescing of identical in-flight LLM calls
+"""
+
+import asyncio
+
+import pytest
+from langchain_ollama.chat_models import ChatOllama
+
+from services.llm_coalescing import LLMCoalescer, llm_coalescing
+from services.ollama_client import OllamaConnectionPool
+from test.test_ollama_client import FakeOllamaServer
+
+
+@pytest.fixture
+def slow_server():
+    server = FakeOllamaServer(reply="one two three", token_delay=0.05)
+    yield server
+    server.close()
+
+
+def coalesced_chat(server):
+    coalescer = LLMCoalescer()
+    pool = OllamaConnectionPool(coalescer=coalescer)
+    chat = ChatOllama(model="fake", base_url=server.url, **pool.chat_client_kwargs())
+    return coalescer, pool, chat
+
+
+class TestCoalescing:
+    """Tests for CoalescingTransport"""
+
+    @pytest.mark.asyncio
+    async def test_identical_calls_share_one_generation(self, slow_server):
+        """Test that concurrent identical calls reach Ollama once"""
+        coalescer, pool, chat = coalesced_chat(slow_server)
+
+        with llm_coalescing():
+            replies = await asyncio.gather(*(chat.ainvoke("hi") for _ in range(5)))
+
+        assert [reply.content for reply in replies] == ["one two three "] * 5
+        assert len(slow_server.requests) == 1
+        snapshot = coalescer.snapshot()
+        assert snapshot["coalescing_ratio"] == pytest.approx(0.8)
+        assert snapshot["in_flight"] == 0
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_token_stream_fans_out_to_late_subscribers(self, slow_server):
+        """Test that a stream joined midway still delivers every token"""
+        _, pool, chat = coalesced_chat(slow_server)
+
+        async def stream(delay):
+            await asyncio.sleep(delay)
+            with llm_coalescing():
+                return [chunk.content async for chunk in chat.astream("hi")]
+
+        first, late = await asyncio.gather(stream(0), stream(0.08))
+
+        assert "".join(first) == "".join(late) == "one two three "
+        assert len(first) > 1
+        assert len(slow_server.requests) == 1
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_different_or_unmarked_calls_are_not_coalesced(self, slow_server):
+        """Test that other prompts and calls outside the opt-in run on their own"""
+        coalescer, pool, chat = coalesced_chat(slow_server)
+
+        with llm_coalescing():
+            await asyncio.gather(chat.ainvoke("hi"), chat.ainvoke("hello"))
+        await asyncio.gather(chat.ainvoke("hi"), chat.ainvoke("hi"))
+
+        assert len(slow_server.requests) == 4
+        assert coalescer.snapshot()["coalesced"] == 0
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_leaving_subscriber_does_not_cut_the_others(self, slow_server):
+        """Test that the generation survives its first caller and stops with the last"""
+        coalescer, pool, chat = coalesced_chat(slow_server)
+
+        with llm_coalescing():
+            leader = asyncio.create_task(chat.ainvoke("hi"))
+            await asyncio.sleep(0.02)
+            follower = asyncio.create_task(chat.ainvoke("hi"))
+            await asyncio.sleep(0.02)
+            leader.cancel()
+            assert (await follower).content == "one two three "
+
+            abandoned = asyncio.create_task(chat.ainvoke("bye"))
+            await asyncio.sleep(0.05)
+            abandoned.cancel()
+            await asyncio.gather(leader, abandoned, return_exceptions=True)
+
+        snapshot = coalescer.snapshot()
+        assert snapshot["coalesced"] == 1 and snapshot["abandoned"] == 1
+        assert snapshot["in_flight"] == 0
+        await pool.aclose()
@@ -0,0 +1,166 @@
+"""
+Tests for request deadlines and hedged LLM calls
+"""
+
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_ollama.chat_models import ChatOllama
+
+import endpoints.chat as chat_endpoint
+from services.deadlines import (
+    DeadlineExceeded,
+    current_deadline,
+    deadline_stats,
+    request_deadline,
+    with_deadline,
+)
+from services.llm_hedging import LLMHedger, llm_hedging
+from services.llm_service import LLMService
+from services.ollama_client import OllamaConnectionPool
+from services.ollama_router import OllamaRouter, current_affinity
+from test.test_llm_service import FakeStreamingLLM
+from test.test_ollama_client import FakeOllamaServer
+
+
+@pytest.fixture
+def backends():
+    # The first backend is stuck on a slow generation
+    servers = [FakeOllamaServer(token_delay=0.5), FakeOllamaServer()]
+    yield servers
+    for server in servers:
+        server.close()
+
+
+def hedged_chat(servers, hedger):
+    router = OllamaRouter([server.url for server in servers])
+    pool = OllamaConnectionPool(router=router, hedger=hedger)
+    chat = ChatOllama(
+        model="fake", base_url=servers[0].url, **pool.chat_client_kwargs()
+    )
+    return router, pool, chat
+
+
+class TestHedging:
+    """Tests for HedgingTransport"""
+
+    @pytest.mark.asyncio
+    async def test_slow_call_is_answered_by_the_hedge(self, backends):
+        """Test that a duplicate on the other backend wins over a slow call"""
+        hedger = LLMHedger(delay=0.1)
+        router, pool, chat = hedged_chat(backends, hedger)
+
+        start = time.perf_counter()
+        with llm_hedging():
+            response = await chat.ainvoke("hi")
+
+        assert response.content == "Hello there "
+        assert time.perf_counter() - start < 0.5
+        assert [len(server.requests) for server in backends] == [1, 1]
+        snapshot = hedger.snapshot()
+        assert snapshot["hedged"] == 1 and snapshot["hedge_win_rate"] == 1.0
+        # The losing request was cancelled and released its backend
+        assert [backend.outstanding for backend in router.backends] == [0, 0]
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_calls_are_hedged_only_when_asked(self, backends):
+        """Test that fast and unmarked calls are not duplicated"""
+        backends[0].token_delay = 0.0
+        hedger = LLMHedger(delay=0.5)
+        _, pool, chat = hedged_chat(backends, hedger)
+
+        with llm_hedging():
+            await chat.ainvoke("hi")
+        chunks = [chunk.content async for chunk in chat.astream("hi")]
+
+        assert "".join(chunks) == "Hello there "
+        assert sum(len(server.requests) for server in backends) == 2
+        assert hedger.snapshot()["calls"] == 1
+        assert hedger.snapshot()["hedged"] == 0
+        await pool.aclose()
+
+    def test_delay_follows_the_latency_percentile(self):
+        """Test that the hedge delay is the p95 latency, capped by the deadline"""
+        hedger = LLMHedger(delay=2.0, min_samples=10)
+        kind = ("/api/chat", "fake")
+        assert hedger.hedge_delay(kind) == 2.0
+
+        for latency in range(1, 21):
+            hedger.window(kind).record(latency / 10)
+        assert hedger.hedge_delay(kind) == 2.0
+        hedger.window(kind).record(0.1)
+        assert hedger.hedge_delay(kind) == pytest.approx(1.9)
+
+        with request_deadline(1.0):
+            assert hedger.hedge_delay(kind) <= 0.5
+
+
+class TestDeadlines:
+    """Tests for the request deadline of the graph nodes"""
+
+    @pytest.mark.asyncio
+    async def test_slow_node_misses_the_deadline(self):
+        """Test that a node still running at the deadline is cancelled"""
+
+        async def slow_node(state):
+            await asyncio.sleep(1)
+            return {"results": ["late"]}
+
+        node = with_deadline("planner", slow_node)
+        misses = deadline_stats["misses:planner"]
+
+        with request_deadline(0.05):
+            with pytest.raises(DeadlineExceeded) as error:
+                await node({}, {})
+        assert error.value.stage == "planner"
+        assert deadline_stats["misses:planner"] == misses + 1
+
+    @pytest.mark.asyncio
+    async def test_turn_context_is_set_in_the_turn_task(self):
+        """Test that the deadline and affinity reach the turn, not its readers"""
+        seen = {}
+
+        async def graph(graph_input, config):
+            seen["deadline"] = current_deadline.get()
+            seen["affinity"] = current_affinity.get()
+            return {"results": ["prompt"]}
+
+        service = LLMService(delta_invocation=True)
+        service.graph = MagicMock()
+        service.graph.ainvoke = graph
+
+        with patch("services.llm_service.llm", FakeStreamingLLM()):
+            chunks = service.stream_message("hi", "t1", deadline_seconds=5)
+            # Like the endpoint: the first chunk and the rest in different tasks
+            first = await asyncio.create_task(anext(chunks))
+            rest = await asyncio.create_task(self.drain(chunks))
+
+        assert [first, *rest] == ["ok"]
+        assert seen["affinity"] == "t1" and seen["deadline"] is not None
+        assert current_deadline.get() is None and current_affinity.get() is None
+
+    @staticmethod
+    async def drain(chunks):
+        return [chunk async for chunk in chunks]
+
+    def test_missed_deadline_returns_504(self, monkeypatch):
+        """Test that a turn out of time before answering gets a 504"""
+
+        async def late(*args, **kwargs):
+            raise DeadlineExceeded("planner", 0.0)
+            yield
+
+        monkeypatch.setattr(chat_endpoint.llm_service, "stream_message", late)
+        app = FastAPI()
+        app.include_router(chat_endpoint.router, prefix="/chat")
+
+        response = TestClient(app).post(
+            "/chat", json={"message": "hi", "deadline_seconds": 1}
+        )
+
+        assert response.status_code == 504
@@ -0,0 +1,206 @@
+"""
+Tests for the admission control of LLM calls
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_ollama.chat_models import ChatOllama
+
+import endpoints.chat as chat_endpoint
+from services.llm_scheduler import (
+    LLMScheduler,
+    Overloaded,
+    Priority,
+    llm_priority,
+)
+from services.llm_service import LLMService
+from services.ollama_client import OllamaConnectionPool
+from test.test_llm_service import FakeStreamingLLM
+from test.test_ollama_client import FakeOllamaServer
+
+
+async def hold(scheduler, priority, order, backend="b"):
+    await scheduler.acquire(backend, priority)
+    order.append(priority)
+
+
+class TestLLMScheduler:
+    """Tests for LLMScheduler"""
+
+    @pytest.mark.asyncio
+    async def test_in_flight_turns_go_first(self):
+        """Test that a freed slot goes to the highest priority waiter"""
+        scheduler = LLMScheduler(max_concurrency=1)
+        await scheduler.acquire("b", Priority.WORKER)
+        order = []
+        planner = asyncio.create_task(hold(scheduler, Priority.PLANNER, order))
+        await asyncio.sleep(0)
+        stream = asyncio.create_task(hold(scheduler, Priority.STREAM, order))
+        await asyncio.sleep(0)
+        assert scheduler.snapshot()["backends"]["b"]["queued"] == 2
+
+        scheduler.release("b")
+        await stream
+        scheduler.release("b")
+        await planner
+
+        assert order == [Priority.STREAM, Priority.PLANNER]
+        assert scheduler.snapshot()["queued"] == 2
+
+    @pytest.mark.asyncio
+    async def test_new_turns_are_rejected_when_the_wait_is_too_long(self):
+        """Test that new turns fail fast while in-flight turns keep waiting"""
+        scheduler = LLMScheduler(max_concurrency=1, max_queue_wait=5)
+        await scheduler.acquire("b", Priority.WORKER)
+        scheduler.backend("b").service_time = 8.0
+
+        with pytest.raises(Overloaded) as error:
+            await scheduler.acquire("b", Priority.PLANNER)
+        assert error.value.retry_after > 5
+        with pytest.raises(Overloaded):
+            scheduler.check_admission()
+
+        worker = asyncio.create_task(scheduler.acquire("b", Priority.WORKER))
+        await asyncio.sleep(0)
+        scheduler.release("b")
+        await worker
+        assert scheduler.snapshot()["rejected"] == 2
+
+    @pytest.mark.asyncio
+    async def test_new_turn_is_rejected_after_waiting_too_long(self):
+        """Test that a queued new turn gives up after the queue wait limit"""
+        scheduler = LLMScheduler(max_concurrency=1, max_queue_wait=0.05)
+        await scheduler.acquire("b", Priority.WORKER)
+        scheduler.backend("b").service_time = 0.01
+
+        with pytest.raises(Overloaded):
+            await scheduler.acquire("b", Priority.PLANNER)
+        assert scheduler.snapshot()["backends"]["b"]["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_full_queue_evicts_the_lowest_priority(self):
+        """Test that a full queue rejects its lowest priority waiter for a better call"""
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        await scheduler.acquire("b", Priority.WORKER)
+        planner = asyncio.create_task(scheduler.acquire("b", Priority.PLANNER))
+        await asyncio.sleep(0)
+        stream = asyncio.create_task(scheduler.acquire("b", Priority.STREAM))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded):
+            await planner
+        scheduler.release("b")
+        await stream
+        assert scheduler.snapshot()["evicted"] == 1
+
+
+class TestScheduledTransport:
+    """Tests for the scheduler in front of the Ollama connection pool"""
+
+    @pytest.mark.asyncio
+    async def test_streamed_generation_holds_its_slot(self):
+        """Test that a streaming call keeps its slot until the stream ends"""
+        server = FakeOllamaServer(reply="one two three", token_delay=0.05)
+        scheduler = LLMScheduler(max_concurrency=1)
+        pool = OllamaConnectionPool(scheduler=scheduler)
+        llm = ChatOllama(model="fake", base_url=server.url, **pool.chat_client_kwargs())
+        order = []
+
+        async def stream():
+            with llm_priority(Priority.STREAM):
+                async for _ in llm.astream("hi"):
+                    pass
+            order.append("stream")
+
+        async def plan():
+            with llm_priority(Priority.PLANNER):
+                await llm.ainvoke("hi")
+            order.append("planner")
+
+        # Embeddings are not scheduled
+        embed = pool.async_client(base_url=server.url)
+        await asyncio.gather(
+            stream(),
+            plan(),
+            embed.post("/api/embed", json={"model": "e", "input": "x"}),
+        )
+
+        assert order == ["stream", "planner"]
+        assert scheduler.snapshot()["queued"] == 1
+        assert scheduler.snapshot()["backends"][server.url]["in_flight"] == 0
+        await pool.aclose()
+        server.close()
+
+
+class TestChatEndpoint:
+    """Tests for the 503 responses of /chat"""
+
+    def client(self):
+        app = FastAPI()
+        app.include_router(chat_endpoint.router, prefix="/chat")
+        return TestClient(app)
+
+    def test_saturated_backend_returns_503(self, monkeypatch):
+        """Test that a request is rejected up front with a Retry-After"""
+        scheduler = LLMScheduler(max_concurrency=1, max_queue_wait=1)
+        scheduler.backend("b").in_flight = 1
+        scheduler.backend("b").service_time = 2.5
+        monkeypatch.setattr(chat_endpoint, "llm_scheduler", scheduler)
+
+        response = self.client().post("/chat", json={"message": "hi"})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+
+    def test_rejected_first_call_returns_503(self, monkeypatch):
+        """Test that a turn whose first LLM call is rejected gets a 503"""
+
+        async def rejected(*args, **kwargs):
+            raise Overloaded("b", 0.2)
+            yield
+
+        monkeypatch.setattr(chat_endpoint.llm_service, "stream_message", rejected)
+
+        response = self.client().post("/chat", json={"message": "hi"})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_answer_is_streamed(self, monkeypatch):
+        """Test that an admitted request streams its metadata and chunks"""
+
+        async def answer(*args, **kwargs):
+            yield "Hello"
+            yield ""
+            yield " there"
+
+        monkeypatch.setattr(chat_endpoint.llm_service, "stream_message", answer)
+
+        response = self.client().post("/chat", json={"message": "hi"})
+
+        assert response.status_code == 200
+        assert "conversation_id" in response.text
+        assert '"Hello"' in response.text and '" there"' in response.text
+
+    def test_turn_runs_to_the_end_under_its_priority(self, monkeypatch):
+        """Test that a real turn streamed by the endpoint finishes and is remembered"""
+        service = LLMService(delta_invocation=True)
+        service.graph = MagicMock()
+        service.graph.ainvoke = AsyncMock(return_value={"results": ["prompt"]})
+        service.long_term_memory = MagicMock()
+        monkeypatch.setattr(chat_endpoint, "llm_service", service)
+
+        with patch("services.llm_service.llm", FakeStreamingLLM()):
+            response = self.client().post(
+                "/chat", json={"message": "hi", "conversation_id": "t1"}
+            )
+
+        assert response.status_code == 200
+        assert '"ok"' in response.text and "event: error" not in response.text
+        service.long_term_memory.remember.assert_called_once_with(
+            "conversation:t1", "hi", "ok"
+        )
@@ -0,0 +1,210 @@
+"""
+Tests for LLMService memory initialization and state handling
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from services.llm_service import LLMService
+from services.state_cache import ConversationStateCache
+
+
+class TestCheckpointerStartup:
+    """Tests for the pooled PostgreSQL checkpointer initialization"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_startup_builds_one_pool(self):
+        """Test that concurrent first requests share a single initialization"""
+        pool = MagicMock()
+        pool.open = AsyncMock()
+
+        async def slow_setup():
+            await asyncio.sleep(0.01)
+
+        with (
+            patch("services.llm_service.AsyncConnectionPool", return_value=pool) as cls,
+            patch("services.llm_service.AsyncPostgresSaver") as saver_cls,
+        ):
+            saver_cls.return_value.setup = slow_setup
+            service = LLMService(use_postgres=True)
+            await asyncio.gather(*(service._initialize_memory() for _ in range(5)))
+
+        assert cls.call_count == 1
+        assert service.pool is pool
+        assert service.use_postgres
+
+    @pytest.mark.asyncio
+    async def test_failed_pool_falls_back_to_memory(self):
+        """Test that an unreachable database falls back to in-memory storage"""
+        pool = MagicMock()
+        pool.open = AsyncMock(side_effect=TimeoutError("no database"))
+        pool.close = AsyncMock()
+
+        with patch("services.llm_service.AsyncConnectionPool", return_value=pool):
+            service = LLMService(use_postgres=True)
+            await service.startup()
+
+        pool.close.assert_awaited_once()
+        assert not service.use_postgres
+        assert service.graph is not None
+        assert service.pool_snapshot() == {"enabled": False}
+
+
+class TestConversationStateCache:
+    """Tests for the hot conversation-state cache"""
+
+    def test_bounded_by_entries_and_bytes(self):
+        """Test that the cache evicts by entry count and by size"""
+        cache = ConversationStateCache(max_entries=2, max_bytes=10_000)
+        for thread in ["a", "b", "c"]:
+            cache.put(thread, "v1", [HumanMessage(content="hi")])
+
+        assert cache.get("a", "v1") is None
+        assert cache.get("c", "v1") is not None
+
+        cache.put("big", "v1", [HumanMessage(content="x" * 20_000)])
+        assert cache.get("big", "v1") is None
+
+    @pytest.mark.asyncio
+    async def test_active_conversation_skips_full_read(self):
+        """Test that a current cached history is used instead of aget_state"""
+        service = LLMService()
+        service.state_cache = ConversationStateCache()
+        config = {"configurable": {"thread_id": "t1"}}
+        await service.graph.aupdate_state(
+            config, {"messages": [HumanMessage(content="hi")]}
+        )
+
+        first = await service._load_history(config)
+        with patch.object(service.graph, "get_state") as get_state:
+            second = await service._load_history(config)
+
+        get_state.assert_not_called()
+        assert [m.content for m in second] == [m.content for m in first] == ["hi"]
+        assert service.state_cache.snapshot()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_newer_checkpoint_invalidates_entry(self):
+        """Test that a checkpoint written elsewhere is detected by its ID"""
+        service = LLMService()
+        service.state_cache = ConversationStateCache()
+        config = {"configurable": {"thread_id": "t1"}}
+        await service.graph.aupdate_state(
+            config, {"messages": [HumanMessage(content="hi")]}
+        )
+        await service._load_history(config)
+
+        # Another worker appends to the same thread
+        await service.graph.aupdate_state(
+            config, {"messages": [HumanMessage(content="again")]}, as_node="synthesizer"
+        )
+        history = await service._load_history(config)
+
+        assert [m.content for m in history] == ["hi", "again"]
+        assert service.state_cache.snapshot()["stale"] == 1
+
+    @pytest.mark.asyncio
+    async def test_postgres_version_check_reads_only_the_id(self):
+        """Test that the version check is an ID-only query, not a checkpoint read"""
+        cursor = MagicMock()
+        cursor.execute = AsyncMock()
+        cursor.fetchone = AsyncMock(return_value={"checkpoint_id": "c2"})
+        cursor.__aenter__ = AsyncMock(return_value=cursor)
+        cursor.__aexit__ = AsyncMock(return_value=None)
+        conn = MagicMock()
+        conn.cursor.return_value = cursor
+        conn.__aenter__ = AsyncMock(return_value=conn)
+        conn.__aexit__ = AsyncMock(return_value=None)
+
+        service = LLMService()
+        service.pool = MagicMock()
+        service.pool.connection.return_value = conn
+        service.memory = MagicMock()
+
+        checkpoint_id = await service._latest_checkpoint_id(
+            {"configurable": {"thread_id": "t1"}}
+        )
+
+        assert checkpoint_id == "c2"
+        assert cursor.execute.call_args.args[1] == ("t1",)
+        service.memory.aget_tuple.assert_not_called()
+
+    def test_in_memory_checkpointer_has_no_state_cache(self):
+        """Test that the cache is only used in front of PostgreSQL"""
+        assert LLMService(delta_invocation=False).state_cache is None
+
+
+class FakeStreamingLLM:
+    async def astream(self, prompt):
+        yield AIMessageChunk(content="ok")
+
+
+class TestDeltaInvocation:
+    """Tests for delta-only graph invocation"""
+
+    @pytest.mark.asyncio
+    async def test_only_new_message_is_sent(self):
+        """Test that delta mode neither loads nor resends the history"""
+        service = LLMService(delta_invocation=True)
+        service.graph = MagicMock()
+        service.graph.ainvoke = AsyncMock(return_value={"results": ["prompt"]})
+
+        with patch("services.llm_service.llm", FakeStreamingLLM()):
+            chunks = [c async for c in service.stream_message("hello", "t1")]
+
+        graph_input = service.graph.ainvoke.call_args.args[0]
+        assert chunks == ["ok"]
+        assert [m.content for m in graph_input["messages"]] == ["hello"]
+        assert graph_input["results"] is None
+        service.graph.get_state.assert_not_called()
+        assert service.state_cache is None
+
+    @pytest.mark.asyncio
+    async def test_finished_turn_is_handed_to_long_term_memory(self):
+        """Test that the streamed answer is queued for long-term memory"""
+        service = LLMService(delta_invocation=True)
+        service.graph = MagicMock()
+        service.graph.ainvoke = AsyncMock(return_value={"results": ["prompt"]})
+        service.long_term_memory = MagicMock()
+
+        with patch("services.llm_service.llm", FakeStreamingLLM()):
+            chunks = [
+                c async for c in service.stream_message("hello", "t1", user_id="ana")
+            ]
+
+        graph_input = service.graph.ainvoke.call_args.args[0]
+        assert chunks == ["ok"]
+        assert graph_input["user_id"] == "user:ana"
+        service.long_term_memory.remember.assert_called_once_with(
+            "user:ana", "hello", "ok"
+        )
+
+    @pytest.mark.asyncio
+    async def test_leaving_client_cancels_the_turn(self):
+        """Test that closing the stream midway stops the turn it was reading"""
+        generation = asyncio.Event()
+
+        class EndlessLLM:
+            async def astream(self, prompt):
+                try:
+                    while True:
+                        yield AIMessageChunk(content="more")
+                        await asyncio.sleep(0.01)
+                finally:
+                    generation.set()
+
+        service = LLMService(delta_invocation=True)
+        service.graph = MagicMock()
+        service.graph.ainvoke = AsyncMock(return_value={"results": ["prompt"]})
+        service.long_term_memory = MagicMock()
+
+        with patch("services.llm_service.llm", EndlessLLM()):
+            chunks = service.stream_message("hello", "t1")
+            assert await anext(chunks) == "more"
+            await chunks.aclose()
+
+        assert generation.is_set()
+        service.long_term_memory.remember.assert_not_called()
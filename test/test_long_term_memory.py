@@ -0,0 +1,198 @@
+"""
+Tests for the long-term conversational memory
+"""
+
+import asyncio
+import zlib
+
+import numpy as np
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agents.long_term_memory import (
+    LongTermMemory,
+    MemoryStore,
+    extract_facts,
+    memory_owner,
+    memory_stats,
+    recalled_memories_message,
+    with_long_term_memory,
+)
+from services.deadlines import current_deadline, request_deadline
+from services.llm_scheduler import Priority, current_priority, llm_priority
+from services.ollama_router import current_affinity, llm_affinity
+
+
+class FakeEmbedder:
+    """Stand-in for the RAG embedder: hashed bag-of-words vectors"""
+
+    def __init__(self, dim=64, delay=0.0):
+        self.dim = dim
+        self.delay = delay
+        self.batches = []
+
+    def vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().replace("'", " ").split():
+            vector[zlib.crc32(word.strip(".?!,").encode()) % self.dim] += 1.0
+        return vector
+
+    async def embed(self, texts):
+        self.batches.append(list(texts))
+        self.write_context = (
+            current_deadline.get(),
+            current_affinity.get(),
+            current_priority.get(),
+        )
+        return np.stack([self.vector(text) for text in texts])
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.delay)
+        return self.vector(text).tolist()
+
+
+def state(message, user_id="ana"):
+    return {"messages": [HumanMessage(content=message)], "user_id": user_id}
+
+
+class TestLongTermMemory:
+    """Tests for LongTermMemory, MemoryStore and the chat agent wrapper"""
+
+    def test_facts_are_extracted_from_user_messages(self):
+        """Test that stated facts are extracted, one per key"""
+        facts = extract_facts("Hi, my name is João and I'm 25 years old. I love chess.")
+
+        assert [(fact.key, fact.text) for fact in facts] == [
+            ("name", "The user's name is João."),
+            ("age", "The user is 25 years old."),
+            ("likes:chess", "The user likes chess."),
+        ]
+
+    def test_conversation_cannot_name_a_users_memories(self):
+        """Test that memories without an authenticated user stay in the conversation"""
+        assert memory_owner("t1", "ana") == "user:ana"
+        assert memory_owner("t1") == "conversation:t1"
+        assert memory_owner("ana") != memory_owner("t1", "ana")
+
+    @pytest.mark.asyncio
+    async def test_turns_are_written_in_the_background_and_recalled(self):
+        """Test that remember returns at once and recall finds the stored memories"""
+        embedder = FakeEmbedder()
+        memory = LongTermMemory(embedder, MemoryStore(), top_k=2, min_score=0.2)
+
+        memory.remember("ana", "My name is Ana", "Nice to meet you, Ana!")
+        memory.remember("ana", "I live in Lisbon", "Lisbon is lovely.")
+        memory.remember("bob", "My name is Bob", "Hi Bob!")
+        assert embedder.batches == []
+
+        await memory.flush()
+        # One embedding call for the whole backlog of turns
+        assert len(embedder.batches) == 1
+
+        recalled = await memory.recall("ana", "what is my name")
+        assert "The user's name is Ana." in recalled
+        assert all("Bob" not in text for text in recalled)
+        await memory.aclose()
+
+    @pytest.mark.asyncio
+    async def test_newer_fact_replaces_older_one(self, tmp_path):
+        """Test that a corrected fact replaces the stored one, also on disk"""
+        path = str(tmp_path / "memory.sqlite3")
+        memory = LongTermMemory(FakeEmbedder(), MemoryStore(path), min_score=0.2)
+        memory.remember("ana", "My name is Ana", "Hi Ana!")
+        memory.remember("ana", "Actually, call me Anna", "Sure, Anna!")
+        await memory.aclose()
+
+        reopened = LongTermMemory(FakeEmbedder(), MemoryStore(path), min_score=0.2)
+        recalled = await reopened.recall("ana", "what is my name")
+        assert "The user's name is Anna." in recalled
+        assert "The user's name is Ana." not in recalled
+        await reopened.aclose()
+
+    @pytest.mark.asyncio
+    async def test_oldest_turns_are_forgotten_first(self):
+        """Test that a full user memory drops its oldest turns and keeps facts"""
+        store = MemoryStore(max_per_user=3)
+        memory = LongTermMemory(FakeEmbedder(), store, top_k=10, min_score=-1)
+        memory.remember("ana", "My name is Ana", "Hi!")
+        for number in range(3):
+            memory.remember("ana", f"question {number}", "answer")
+        await memory.flush()
+
+        texts = [m.text for m in store.user("ana").memories]
+        assert texts[0] == "The user's name is Ana."
+        assert len(texts) == 3
+        assert not any("My name is Ana" in text for text in texts)
+        await memory.aclose()
+
+    @pytest.mark.asyncio
+    async def test_writer_does_not_inherit_the_turn_context(self):
+        """Test that the background writer runs without the turn's deadline or affinity"""
+        embedder = FakeEmbedder()
+        memory = LongTermMemory(embedder, MemoryStore())
+
+        with request_deadline(30), llm_affinity("t1"), llm_priority(Priority.STREAM):
+            memory.remember("ana", "My name is Ana", "Hi Ana!")
+        await memory.flush()
+
+        assert embedder.write_context == (None, None, Priority.BACKGROUND)
+        await memory.aclose()
+
+    @pytest.mark.asyncio
+    async def test_recall_time_includes_the_query_embedding(self):
+        """Test that recall_us counts the time spent embedding the query"""
+        memory = LongTermMemory(FakeEmbedder(delay=0.05), MemoryStore())
+        before = memory_stats["recall_us"]
+
+        await memory.recall("ana", "What is my name?")
+
+        assert memory_stats["recall_us"] - before >= 50_000
+        await memory.aclose()
+
+    @pytest.mark.asyncio
+    async def test_full_queue_drops_turns(self):
+        """Test that writes never block the request path when the queue is full"""
+        memory = LongTermMemory(FakeEmbedder(), MemoryStore(), queue_size=1)
+        dropped = memory_stats["dropped"]
+
+        memory.remember("ana", "one", "a")
+        memory.remember("ana", "two", "b")
+
+        assert memory_stats["dropped"] == dropped + 1
+        await memory.aclose()
+
+    @pytest.mark.asyncio
+    async def test_chat_node_gets_recalled_memories(self):
+        """Test that the wrapper passes the recalled memories to the chat agent"""
+        memory = LongTermMemory(FakeEmbedder(), MemoryStore(), min_score=0.2)
+        memory.remember("ana", "My name is Ana", "Hi Ana!")
+        await memory.flush()
+        seen = []
+
+        async def chat(state):
+            seen.append(state)
+            return {"results": ["ok"]}
+
+        node = with_long_term_memory(chat, memory)
+        await node(state("What is my name?"))
+
+        message = recalled_memories_message(seen[0])
+        assert "The user's name is Ana." in message[0].content
+        await memory.aclose()
+
+    @pytest.mark.asyncio
+    async def test_slow_recall_is_skipped(self):
+        """Test that the chat agent answers without memories when recall is slow"""
+        memory = LongTermMemory(FakeEmbedder(delay=1.0), MemoryStore())
+        seen = []
+
+        async def chat(state):
+            seen.append(state)
+            return {"results": ["ok"]}
+
+        node = with_long_term_memory(chat, memory, timeout=0.05)
+        update = await node(state("What is my name?"))
+
+        assert update == {"results": ["ok"]}
+        assert seen[0]["memories"] == []
+        assert recalled_memories_message(seen[0]) == []
@@ -0,0 +1,74 @@
+"""
+Tests for the LRU/TTL cache and the planner cache key
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from utils.lru_cache import LRUCache
+from utils.text import normalize_message
+
+
+class TestLRUCache:
+    """Tests for LRUCache"""
+
+    def test_hit_and_miss(self):
+        """Test that stored values are returned and counted"""
+        cache = LRUCache()
+        cache.put("a", ["chat_agent"])
+
+        assert cache.get("a") == ["chat_agent"]
+        assert cache.get("b") is None
+        assert cache.snapshot()["hit_rate"] == 0.5
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.snapshot()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        """Test that expired entries are not returned"""
+        cache = LRUCache(ttl=0.01)
+        cache.put("a", 1)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+        assert cache.snapshot()["expired"] == 1
+
+    def test_persistence(self, tmp_path):
+        """Test that a saved cache is warm after a restart"""
+        path = str(tmp_path / "cache.json")
+        cache = LRUCache(path=path)
+        cache.put("a", ["joke_agent"])
+        cache.save()
+
+        assert LRUCache(path=path).get("a") == ["joke_agent"]
+
+    @pytest.mark.asyncio
+    async def test_periodic_save_batches_writes(self, tmp_path):
+        """Test that changes are saved by the periodic task, from unique temp files"""
+        path = tmp_path / "cache.json"
+        cache = LRUCache(path=str(path))
+        task = asyncio.create_task(cache.save_periodically(0.01))
+        cache.put("a", ["joke_agent"])
+        cache.put("b", ["chat_agent"])
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        assert LRUCache(path=str(path)).get("b") == ["chat_agent"]
+        assert [p.name for p in tmp_path.iterdir()] == ["cache.json"]
+
+
+def test_normalize_message():
+    """Test that case, punctuation and whitespace do not change the key"""
+    assert normalize_message("  Tell me a JOKE!!  ") == "tell me a joke"
+    assert normalize_message("hi") == normalize_message("Hi!")
@@ -0,0 +1,361 @@
+"""
+Tests for the Ollama client layer, against local stub servers that mimic
+Ollama's chat, generate and embed API
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from langchain_ollama.chat_models import ChatOllama
+
+from rag.embeddings import OllamaEmbedder
+from services.ollama_client import OllamaConnectionPool, warm_up, warmup_report
+from services.llm_scheduler import Overloaded
+from services.ollama_router import (
+    AVOID_BACKEND,
+    OllamaRouter,
+    RoutingTransport,
+    llm_affinity,
+)
+
+
+class FakeOllamaServer:
+    """
+    Serves Ollama's /api/chat and /api/generate (streamed as NDJSON) and
+    /api/embed. The first request for a model waits `load_delay` seconds,
+    like Ollama loading it; the client connections seen are tracked. Setting
+    `status` to an error code makes every request fail with it.
+    """
+
+    def __init__(self, reply="Hello there", load_delay=0.0, token_delay=0.0):
+        self.reply = reply
+        self.token_delay = token_delay
+        self.status = 200
+        self.requests = []
+        self.connections = set()
+        self.loaded = set()
+        lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive connections, as Ollama's server
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.send_json({"version": "0.0.0"}, server.status)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with lock:
+                    server.requests.append((self.path, body))
+                    server.connections.add(self.client_address)
+                    cold = body["model"] not in server.loaded
+                    server.loaded.add(body["model"])
+                if server.status != 200:
+                    self.send_json({"error": "unavailable"}, server.status)
+                    return
+                load_duration = 0
+                if cold:
+                    time.sleep(load_delay)
+                    load_duration = int(load_delay * 1e9)
+
+                if self.path == "/api/embed":
+                    inputs = body["input"]
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    self.send_json(
+                        {
+                            "model": body["model"],
+                            "embeddings": [[1.0, 0.0] for _ in inputs],
+                            "load_duration": load_duration,
+                        }
+                    )
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in server.reply.split(" "):
+                    time.sleep(server.token_delay)
+                    self.send_chunk(self.chunk(body, token + " ", done=False))
+                final = self.chunk(body, "", done=True)
+                final.update(done_reason="stop", load_duration=load_duration)
+                self.send_chunk(final)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def chunk(self, body, text, done):
+                chunk = {"model": body["model"], "created_at": "", "done": done}
+                if self.path == "/api/chat":
+                    chunk["message"] = {"role": "assistant", "content": text}
+                else:
+                    chunk["response"] = text
+                return chunk
+
+            def send_chunk(self, payload):
+                line = json.dumps(payload).encode() + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            def send_json(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def ollama_server():
+    server = FakeOllamaServer(load_delay=0.2)
+    yield server
+    server.close()
+
+
+class TestConnectionPool:
+    """Tests for the shared keep-alive connection pool"""
+
+    @pytest.mark.asyncio
+    async def test_clients_reuse_pooled_connections(self, ollama_server):
+        """Test that chat and embedding clients share one keep-alive connection"""
+        pool = OllamaConnectionPool(max_connections=4)
+        chat = ChatOllama(
+            model="fake", base_url=ollama_server.url, **pool.chat_client_kwargs()
+        )
+        embedder = OllamaEmbedder(
+            ollama_server.url, "fake-embed", client=pool.async_client()
+        )
+
+        for _ in range(3):
+            response = await chat.ainvoke("hi")
+            await embedder.embed(["some text"])
+        await embedder.aclose()
+
+        assert response.content == "Hello there "
+        assert len(ollama_server.requests) == 6
+        assert len(ollama_server.connections) == 1
+        # Closing a client on the pool leaves the pool open for the others
+        assert (await chat.ainvoke("hi")).content == "Hello there "
+        assert pool.snapshot()["requests"] == 7
+        assert pool.snapshot()["in_flight"] == 0
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_streaming_goes_through_the_pool(self, ollama_server):
+        """Test that streamed chat chunks arrive through the pooled transport"""
+        pool = OllamaConnectionPool()
+        chat = ChatOllama(
+            model="fake", base_url=ollama_server.url, **pool.chat_client_kwargs()
+        )
+
+        chunks = [chunk.content async for chunk in chat.astream("hi")]
+
+        assert "".join(chunks) == "Hello there "
+        assert ollama_server.requests[0][1]["stream"] is True
+        await pool.aclose()
+
+
+class TestWarmup:
+    """Tests for the startup warmup"""
+
+    @pytest.mark.asyncio
+    async def test_models_are_preloaded_and_timed(self, ollama_server):
+        """Test that warmup loads every model and reports cold and warm TTFT"""
+        pool = OllamaConnectionPool()
+
+        reports = await warm_up(
+            pool, ollama_server.url, ["chat-model"], ["embed-model"], keep_alive="30m"
+        )
+
+        assert ollama_server.loaded == {"chat-model", "embed-model"}
+        chat = reports["chat-model"]
+        assert chat["ok"] and chat["load_ms"] == pytest.approx(200, abs=1)
+        assert chat["cold_ms"] > chat["warm_ms"]
+        assert reports["embed-model"]["cold_ms"] > reports["embed-model"]["warm_ms"]
+        assert all(body["keep_alive"] == "30m" for _, body in ollama_server.requests)
+        assert warmup_report["chat-model"] == chat
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_unreachable_server_does_not_fail_startup(self):
+        """Test that a failed warmup is reported instead of raised"""
+        pool = OllamaConnectionPool()
+
+        reports = await warm_up(pool, "http://127.0.0.1:9", ["chat-model"])
+
+        assert reports["chat-model"]["ok"] is False
+        await pool.aclose()
+
+
+@pytest.fixture
+def backends():
+    servers = [FakeOllamaServer(), FakeOllamaServer()]
+    yield servers
+    for server in servers:
+        server.close()
+
+
+def routed_chat(servers, **router_kwargs):
+    router = OllamaRouter([server.url for server in servers], **router_kwargs)
+    pool = OllamaConnectionPool(router=router)
+    # The client is configured with one backend; the router picks the real one
+    chat = ChatOllama(
+        model="fake", base_url=servers[0].url, **pool.chat_client_kwargs()
+    )
+    return router, pool, chat
+
+
+class TestRouter:
+    """Tests for routing Ollama requests over several backends"""
+
+    @pytest.mark.asyncio
+    async def test_requests_go_to_the_least_loaded_backend(self, backends):
+        """Test that concurrent streams spread over the backends"""
+        backends[0].token_delay = backends[1].token_delay = 0.05
+        router, pool, chat = routed_chat(backends)
+        for server in backends:
+            server.reply = "one two three"
+
+        async def stream():
+            return "".join([chunk.content async for chunk in chat.astream("hi")])
+
+        replies = await asyncio.gather(*(stream() for _ in range(4)))
+
+        assert replies == ["one two three "] * 4
+        assert [len(server.requests) for server in backends] == [2, 2]
+        assert all(backend.outstanding == 0 for backend in router.backends), (
+            "streams release their backend once closed"
+        )
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_conversation_sticks_to_one_backend(self, backends):
+        """Test that calls with the same affinity key reach the same backend"""
+        router, pool, chat = routed_chat(backends)
+
+        for conversation in ("a", "b", "c", "d", "e", "f"):
+            with llm_affinity(conversation):
+                await chat.ainvoke("hi")
+                await chat.ainvoke("hi again")
+
+        # Each conversation sent both of its calls to a single backend
+        assert sum(len(server.requests) for server in backends) == 12
+        assert all(len(server.requests) % 2 == 0 for server in backends)
+        assert router.snapshot()["affinity_hits"] == 12
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_failing_backend_is_retried_elsewhere_and_ejected(self, backends):
+        """Test that connection errors fail over and eject the backend"""
+        backends[0].close()
+        router, pool, chat = routed_chat(backends, max_failures=2)
+
+        for _ in range(3):
+            assert (await chat.ainvoke("hi")).content == "Hello there "
+
+        snapshot = router.snapshot()
+        assert len(backends[1].requests) == 3
+        assert snapshot["backends"][backends[0].url]["ejected"] is True
+        assert snapshot["retries"] == 2
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_server_errors_eject_until_health_check_passes(self, backends):
+        """Test passive ejection on 5xx and the active health checks"""
+        backends[0].status = 503
+        router, pool, chat = routed_chat(backends, max_failures=1)
+
+        # A 5xx is returned to the caller, but ejects the backend
+        with pytest.raises(Exception):
+            await chat.ainvoke("hi")
+        await chat.ainvoke("hi")
+        assert router.snapshot()["backends"][backends[0].url]["ejected"] is True
+        assert [len(server.requests) for server in backends] == [1, 1]
+
+        # A passing health check brings it back early
+        backends[0].status = 200
+        await router.check_health(pool.direct_client())
+        await chat.ainvoke("hi")
+        assert [len(server.requests) for server in backends] == [2, 1]
+
+        # A failing one takes it out of rotation before any request fails
+        backends[0].status = 503
+        await router.check_health(pool.direct_client())
+        await chat.ainvoke("hi")
+        assert router.snapshot()["backends"][backends[0].url]["healthy"] is False
+        assert [len(server.requests) for server in backends] == [2, 2]
+        await pool.aclose()
+
+    @pytest.mark.asyncio
+    async def test_backend_path_prefix_is_kept(self):
+        """Test that backends behind a gateway path get their prefix"""
+        seen = []
+        router = OllamaRouter(["http://gw-a/ollama", "http://gw-b/llm/"])
+        transport = RoutingTransport(
+            httpx.MockTransport(
+                lambda request: seen.append(request.url) or httpx.Response(200)
+            ),
+            router,
+        )
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://gw-a/ollama"
+        ) as client:
+            await client.post("/api/chat", json={})
+            await client.post(
+                "/api/chat?x=1", json={}, extensions={AVOID_BACKEND: "http://gw-a"}
+            )
+            await router.check_health(client)
+
+        assert [str(url) for url in seen[:2]] == [
+            "http://gw-a/ollama/api/chat",
+            "http://gw-b/llm/api/chat?x=1",
+        ]
+        assert sorted(str(url) for url in seen[2:]) == [
+            "http://gw-a/ollama/api/version",
+            "http://gw-b/llm/api/version",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_overloaded_backend_is_retried_elsewhere(self):
+        """Test that an Overloaded rejection moves the request to another backend"""
+        overloaded = {"http://gw-a"}
+
+        def handler(request):
+            name = f"http://{request.url.host}"
+            if name in overloaded:
+                raise Overloaded(name, 5.0)
+            return httpx.Response(200, stream=httpx.ByteStream(name.encode()))
+
+        router = OllamaRouter(["http://gw-a", "http://gw-b"])
+        transport = RoutingTransport(httpx.MockTransport(handler), router)
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.post("http://gw-a/api/chat", json={})
+            assert response.text == "http://gw-b"
+
+            # With no healthy backend left, the rejection reaches the caller
+            overloaded.add("http://gw-b")
+            with pytest.raises(Overloaded):
+                await client.post("http://gw-a/api/chat", json={})
+
+        snapshot = router.snapshot()
+        assert snapshot["overload_retries"] == 2
+        assert all(backend.outstanding == 0 for backend in router.backends)
+        assert all(backend.failures == 0 for backend in router.backends), (
+            "an overload is not a backend failure"
+        )
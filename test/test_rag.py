@@ -0,0 +1,390 @@
+"""
+Tests for the document index and the retriever node
+"""
+
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agents.reranker_agent import (
+    create_local_scorer,
+    create_reranker_node,
+    rerank_stats,
+)
+from agents.retriever_agent import (
+    RetrievalPrefetcher,
+    create_retriever_node,
+    retrieved_context_message,
+)
+from config.rag_config import RagConfig
+from rag.index import VectorIndex
+from rag.lexical import LexicalIndex, reciprocal_rank_fusion, tokenize
+from rag.rerank import TermProximityScorer
+from rag.vector_store import VectorStore, exact_search, normalize
+
+
+def random_vectors(n, dim=16, seed=0):
+    return normalize(np.random.default_rng(seed).normal(size=(n, dim)))
+
+
+def records(n):
+    return [{"text": f"chunk {i}", "source": f"doc{i // 10}.md"} for i in range(n)]
+
+
+class FakeEmbeddings:
+    def __init__(self, vector):
+        self.vector = vector
+
+    async def aembed_query(self, text):
+        return list(self.vector)
+
+
+class TestVectorStore:
+    """Tests for the memory-mapped vector store"""
+
+    def test_exact_search_matches_full_sort(self):
+        """Test that blocked argpartition top-k equals a full argsort"""
+        matrix = random_vectors(1000)
+        queries = random_vectors(3, seed=1)
+        ids, scores = exact_search(matrix, queries, 5, block_rows=128)
+
+        expected = np.argsort(-(queries @ matrix.T), axis=1)[:, :5]
+        assert (ids == expected).all()
+        assert (np.diff(scores, axis=1) <= 0).all()
+
+    def test_reopen_maps_persisted_index(self, tmp_path):
+        """Test that a reopened store is memory-mapped, not rebuilt"""
+        vectors = random_vectors(50)
+        store = VectorStore(str(tmp_path), dim=16)
+        store.add(vectors[:20], records(20))
+        store.add(vectors[20:], records(50)[20:])
+
+        reopened = VectorStore(str(tmp_path))
+        assert isinstance(reopened.vectors, np.memmap)
+        assert len(reopened) == 50
+        assert reopened.records([0, 49]) == [records(50)[0], records(50)[49]]
+        ids, _ = reopened.search(vectors[33], 1)
+        assert ids[0, 0] == 33
+
+    def test_interrupted_append_is_discarded(self, tmp_path):
+        """Test that bytes written past the committed count are truncated"""
+        store = VectorStore(str(tmp_path), dim=16)
+        store.add(random_vectors(10), records(10))
+        with open(tmp_path / "vectors.f32", "ab") as f:
+            f.write(b"\0" * 100)
+
+        reopened = VectorStore(str(tmp_path))
+        assert len(reopened) == 10
+        assert (tmp_path / "vectors.f32").stat().st_size == 10 * 16 * 4
+
+
+class TestIVFIndex:
+    """Tests for the approximate IVF search mode"""
+
+    def test_recall_on_clustered_data(self, tmp_path):
+        """Test that IVF finds the exact neighbours of clustered vectors"""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(20, 16))
+        vectors = normalize(
+            np.repeat(centers, 100, axis=0) + 0.1 * rng.normal(size=(2000, 16))
+        )
+        index = VectorIndex(str(tmp_path), dim=16, mode="ann", nprobe=4)
+        index.add(vectors, records(2000))
+        index.build_ann(nlist=20)
+
+        queries = vectors[::97]
+        approx = [[hit["id"] for hit in hits] for hits in index.search(queries, 10)]
+        exact, _ = exact_search(vectors, queries, 10)
+        recall = np.mean([len(set(a) & set(e)) / 10 for a, e in zip(approx, exact)])
+        assert recall >= 0.9
+
+    def test_vectors_added_after_training_are_found(self, tmp_path):
+        """Test that the untrained tail is searched and the index survives a restart"""
+        index = VectorIndex(str(tmp_path), dim=16, mode="ann")
+        index.add(random_vectors(500), records(500))
+        index.build_ann(nlist=8)
+        new_vector = random_vectors(1, seed=42)
+        index.add(new_vector, [{"text": "new", "source": "new.md"}])
+
+        reopened = VectorIndex(str(tmp_path), mode="ann")
+        assert reopened.uses_ann()
+        hit = reopened.search(new_vector, 1)[0][0]
+        assert hit["text"] == "new" and hit["id"] == 500
+
+
+class TestSegments:
+    """Tests for index segments, tombstones and compaction"""
+
+    def test_commit_is_atomic(self, tmp_path):
+        """Test that queries only see a writer's chunks once it commits"""
+        index = VectorIndex(str(tmp_path), dim=16)
+        index.add(random_vectors(10), records(10))
+        vectors = random_vectors(5, seed=1)
+
+        writer = index.writer()
+        writer.add(vectors, records(5))
+        before = index.snapshot()
+        writer.commit()
+
+        assert len(before) == 10 and len(index) == 15
+        assert index.search(vectors[:1], 1)[0][0]["id"] == 10
+        with pytest.raises(ValueError):
+            with index.writer() as writer:
+                writer.add(random_vectors(5), records(5))
+                writer.add(random_vectors(1, dim=8), records(1))
+        assert len(index) == 15
+        assert len(list((tmp_path / "segments").iterdir())) == 2
+
+    def test_deleted_chunks_and_compaction(self, tmp_path):
+        """Test that tombstoned chunks disappear and compaction reclaims them"""
+        vectors = random_vectors(40)
+        index = VectorIndex(str(tmp_path), dim=16, compaction_deleted_ratio=0.05)
+        index.add(vectors[:30], records(30))
+        index.add(vectors[30:], records(40)[30:])
+        index.delete([7, 8])
+
+        assert len(index) == 38
+        assert index.search(vectors[7:8], 1)[0][0]["id"] != 7
+        assert 7 not in index.lexical_search("chunk 7", 40)[0]
+        assert index.compaction_candidates() == [index.snapshot().segments[0].name]
+
+        old = index.snapshot()
+        assert index.compact()
+        assert len(index) == 38 and len(index.snapshot().segments) == 2
+        assert len(list((tmp_path / "segments").iterdir())) == 2
+        hit = index.search(vectors[9:10], 1)[0][0]
+        assert hit["text"] == "chunk 9" and hit["id"] >= 40
+        # Queries that started on the old segments still read them
+        assert old.search(vectors[9:10], 1)[0][0]["id"] == 9
+        assert not index.compact()
+
+
+class TestLexicalIndex:
+    """Tests for the BM25 inverted index"""
+
+    TEXTS = [
+        "The deploy failed with error ERR-1042 in the billing service",
+        "Billing service overview and architecture",
+        "How to configure the Roshi chat agent",
+    ]
+
+    def test_identifiers_are_kept_whole_and_split(self):
+        """Test that compound identifiers index as a whole and by part"""
+        assert list(tokenize("Got ERR-1042!")) == ["got", "err-1042", "err", "1042"]
+
+    def test_bm25_ranking_and_reload(self, tmp_path):
+        """Test that exact terms rank first and the saved index is memory-mapped"""
+        LexicalIndex.build(enumerate(self.TEXTS)).save(str(tmp_path))
+        lexical = LexicalIndex.load(str(tmp_path))
+
+        ids, scores = lexical.search("ERR-1042", 3)
+        assert ids.tolist() == [0]
+        ids, scores = lexical.search("billing architecture", 3)
+        assert ids.tolist() == [1, 0] and scores[0] > scores[1]
+        assert isinstance(lexical.doc_ids, np.memmap)
+        assert lexical.search("unknown words", 3)[0].size == 0
+
+    def test_reciprocal_rank_fusion(self):
+        """Test that documents ranked by both lists come first"""
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]])
+        assert list(fused) == [1, 3, 2]
+
+
+class TestRetrieverNode:
+    """Tests for the retriever graph node"""
+
+    @pytest.mark.asyncio
+    async def test_hits_reach_chat_prompt(self, tmp_path):
+        """Test that the retrieved chunks are formatted for the chat agent"""
+        vectors = random_vectors(30)
+        index = VectorIndex(str(tmp_path), dim=16)
+        index.add(vectors, records(30))
+        node = create_retriever_node(index, FakeEmbeddings(vectors[7]), top_k=2)
+
+        update = await node({"messages": [HumanMessage(content="chunk 7?")]})
+
+        assert update["retrieved"][0]["text"] == "chunk 7"
+        context = retrieved_context_message(update)[0].content
+        assert "[1] (doc0.md)\nchunk 7" in context
+
+    @pytest.mark.asyncio
+    async def test_failed_embedding_yields_no_documents(self, tmp_path):
+        """Test that retrieval errors do not fail the turn"""
+
+        class BrokenEmbeddings:
+            async def aembed_query(self, text):
+                raise ConnectionError("ollama down")
+
+        index = VectorIndex(str(tmp_path), dim=16)
+        node = create_retriever_node(index, BrokenEmbeddings())
+        update = await node({"messages": [HumanMessage(content="hi")]})
+
+        assert update == {"retrieved": []}
+
+    @pytest.mark.asyncio
+    async def test_hybrid_finds_exact_identifier(self, tmp_path):
+        """Test that a lexical match is fused in when dense search misses it"""
+        texts = TestLexicalIndex.TEXTS
+        vectors = random_vectors(len(texts))
+        index = VectorIndex(str(tmp_path), dim=16)
+        index.add(vectors, [{"text": text, "source": "kb.md"} for text in texts])
+        # The query embedding points at an unrelated chunk
+        node = create_retriever_node(index, FakeEmbeddings(vectors[2]), top_k=2)
+
+        update = await node({"messages": [HumanMessage(content="what is ERR-1042?")]})
+
+        assert {hit["id"] for hit in update["retrieved"]} == {0, 2}
+
+    @pytest.mark.asyncio
+    async def test_lexical_hits_survive_embedding_failure(self, tmp_path):
+        """Test that the lexical search still answers when embedding fails"""
+
+        class BrokenEmbeddings:
+            async def aembed_query(self, text):
+                raise ConnectionError("ollama down")
+
+        texts = TestLexicalIndex.TEXTS
+        index = VectorIndex(str(tmp_path), dim=16)
+        index.add(random_vectors(3), [{"text": text} for text in texts])
+        node = create_retriever_node(index, BrokenEmbeddings())
+
+        update = await node({"messages": [HumanMessage(content="ERR-1042")]})
+
+        assert [hit["id"] for hit in update["retrieved"]] == [0]
+
+
+class TestRetrievalPrefetch:
+    """Tests for retrieval overlapped with planning"""
+
+    @staticmethod
+    def slow_nodes(plan):
+        calls = {"retrieval": 0, "cancelled": 0}
+
+        async def retrieval(state):
+            calls["retrieval"] += 1
+            try:
+                await asyncio.sleep(0.2)
+            except asyncio.CancelledError:
+                calls["cancelled"] += 1
+                raise
+            return {"retrieved": [{"text": "doc"}]}
+
+        async def planner(state):
+            await asyncio.sleep(0.2)
+            return {"tasks": plan}
+
+        return calls, retrieval, planner
+
+    @pytest.mark.asyncio
+    async def test_retrieval_runs_during_planning(self):
+        """Test that the chat path gets the prefetched results without waiting again"""
+        calls, retrieval, planner = self.slow_nodes(["chat_agent"])
+        prefetcher = RetrievalPrefetcher(retrieval)
+        planner = prefetcher.starting(prefetcher.planner(planner))
+        state = {"messages": [HumanMessage(content="hi", id="m1")]}
+
+        start = time.perf_counter()
+        await planner(state)
+        update = await prefetcher.retrieve(state)
+
+        assert time.perf_counter() - start < 0.35
+        assert update == {"retrieved": [{"text": "doc"}]}
+        assert calls["retrieval"] == 1
+
+    @pytest.mark.asyncio
+    async def test_joke_plan_cancels_retrieval(self):
+        """Test that retrieval is cancelled when the plan skips the chat agent"""
+        calls, retrieval, planner = self.slow_nodes(["joke_agent"])
+        prefetcher = RetrievalPrefetcher(retrieval)
+        planner = prefetcher.starting(prefetcher.planner(planner))
+
+        await planner({"messages": [HumanMessage(content="a joke", id="m2")]})
+        await asyncio.sleep(0)
+
+        assert calls == {"retrieval": 1, "cancelled": 1}
+
+
+class TestReranker:
+    """Tests for the reranking stage between retrieval and the chat agent"""
+
+    HITS = [
+        {"id": 0, "text": "The billing service sends invoices every month " * 20},
+        {"id": 1, "text": "Restart the billing service after a deploy"},
+        {"id": 2, "text": "How to restart the chat agent"},
+        {"id": 3, "text": "Service restart checklist for billing"},
+    ]
+
+    def test_local_scorer_prefers_close_query_terms(self):
+        """Test that all query terms close together score highest"""
+        scores = TermProximityScorer().score(
+            "restart billing service", [hit["text"] for hit in self.HITS]
+        )
+        assert scores.index(max(scores)) == 1
+        assert scores[1] > scores[3] > scores[2]
+
+    @pytest.mark.asyncio
+    async def test_reranks_and_trims_to_token_budget(self):
+        """Test that the best chunks that fit the token budget are kept"""
+        rerank_stats.reset()
+        node = create_reranker_node(create_local_scorer(), top_k=2, token_budget=40)
+        state = {
+            "messages": [HumanMessage(content="How do I restart the billing service?")],
+            "retrieved": self.HITS,
+        }
+
+        update = await node(state)
+
+        assert [hit["id"] for hit in update["retrieved"]] == [1, 3]
+        assert rerank_stats["chunks_dropped"] == 2 and rerank_stats["tokens_saved"] > 0
+
+    @pytest.mark.asyncio
+    async def test_longer_kept_chunk_saves_no_tokens(self):
+        """Test that tokens_saved does not go negative"""
+        rerank_stats.reset()
+
+        async def prefer_long(query, texts):
+            return [len(text) for text in texts]
+
+        node = create_reranker_node(prefer_long, top_k=1, token_budget=10_000)
+        state = {
+            "messages": [HumanMessage(content="billing")],
+            "retrieved": [self.HITS[1], self.HITS[0]],
+        }
+
+        await node(state)
+
+        assert rerank_stats["tokens_saved"] == 0
+
+    def test_time_budget_defaults_per_scorer(self, monkeypatch):
+        """Test that the LLM scorer gets a budget it can finish in"""
+        monkeypatch.delenv("RAG_RERANK_TIME_BUDGET_MS", raising=False)
+        monkeypatch.setenv("RAG_RERANKER", "llm")
+        assert RagConfig().rerank_time_budget == 5.0
+        monkeypatch.setenv("RAG_RERANKER", "local")
+        assert RagConfig().rerank_time_budget == 0.15
+        monkeypatch.setenv("RAG_RERANK_TIME_BUDGET_MS", "800")
+        assert RagConfig().rerank_time_budget == 0.8
+
+    @pytest.mark.asyncio
+    async def test_slow_scorer_keeps_retrieval_order(self):
+        """Test that scoring over the time budget falls back to retrieval order"""
+
+        async def slow_score(query, texts):
+            await asyncio.sleep(1)
+            return [1.0] * len(texts)
+
+        rerank_stats.reset()
+        node = create_reranker_node(
+            slow_score, top_k=3, token_budget=1000, time_budget=0.05
+        )
+        state = {"messages": [HumanMessage(content="restart")], "retrieved": self.HITS}
+
+        start = time.perf_counter()
+        update = await node(state)
+
+        assert time.perf_counter() - start < 0.5
+        assert [hit["id"] for hit in update["retrieved"]] == [0, 1, 2]
+        assert rerank_stats["timeouts"] == 1
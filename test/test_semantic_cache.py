@@ -0,0 +1,141 @@
+"""
+Tests for the semantic response cache
+"""
+
+import zlib
+
+import numpy as np
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agents.semantic_cache import SemanticCache, with_semantic_cache
+
+
+class FakeOllamaEmbeddings:
+    """Stand-in for OllamaEmbeddings: hashed bag-of-words vectors"""
+
+    def __init__(self, dim=64):
+        self.dim = dim
+        self.calls = 0
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        vector = np.zeros(self.dim)
+        for word in text.split():
+            vector[zlib.crc32(word.encode()) % self.dim] += 1.0
+        return vector.tolist()
+
+
+def state(*messages, **fields):
+    return {"messages": [HumanMessage(content=m) for m in messages], **fields}
+
+
+def counting_worker(output):
+    calls = []
+
+    async def worker(state):
+        calls.append(state)
+        return {"results": [output]}
+
+    return worker, calls
+
+
+class TestSemanticCache:
+    """Tests for SemanticCache and the worker wrapper"""
+
+    @pytest.mark.asyncio
+    async def test_near_duplicate_is_served_from_cache(self):
+        """Test that a near-duplicate request reuses the stored output"""
+        cache = SemanticCache(FakeOllamaEmbeddings(), threshold=0.9)
+        worker, calls = counting_worker("Why did the cat...")
+        node = with_semantic_cache("joke_agent", worker, cache)
+
+        await node(state("Tell me a joke about cats"))
+        update = await node(state("tell me a joke about cats!"))
+
+        assert update == {"results": ["Why did the cat..."]}
+        assert len(calls) == 1
+        assert cache.snapshot()["hit_rate"] == 0.5
+
+    @pytest.mark.asyncio
+    async def test_different_request_misses(self):
+        """Test that an unrelated request is generated"""
+        cache = SemanticCache(FakeOllamaEmbeddings(), threshold=0.9)
+        worker, calls = counting_worker("joke")
+        node = with_semantic_cache("joke_agent", worker, cache)
+
+        await node(state("joke about cats"))
+        await node(state("pun on quantum physics"))
+
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_chat_with_history_is_not_cached(self):
+        """Test that history-dependent chat turns bypass the cache"""
+        embeddings = FakeOllamaEmbeddings()
+        cache = SemanticCache(embeddings)
+        worker, calls = counting_worker("Your name is Bob")
+        node = with_semantic_cache("chat_agent", worker, cache)
+
+        await node(state("I am Bob", "what is my name"))
+        await node(state("I am Bob", "what is my name"))
+
+        assert len(calls) == 2
+        assert embeddings.calls == 0
+        assert cache.snapshot()["skipped"] == 2
+
+    @pytest.mark.asyncio
+    async def test_first_chat_turn_is_not_shared_between_users(self):
+        """Test that one user's first chat answer is never served to another"""
+        worker, calls = counting_worker("Hi Alice!")
+        cache = SemanticCache(FakeOllamaEmbeddings())
+        node = with_semantic_cache("chat_agent", worker, cache)
+
+        await node(state("hi", user_id="user:alice"))
+        await node(state("hi", user_id="user:bob"))
+        await node(state("hi", user_id="user:alice"))
+
+        assert len(calls) == 2
+        assert cache.snapshot()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_chat_with_memories_or_documents_is_not_cached(self):
+        """Test that answers built from recalled memories or documents bypass the cache"""
+        worker, calls = counting_worker("You live in Lisbon")
+        cache = SemanticCache(FakeOllamaEmbeddings())
+        node = with_semantic_cache("chat_agent", worker, cache)
+
+        await node(state("where do I live", memories=["I live in Lisbon"]))
+        await node(state("where do I live", retrieved=[{"text": "Lisbon"}]))
+
+        assert len(calls) == 2
+        assert cache.snapshot()["skipped"] == 2
+
+    @pytest.mark.asyncio
+    async def test_size_bounded_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = SemanticCache(FakeOllamaEmbeddings(), threshold=0.99, max_entries=2)
+        worker, calls = counting_worker("x")
+        node = with_semantic_cache("joke_agent", worker, cache)
+
+        for message in ["alpha", "beta", "gamma", "alpha"]:
+            await node(state(message))
+
+        assert cache.snapshot()["evictions"] == 2
+        assert cache.snapshot()["size"] == 2
+        assert len(calls) == 4
+
+    @pytest.mark.asyncio
+    async def test_embedding_error_falls_back_to_worker(self):
+        """Test that an embedding failure does not fail the worker"""
+
+        class BrokenEmbeddings:
+            async def aembed_query(self, text):
+                raise ConnectionError("ollama down")
+
+        cache = SemanticCache(BrokenEmbeddings())
+        worker, calls = counting_worker("joke")
+        node = with_semantic_cache("joke_agent", worker, cache)
+
+        assert await node(state("joke")) == {"results": ["joke"]}
+        assert cache.snapshot()["errors"] == 1
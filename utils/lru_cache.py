@@ -0,0 +1,128 @@
+"""
+Bounded LRU cache with per-entry TTL, hit/miss metrics and optional
+persistence to a JSON file
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from utils import metrics
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    Values must be JSON-serializable when `path` is set, so the cache can be
+    saved to disk and reloaded after a restart. Writes only mark the cache as
+    changed; `save_periodically` persists it in the background.
+    """
+
+    def __init__(
+        self, max_size: int = 1024, ttl: float = 3600, path: Optional[str] = None
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = False
+        self.stats = metrics.Counters("hits", "misses", "expired", "evictions")
+
+        if path:
+            self.load()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.incr("misses")
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.stats.incr("expired")
+                self.stats.incr("misses")
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.incr("hits")
+            return value
+
+    def put(self, key: str, value: Any):
+        """Stores a value, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            self._changed = True
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.incr("evictions")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        """Loads the non-expired entries saved at `path`"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not load cache from {self.path}: {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, value, expires_at in saved[-self.max_size :]:
+                if expires_at > now:
+                    self._entries[key] = (value, expires_at)
+
+    def save(self):
+        """Atomically writes the entries to `path`, in LRU order"""
+        if not self.path:
+            return
+        with self._lock:
+            entries = [[key, value, exp] for key, (value, exp) in self._entries.items()]
+            self._changed = False
+
+        # A temporary file of its own, so concurrent saves cannot interleave
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f"{os.path.basename(self.path)}.",
+                suffix=".tmp",
+                dir=os.path.dirname(os.path.abspath(self.path)),
+            )
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self._changed = True
+            print(f"⚠️ Could not save cache to {self.path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def save_periodically(self, interval: float):
+        """Saves the cache every `interval` seconds while it has changed"""
+        while True:
+            await asyncio.sleep(interval)
+            if self._changed:
+                await asyncio.to_thread(self.save)
+
+    def snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        snapshot["size"] = len(self)
+        snapshot["hit_rate"] = metrics.ratio(
+            snapshot["hits"], snapshot["hits"] + snapshot["misses"]
+        )
+        return snapshot
@@ -0,0 +1,59 @@
+"""
+Lightweight in-process metrics for the agent graph and services
+"""
+
+import threading
+from typing import Callable, Dict
+
+_registry: Dict[str, Callable[[], dict]] = {}
+_registry_lock = threading.Lock()
+
+
+class Counters:
+    """Thread-safe group of named integer counters"""
+
+    def __init__(self, *names: str):
+        self._lock = threading.Lock()
+        self._values: Dict[str, int] = dict.fromkeys(names, 0)
+
+    def incr(self, name: str, amount: int = 1):
+        """Increments the counter `name` by `amount`"""
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def __getitem__(self, name: str) -> int:
+        return self._values.get(name, 0)
+
+    def reset(self):
+        """Sets every counter back to zero"""
+        with self._lock:
+            self._values = dict.fromkeys(self._values, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Returns a copy of the current counter values"""
+        with self._lock:
+            return dict(self._values)
+
+
+def ratio(numerator: float, denominator: float) -> float:
+    """Returns numerator / denominator, or 0.0 when there is nothing to divide"""
+    return numerator / denominator if denominator else 0.0
+
+
+def register(name: str, collector: Callable[[], dict]):
+    """
+    Registers a metrics collector
+
+    Args:
+        name: Section name under which the metrics are reported
+        collector: Callable returning a JSON-serializable dict
+    """
+    with _registry_lock:
+        _registry[name] = collector
+
+
+def collect_all() -> Dict[str, dict]:
+    """Returns the current snapshot of every registered collector"""
+    with _registry_lock:
+        collectors = dict(_registry)
+    return {name: collector() for name, collector in collectors.items()}
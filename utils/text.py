@@ -0,0 +1,17 @@
+"""
+Text helpers shared by the agents and caches
+"""
+
+import re
+import unicodedata
+
+
+def normalize_message(message: str) -> str:
+    """Normalizes a message for cache lookups (case, punctuation, whitespace)"""
+    message = re.sub(r"[^\w\s]", " ", message.lower())
+    return " ".join(message.split())
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes text for content hashing (Unicode form and whitespace, case kept)"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
@@ -0,0 +1,49 @@
+"""
+Approximate token counting for the configured Ollama model
+"""
+
+import math
+from typing import Iterable
+
+from langchain_core.messages import BaseMessage
+
+# Average characters per token for common model families (English text)
+CHARS_PER_TOKEN = {
+    "llama": 3.8,
+    "mistral": 3.6,
+    "qwen": 3.4,
+    "gemma": 3.8,
+    "phi": 3.6,
+}
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+# Tokens added by the chat template around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """
+    Estimates token counts from character counts.
+
+    Ollama does not expose its tokenizer, so the ratio is a per family
+    default (or `chars_per_token`). Ollama's `prompt_eval_count` cannot
+    refine it: it leaves out the prompt tokens served from its cache.
+    """
+
+    def __init__(self, model_name: str, chars_per_token: float = None):
+        self.model_name = model_name
+        if chars_per_token is None:
+            family = next(
+                (name for name in CHARS_PER_TOKEN if name in model_name.lower()), None
+            )
+            chars_per_token = CHARS_PER_TOKEN.get(family, DEFAULT_CHARS_PER_TOKEN)
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def count_message(self, message: BaseMessage) -> int:
+        return self.count(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+
+    def count_messages(self, messages: Iterable[BaseMessage]) -> int:
+        return sum(self.count_message(message) for message in messages)